@@ -87,6 +87,14 @@ git cat-file blob master:server/store_data.py >wsgi-scripts/store_data.wsgi
 git add wsgi-scripts
 git add wsgi-scripts/store_data.wsgi
 
+# Helper modules that are imported by the WSGI script. Modules of offline
+# tools, e.g. record_export.py and record_statistics.py, are not installed.
+runtime_modules="batch_parser circuit_breaker commit_lock error_journal field_schema form_parser group_commit metrics push_journal push_scheduler record_index record_rules request_log spool storage_backend submission_cache"
+for module in ${runtime_modules}; do
+  git cat-file blob "master:server/${module}.py" >"wsgi-scripts/${module}.py"
+  git add "wsgi-scripts/${module}.py"
+done
+
 mkdir -p "${destination_root}/templates"
 git cat-file blob master:templates/success.html.jinja2 >"${destination_root}/templates/success.html.jinja2"
 git add "${destination_root}/templates"
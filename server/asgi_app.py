@@ -0,0 +1,303 @@
+"""ASGI entry point of the data-entry application
+
+Requests are validated by the same code as in store_data.application.
+Records are committed with datalad and git subprocesses that are started
+with asyncio, so a waiting submission does not occupy a thread. Spooled,
+batched, and datalad-api commits are performed in a worker thread.
+
+The configuration is read from environment variables: the configuration
+key "de.inm7.sfb1451.entry.<name>" is set by SFB1451_ENTRY_<NAME>, e.g.
+SFB1451_ENTRY_DATASET_ROOT. The number of concurrently running commit
+subprocesses is limited by SFB1451_ENTRY_MAX_COMMITS (default: 4). With
+SFB1451_ENTRY_WARMUP=yes, the server warms up on lifespan startup.
+
+    uvicorn --app-dir server asgi_app:application
+"""
+import asyncio
+import subprocess
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+from traceback import format_exception
+from typing import Dict, List, Optional
+
+import store_data
+from batch_parser import BatchError, receive_batch
+from circuit_breaker import CircuitBreaker
+from commit_lock import get_commit_lock
+from form_parser import FormError, FormParser, receive_form
+from metrics import request_timing, timed
+from push_journal import PushJournal, get_push_journal
+from push_scheduler import get_push_scheduler
+from storage_backend import SubprocessBackend, get_storage_backend
+
+
+MAX_COMMITS_KEY = "de.inm7.sfb1451.entry.max_commits"
+
+
+async def run_command(command: List[str],
+                      environment: Optional[Dict[str, str]] = None,
+                      capture_output: bool = False
+                      ) -> bytes:
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=subprocess.PIPE if capture_output else None,
+        env=environment)
+    output, _ = await process.communicate()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, output)
+    return output or b""
+
+
+@asynccontextmanager
+async def locked_dataset(dataset_root: Path):
+    """Hold the commit lock that is shared with other server processes
+
+    The lock is acquired in a worker thread. If the waiting task is
+    cancelled, the lock is released as soon as the thread acquired it.
+    """
+    commit_lock = get_commit_lock(dataset_root)
+    acquisition = asyncio.ensure_future(asyncio.to_thread(commit_lock.acquire))
+    try:
+        with timed("commit-lock-wait"):
+            await asyncio.shield(acquisition)
+    except asyncio.CancelledError:
+        acquisition.add_done_callback(
+            lambda future: future.cancelled() or future.exception() or commit_lock.release())
+        raise
+    try:
+        yield
+    finally:
+        commit_lock.release()
+
+
+class AsyncCommitter:
+    """Commit files like store_data.add_files_to_dataset, without blocking
+
+    At most max_commits datalad or git subprocesses run at the same time.
+    Saves into the same dataset are serialized, because they use the same
+    git index, within the process by an asyncio lock and across processes
+    by the commit lock.
+    """
+    def __init__(self, max_commits: int):
+        self.semaphore = asyncio.Semaphore(max_commits)
+        self.dataset_locks: Dict[Path, asyncio.Lock] = dict()
+
+    async def commit(self,
+                     dataset_root: Path,
+                     files: List[Path],
+                     home: Path,
+                     deferred_push: bool = False,
+                     push_journal: Optional[PushJournal] = None,
+                     circuit_breaker: Optional[CircuitBreaker] = None
+                     ) -> str:
+
+        environment = SubprocessBackend.environment(home)
+        dataset_lock = self.dataset_locks.setdefault(dataset_root, asyncio.Lock())
+        async with dataset_lock, locked_dataset(dataset_root), self.semaphore:
+            with timed("save"):
+                await run_command(
+                    SubprocessBackend.save_command(
+                        dataset_root,
+                        files,
+                        store_data.get_commit_message(dataset_root, files)),
+                    environment)
+            with timed("rev-parse"):
+                commit_hash = (await run_command(
+                    SubprocessBackend.head_command(dataset_root),
+                    environment,
+                    capture_output=True)).decode().strip()
+
+        if push_journal is not None:
+            push_journal.append(
+                commit_hash,
+                [str(file.relative_to(dataset_root)) for file in files])
+            return commit_hash
+
+        def push_in_background():
+            get_push_scheduler(
+                dataset_root, home,
+                get_storage_backend("subprocess"),
+                circuit_breaker).notify(commit_hash)
+
+        if deferred_push or (circuit_breaker is not None and circuit_breaker.is_open()):
+            push_in_background()
+            return commit_hash
+        try:
+            async with self.semaphore:
+                with timed("push"):
+                    await run_command(
+                        SubprocessBackend.push_command(dataset_root),
+                        environment)
+        except Exception:
+            if circuit_breaker is None:
+                raise
+            # The record is safe in the local commit, retry in the background
+            error = "".join(format_exception(*sys.exc_info()))
+            print(
+                f"push of {dataset_root} failed, commit {commit_hash} is pushed "
+                f"in the background:\n{error}",
+                file=sys.stderr)
+            circuit_breaker.record_failure(error)
+            push_in_background()
+            return commit_hash
+        if circuit_breaker is not None:
+            circuit_breaker.record_success()
+        return commit_hash
+
+
+def create_environ(configuration: Dict[str, str], scope: dict) -> dict:
+    """Describe the request in the form that the shared WSGI code expects"""
+    headers = {
+        name.decode("latin-1").lower(): value.decode("latin-1")
+        for name, value in scope.get("headers", [])
+    }
+    client = scope.get("client")
+    environ = {
+        **configuration,
+        "REQUEST_METHOD": scope["method"],
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "REMOTE_ADDR": client[0] if client else "",
+    }
+    for name, value in headers.items():
+        if name == "content-length":
+            environ["CONTENT_LENGTH"] = value
+        elif name == "content-type":
+            environ["CONTENT_TYPE"] = value
+        else:
+            environ["HTTP_" + name.upper().replace("-", "_")] = value
+    return environ
+
+
+def uses_async_commit(environ) -> bool:
+    """Spooled, batched, and datalad-api commits run in a worker thread"""
+    if environ.get(store_data.SPOOL_DIRECTORY_KEY):
+        return False
+    if float(environ.get(store_data.BATCH_WINDOW_KEY, 0)) > 0:
+        return False
+    if int(environ.get(store_data.BATCH_SIZE_KEY, 1)) > 1:
+        return False
+    return environ.get(store_data.STORAGE_BACKEND_KEY, "subprocess") == "subprocess"
+
+
+async def protected_application(environ,
+                                form_parser: FormParser,
+                                receive,
+                                committer: AsyncCommitter):
+
+    result = store_data.route_request(environ)
+    if result is not None:
+        return result
+
+    content_length = environ.get("CONTENT_LENGTH")
+    if store_data.is_batch_request(environ):
+        try:
+            with timed("parse"):
+                body = await receive_batch(
+                    receive,
+                    int(content_length) if content_length else None,
+                    store_data.batch_body_size_limit)
+        except (BatchError, ValueError) as batch_error:
+            return store_data.create_bad_request_result([f"{batch_error}\n"])
+        # Batches are committed in a worker thread
+        return await asyncio.to_thread(store_data.store_batch, environ, body)
+
+    try:
+        with timed("parse"):
+            received_data = await receive_form(
+                receive,
+                int(content_length) if content_length else None,
+                form_parser)
+    except (FormError, ValueError) as form_error:
+        return store_data.create_bad_request_result([f"{form_error}\n"])
+    store_data.log_request(environ, {"fields": {name: values[0] for name, values in received_data.items()}})
+
+    submission = store_data.prepare_submission(environ, received_data)
+    if not isinstance(submission, store_data.Submission):
+        return submission
+
+    try:
+        if uses_async_commit(environ):
+            files = store_data.write_record_files(
+                submission.dataset_root,
+                submission.output_file,
+                submission.result_object,
+                submission.signature)
+            commit_hash = await committer.commit(
+                submission.dataset_root,
+                files,
+                submission.home,
+                store_data.is_enabled(environ, store_data.DEFERRED_PUSH_KEY),
+                (
+                    get_push_journal(Path(environ[store_data.PUSH_JOURNAL_KEY]))
+                    if environ.get(store_data.PUSH_JOURNAL_KEY)
+                    else None
+                ),
+                store_data.get_push_circuit_breaker(environ, submission.dataset_root))
+            spool_reference = None
+        else:
+            commit_hash, spool_reference = await asyncio.to_thread(
+                store_data.store_record,
+                environ,
+                submission.dataset_root,
+                submission.home,
+                submission.output_file,
+                submission.result_object,
+                submission.signature)
+    except:
+        submission.discard()
+        raise
+
+    return store_data.create_submission_result(environ, submission, commit_hash, spool_reference)
+
+
+def create_application(configuration: Dict[str, str]):
+    committer = AsyncCommitter(int(configuration.get(MAX_COMMITS_KEY, 4)))
+
+    async def application(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    if store_data.is_enabled(configuration, store_data.WARMUP_KEY):
+                        try:
+                            await asyncio.to_thread(store_data.warm_up, configuration)
+                        except Exception as exception:
+                            await send({"type": "lifespan.startup.failed", "message": str(exception)})
+                            return
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await asyncio.to_thread(store_data.stop_background_workers)
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        if scope["type"] != "http":
+            return
+
+        environ = create_environ(configuration, scope)
+        form_parser = store_data.create_form_parser()
+        try:
+            with request_timing() as timing, timed("request"):
+                status, content_type, content = await protected_application(
+                    environ, form_parser, receive, committer)
+        except Exception:
+            status, content_type, content = store_data.create_internal_error_result(environ, form_parser)
+
+        store_data.record_response(environ, status, timing)
+
+        body = b"".join(content)
+        await send({
+            "type": "http.response.start",
+            "status": int(status.split(" ", 1)[0]),
+            "headers": [
+                (b"content-type", content_type.encode("latin-1")),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    return application
+
+
+application = create_application(store_data.configuration_from_environment())
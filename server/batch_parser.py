@@ -0,0 +1,106 @@
+import json
+from typing import Dict, List, Optional
+
+from form_parser import FormError, FormParser
+
+
+class BatchError(ValueError):
+    """The posted batch is malformed or too large"""
+
+
+def check_batch_size(size: int, body_size_limit: int):
+    if size > body_size_limit:
+        raise BatchError(
+            f"batch too large: {size} bytes, limit is {body_size_limit} bytes")
+
+
+def read_batch(stream,
+               content_length: int,
+               body_size_limit: int,
+               chunk_size: int = 64 * 1024
+               ) -> bytes:
+    """Read the body of a batch request from stream"""
+    check_batch_size(content_length, body_size_limit)
+    body = bytearray()
+    while len(body) < content_length:
+        chunk: Optional[bytes] = stream.read(min(chunk_size, content_length - len(body)))
+        if not chunk:
+            break
+        body.extend(chunk)
+    return bytes(body)
+
+
+async def receive_batch(receive,
+                        content_length: Optional[int],
+                        body_size_limit: int
+                        ) -> bytes:
+    """Receive the body of a batch request from an ASGI server"""
+    if content_length is not None:
+        check_batch_size(content_length, body_size_limit)
+    body = bytearray()
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise BatchError("client disconnected")
+        body.extend(message.get("body", b""))
+        check_batch_size(len(body), body_size_limit)
+        more_body = message.get("more_body", False)
+    return bytes(body)
+
+
+def parse_batch(body: bytes, record_limit: int) -> List[object]:
+    """Parse a JSON array, or newline-delimited JSON, of records
+
+    The body is a JSON array if its first non-whitespace character is
+    "[". Otherwise every non-empty line is a record.
+    """
+    try:
+        text = body.decode("utf-8")
+    except UnicodeError:
+        raise BatchError("batch is not UTF-8 encoded")
+
+    if text.lstrip().startswith("["):
+        try:
+            records = json.loads(text)
+        except ValueError as value_error:
+            raise BatchError(f"batch is not a valid JSON array: {value_error}")
+    else:
+        records = []
+        for line_number, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError as value_error:
+                raise BatchError(f"line {line_number} is not valid JSON: {value_error}")
+
+    if not records:
+        raise BatchError("batch contains no records")
+    if len(records) > record_limit:
+        raise BatchError(
+            f"batch contains {len(records)} records, limit is {record_limit}")
+    return records
+
+
+def get_record_fields(record: object, form_parser: FormParser) -> Dict[str, List[str]]:
+    """Convert a batch record into the fields of a posted form
+
+    A record is an object that maps field names to string values. The
+    known fields and size limits of form_parser apply, and, as in posted
+    forms, empty values are ignored.
+    """
+    if not isinstance(record, dict):
+        raise FormError("record is not a JSON object")
+    fields = dict()
+    for name, value in record.items():
+        if name not in form_parser.known_fields:
+            raise FormError(f"unknown form field: {name[:80]}")
+        if not isinstance(value, str):
+            raise FormError(f"form field is not a string: {name}")
+        size_limit = form_parser.field_size_limits.get(name, form_parser.default_field_size_limit)
+        if len(value.encode("utf-8")) > size_limit:
+            raise FormError(f"form field too large: {name}")
+        if value:
+            fields[name] = [value]
+    return fields
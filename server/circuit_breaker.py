@@ -0,0 +1,70 @@
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class CircuitBreaker:
+    """Skip pushes to entrystore while it is unreachable
+
+    The breaker opens after `failure_threshold` consecutive push failures.
+    While it is open, requests do not push. Their commits are pushed by
+    the push scheduler, whose retries probe entrystore at least every
+    `probe_interval` seconds. The first successful push closes the
+    breaker again.
+    """
+    def __init__(self, dataset_root: Path, failure_threshold: int, probe_interval: float):
+        self.dataset_root = dataset_root
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.trips = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def is_open(self) -> bool:
+        with self.lock:
+            return self.opened_at is not None
+
+    def record_failure(self, error: str):
+        with self.lock:
+            self.failures += 1
+            self.last_error = error
+            if self.opened_at is None and self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+                self.trips += 1
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.last_error = None
+            self.opened_at = None
+
+    def state(self) -> str:
+        return "open" if self.is_open() else "closed"
+
+
+_breakers: Dict[Path, CircuitBreaker] = dict()
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(dataset_root: Path,
+                        failure_threshold: int,
+                        probe_interval: float
+                        ) -> CircuitBreaker:
+    """Get the process-wide push circuit breaker for the dataset"""
+    with _breakers_lock:
+        breaker = _breakers.get(dataset_root)
+        if breaker is None:
+            breaker = CircuitBreaker(dataset_root, failure_threshold, probe_interval)
+            _breakers[dataset_root] = breaker
+        else:
+            breaker.failure_threshold = failure_threshold
+            breaker.probe_interval = probe_interval
+        return breaker
+
+
+def get_circuit_breakers() -> List[CircuitBreaker]:
+    with _breakers_lock:
+        return list(_breakers.values())
@@ -0,0 +1,93 @@
+import fcntl
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, TextIO
+
+
+# Name of the lock file in the git directory of the dataset
+lock_file_name = "sfb1451-entry-commit-lock"
+
+
+class CommitLock:
+    """Serialize commits to a dataset across threads and processes
+
+    Threads of a process acquire the lock in the order in which they
+    requested it. The first waiting thread of a process then waits for an
+    exclusive lock on a file in the git directory of the dataset, which
+    serializes all processes that commit to the dataset, e.g. several
+    mod_wsgi daemon processes. Because a process takes part in the file
+    lock with at most one thread, the processes take turns instead of
+    competing with all their threads.
+    """
+    def __init__(self, dataset_root: Path):
+        self.dataset_root = dataset_root
+        self.path = dataset_root / ".git" / lock_file_name
+        self.condition = threading.Condition()
+        self.waiting: Deque[object] = deque()
+        self.locked = False
+        self.lock_file: Optional[TextIO] = None
+
+    def waiting_count(self) -> int:
+        with self.condition:
+            return len(self.waiting)
+
+    def acquire(self):
+        ticket = object()
+        with self.condition:
+            self.waiting.append(ticket)
+            while self.locked or self.waiting[0] is not ticket:
+                self.condition.wait()
+            self.waiting.popleft()
+            self.locked = True
+
+        try:
+            lock_file = self.path.open("a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            except:
+                lock_file.close()
+                raise
+        except:
+            self._release_threads()
+            raise
+        self.lock_file = lock_file
+
+    def release(self):
+        lock_file, self.lock_file = self.lock_file, None
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+        finally:
+            self._release_threads()
+
+    def _release_threads(self):
+        with self.condition:
+            self.locked = False
+            self.condition.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+_locks: Dict[Path, CommitLock] = dict()
+_locks_lock = threading.Lock()
+
+
+def get_commit_lock(dataset_root: Path) -> CommitLock:
+    """Get the process-wide commit lock for the dataset"""
+    with _locks_lock:
+        lock = _locks.get(dataset_root)
+        if lock is None:
+            lock = CommitLock(dataset_root)
+            _locks[dataset_root] = lock
+        return lock
+
+
+def get_commit_locks() -> List[CommitLock]:
+    with _locks_lock:
+        return list(_locks.values())
@@ -0,0 +1,159 @@
+import fcntl
+import json
+import locale
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from traceback import format_exception
+from typing import Dict, Iterator, List, Optional
+
+
+# Values of environ and of form fields are truncated to this many
+# characters, e.g. signature data
+value_size_limit = 2048
+
+
+def new_error_id() -> str:
+    return time.strftime("%Y%m%d-%H%M%S-", time.gmtime()) + uuid.uuid4().hex[:8]
+
+
+def _truncated(value: str) -> str:
+    if len(value) <= value_size_limit:
+        return value
+    return value[:value_size_limit] + f"... ({len(value)} characters)"
+
+
+def create_error_entry(error_id: str,
+                       exc_info,
+                       environ: dict,
+                       fields: Dict[str, List[str]]
+                       ) -> dict:
+    """Describe an exception and the request in which it occurred"""
+    return {
+        "id": error_id,
+        "time": time.time(),
+        "exception": "".join(format_exception(*exc_info)),
+        "locale_encoding": locale.getencoding(),
+        # Only plain values, wsgi.input and other objects are left out
+        "environ": {
+            key: _truncated(value)
+            for key, value in environ.items()
+            if isinstance(value, str)
+        },
+        "fields": {
+            name: [_truncated(value) for value in values]
+            for name, values in fields.items()
+        },
+    }
+
+
+class ErrorJournal:
+    """Size-limited journal of errors, one JSON object per line
+
+    If the journal grows larger than max_bytes, it is renamed to
+    "<path>.1", older journals are renamed to "<path>.2", etc., and the
+    oldest, "<path>.<backup_count>", is removed. All access is serialized
+    with a lock on a separate file, so that several server processes can
+    write the journal.
+    """
+    def __init__(self, path: Path, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        lock_path = self.path.with_name(self.path.name + ".lock")
+        with self.lock, lock_path.open("a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def backup_path(self, number: int) -> Path:
+        return self.path.with_name(f"{self.path.name}.{number}")
+
+    def _rotate(self):
+        self.backup_path(self.backup_count).unlink(missing_ok=True)
+        for number in range(self.backup_count - 1, 0, -1):
+            if self.backup_path(number).exists():
+                os.replace(self.backup_path(number), self.backup_path(number + 1))
+        if self.backup_count > 0:
+            os.replace(self.path, self.backup_path(1))
+        else:
+            self.path.unlink()
+
+    def append(self, entry: dict):
+        line = json.dumps(entry) + "\n"
+        with self._locked():
+            if self.path.exists() and self.path.stat().st_size + len(line) > self.max_bytes:
+                self._rotate()
+            with self.path.open("a") as f:
+                f.write(line)
+
+    def entries(self) -> Iterator[dict]:
+        """All entries, newest journal file first"""
+        return self._read_entries(
+            [self.path, *map(self.backup_path, range(1, self.backup_count + 1))])
+
+    def _read_entries(self, paths: List[Path]) -> Iterator[dict]:
+        for path in paths:
+            with self._locked():
+                # The journal might be rotated between two files
+                try:
+                    with path.open() as f:
+                        lines = f.readlines()
+                except FileNotFoundError:
+                    continue
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+
+    def find(self, error_id: str) -> Optional[dict]:
+        for entry in self.entries():
+            if entry["id"] == error_id:
+                return entry
+        return None
+
+
+_journals: Dict[Path, ErrorJournal] = dict()
+_journals_lock = threading.Lock()
+
+
+def get_error_journal(path: Path, max_bytes: int = 10 * 1024 * 1024) -> ErrorJournal:
+    """Get the process-wide journal object for path"""
+    with _journals_lock:
+        journal = _journals.get(path)
+        if journal is None:
+            journal = ErrorJournal(path, max_bytes)
+            _journals[path] = journal
+        else:
+            journal.max_bytes = max_bytes
+        return journal
+
+
+def report_error(journal: Optional[ErrorJournal],
+                 environ: dict,
+                 fields: Dict[str, List[str]]
+                 ) -> str:
+    """Record the exception that is currently handled, return its error ID
+
+    Without a journal, or if the journal cannot be written, the entry is
+    written to stderr, i.e. the error log of the web server.
+    """
+    error_id = new_error_id()
+    entry = create_error_entry(error_id, sys.exc_info(), environ, fields)
+    if journal is not None:
+        try:
+            journal.append(entry)
+            return error_id
+        except OSError as os_error:
+            print(f"error journal {journal.path} not writable: {os_error}", file=sys.stderr)
+    print(json.dumps(entry), file=sys.stderr)
+    return error_id
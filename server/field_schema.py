@@ -0,0 +1,157 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class FieldDescriptor:
+    """Everything the server has to know about one input field"""
+
+    __slots__ = (
+        "name",
+        "default",
+        "required",
+        "patient_required",
+        "valid_key",
+        "value_fetcher",
+        "hash_processor",
+        "hash_position",
+    )
+
+    def __init__(self, name: str):
+        self.name = name
+        # Value list that is used if the field is not posted
+        self.default: Optional[List[str]] = None
+        self.required = False
+        self.patient_required = False
+        # Checkbox fields are reset to [""] if this key is not posted
+        self.valid_key: Optional[str] = None
+        self.value_fetcher: Optional[Callable[[str], object]] = None
+        self.hash_processor: Optional[Callable[[str, List[str]], str]] = None
+        self.hash_position = -1
+
+
+class SchemaResult:
+    __slots__ = ("record", "missing_keys", "_hash_parts", "_hash_error")
+
+    def __init__(self,
+                 record: Dict[str, object],
+                 missing_keys: List[str],
+                 hash_parts: List[Optional[str]],
+                 hash_error: Optional[BaseException]):
+        self.record = record
+        self.missing_keys = missing_keys
+        self._hash_parts = hash_parts
+        self._hash_error = hash_error
+
+    @property
+    def hash_string(self) -> str:
+        """The canonic content string over which the hash value is computed"""
+        if self._hash_error is not None:
+            raise self._hash_error
+        return ";".join(self._hash_parts)
+
+
+class FieldSchema:
+    """Field descriptors in processing order
+
+    Required fields come first, in the order of the required-field list,
+    followed by patient fields and the remaining hashed fields. This keeps
+    the order of keys in the resulting record identical to the order that
+    the individual field lists define.
+    """
+    def __init__(self, descriptors: List[FieldDescriptor], hash_length: int):
+        self.descriptors = tuple(descriptors)
+        self.by_name = {descriptor.name: descriptor for descriptor in descriptors}
+        self.hash_length = hash_length
+
+    def process(self,
+                received_data: Dict[str, List[str]],
+                patient_group: str = "patient"
+                ) -> SchemaResult:
+        """Read, type-convert, and hash the posted fields in a single pass"""
+
+        record = dict()
+        patient_record = dict()
+        missing_keys = []
+        missing_patient_keys = []
+        hash_parts: List[Optional[str]] = [None] * self.hash_length
+        hash_error = None
+
+        get_content = received_data.get
+        for descriptor in self.descriptors:
+            name = descriptor.name
+            valid_key = descriptor.valid_key
+            if valid_key is not None and valid_key not in received_data:
+                field_content = [""]
+            else:
+                field_content = get_content(name, descriptor.default)
+
+            if field_content is None:
+                if descriptor.required:
+                    missing_keys.append(name)
+                elif descriptor.patient_required:
+                    missing_patient_keys.append(name)
+                if descriptor.hash_position >= 0 and hash_error is None:
+                    hash_error = KeyError(name)
+                continue
+
+            if descriptor.required or descriptor.patient_required:
+                value = field_content[0]
+                if descriptor.value_fetcher is not None:
+                    value = descriptor.value_fetcher(value)
+                if descriptor.required:
+                    record[name] = value
+                else:
+                    patient_record[name] = value
+
+            if descriptor.hash_position >= 0 and hash_error is None:
+                try:
+                    hash_parts[descriptor.hash_position] = (
+                        f"{name}:{descriptor.hash_processor(name, field_content)}")
+                except Exception as exception:
+                    hash_error = exception
+
+        if not missing_keys and record.get("subject-group") == patient_group:
+            record.update(patient_record)
+            missing_keys = missing_patient_keys
+
+        return SchemaResult(record, missing_keys, hash_parts, hash_error)
+
+
+def compile_schema(required_fields: List[str],
+                   required_patient_fields: List[str],
+                   auto_fields: Dict[str, List[str]],
+                   optional_checkbox_fields: List[str],
+                   hashed_content_fields: List[Tuple[str, Callable]],
+                   field_value_fetcher: Dict[str, Callable]
+                   ) -> FieldSchema:
+
+    descriptors: Dict[str, FieldDescriptor] = dict()
+
+    def descriptor_for(name: str) -> FieldDescriptor:
+        if name not in descriptors:
+            descriptors[name] = FieldDescriptor(name)
+        return descriptors[name]
+
+    for name in required_fields:
+        descriptor_for(name).required = True
+    for name in required_patient_fields:
+        descriptor_for(name).patient_required = True
+    for name, default in auto_fields.items():
+        descriptor_for(name).default = default
+    for name in optional_checkbox_fields:
+        descriptor_for(name).valid_key = name + "-valid"
+    for position, (name, processor) in enumerate(hashed_content_fields):
+        descriptor = descriptor_for(name)
+        descriptor.hash_processor = processor
+        descriptor.hash_position = position
+    for name, fetcher in field_value_fetcher.items():
+        if name in descriptors:
+            descriptors[name].value_fetcher = fetcher
+
+    # Fields that are neither read nor hashed do not need processing
+    return FieldSchema(
+        [
+            descriptor
+            for descriptor in descriptors.values()
+            if descriptor.required or descriptor.patient_required or descriptor.hash_position >= 0
+        ],
+        len(hashed_content_fields))
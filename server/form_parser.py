@@ -0,0 +1,129 @@
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import unquote_plus
+
+
+class FormError(ValueError):
+    """The posted form data is malformed, too large, or contains unknown fields"""
+
+
+class FormParser:
+    """Incremental parser for application/x-www-form-urlencoded data
+
+    Data is fed in chunks. Every complete name-value pair is decoded and
+    checked as soon as its terminating "&" arrives, so that unknown
+    fields, duplicated fields, and oversized fields raise a FormError
+    before the remainder of the body is read.
+
+    The result is compatible with urllib.parse.parse_qs: pairs without
+    "=" and pairs with an empty value are ignored, and every value is
+    returned as a list of length one.
+    """
+    def __init__(self,
+                 known_fields: Iterable[str],
+                 field_size_limits: Dict[str, int],
+                 default_field_size_limit: int,
+                 total_size_limit: int):
+        self.known_fields = frozenset(known_fields)
+        self.field_size_limits = field_size_limits
+        self.default_field_size_limit = default_field_size_limit
+        self.maximum_field_size_limit = max(
+            [default_field_size_limit, *field_size_limits.values()])
+        self.total_size_limit = total_size_limit
+        self.fields: Dict[str, List[str]] = dict()
+        self.received_size = 0
+        self.buffer = bytearray()
+
+    def check_content_length(self, content_length: int):
+        if content_length > self.total_size_limit:
+            raise FormError(
+                f"request body too large: {content_length} bytes, "
+                f"limit is {self.total_size_limit} bytes")
+
+    def _field_size_limit(self, encoded_name: bytes) -> int:
+        name = self._decode(encoded_name)
+        return self.field_size_limits.get(name, self.default_field_size_limit)
+
+    def _decode(self, encoded: bytes) -> str:
+        try:
+            return unquote_plus(encoded.decode("utf-8"), errors="strict")
+        except UnicodeError:
+            raise FormError("form data is not correctly encoded")
+
+    def _check_pending_pair(self):
+        # Check the size of the incomplete pair at the end of the buffer
+        name, separator, _ = self.buffer.partition(b"=")
+        if separator:
+            limit = len(name) + 1 + self._field_size_limit(bytes(name))
+        else:
+            limit = self.maximum_field_size_limit
+        if len(self.buffer) > limit:
+            raise FormError(
+                f"form field too large: {self._decode(bytes(name[:80]))}")
+
+    def _add_pair(self, pair: bytes):
+        name, separator, value = pair.partition(b"=")
+        if not separator:
+            return
+        if len(value) > self._field_size_limit(name):
+            raise FormError(f"form field too large: {self._decode(name[:80])}")
+        decoded_name = self._decode(name)
+        if decoded_name not in self.known_fields:
+            raise FormError(f"unknown form field: {decoded_name[:80]}")
+        if not value:
+            return
+        if decoded_name in self.fields:
+            raise FormError(f"duplicated form field: {decoded_name}")
+        self.fields[decoded_name] = [self._decode(value)]
+
+    def feed(self, chunk: bytes):
+        self.received_size += len(chunk)
+        if self.received_size > self.total_size_limit:
+            raise FormError(
+                f"request body too large, limit is {self.total_size_limit} bytes")
+
+        self.buffer.extend(chunk)
+        if b"&" in chunk:
+            *pairs, rest = bytes(self.buffer).split(b"&")
+            self.buffer = bytearray(rest)
+            for pair in pairs:
+                self._add_pair(pair)
+        self._check_pending_pair()
+
+    def close(self) -> Dict[str, List[str]]:
+        self._add_pair(bytes(self.buffer))
+        self.buffer = bytearray()
+        return self.fields
+
+
+def read_form(stream,
+              content_length: int,
+              parser: FormParser,
+              chunk_size: int = 64 * 1024
+              ) -> Dict[str, List[str]]:
+    """Read content_length bytes from stream into the parser"""
+    parser.check_content_length(content_length)
+    remaining = content_length
+    while remaining > 0:
+        chunk: Optional[bytes] = stream.read(min(chunk_size, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        parser.feed(chunk)
+    return parser.close()
+
+
+async def receive_form(receive,
+                       content_length: Optional[int],
+                       parser: FormParser
+                       ) -> Dict[str, List[str]]:
+    """Feed the body of an ASGI HTTP request into the parser"""
+    if content_length is not None:
+        parser.check_content_length(content_length)
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise FormError("client disconnected")
+        parser.feed(message.get("body", b""))
+        more_body = message.get("more_body", False)
+    return parser.close()
@@ -0,0 +1,138 @@
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+# Commit function signature: (dataset_root, files, home) -> commit hash
+BatchCommitFunction = Callable[[Path, List[Path], Path], str]
+
+
+class _PendingFiles:
+    def __init__(self, files: List[Path]):
+        self.files = files
+        self.done = threading.Event()
+        self.commit_hash: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+
+class GroupCommitter(threading.Thread):
+    """Commit files that arrive within a time window in a single commit
+
+    A batch is committed, when `window` seconds have passed since its
+    first record arrived, or when it contains `size` records, whatever
+    happens first. All callers of `commit` that contributed to a batch
+    receive the hash of the shared commit.
+    """
+    def __init__(self,
+                 dataset_root: Path,
+                 home: Path,
+                 commit_function: BatchCommitFunction,
+                 window: float,
+                 size: int):
+        super().__init__(name=f"group-committer-{dataset_root}", daemon=True)
+        self.dataset_root = dataset_root
+        self.home = home
+        self.commit_function = commit_function
+        self.window = window
+        self.size = size
+        self.condition = threading.Condition()
+        self.pending: List[_PendingFiles] = []
+        self.first_arrival = 0.0
+        self.stopped = False
+
+    def commit(self, files: List[Path]) -> str:
+        """Commit files with the next batch, return the commit hash
+
+        After stop(), the committer thread ends when the pending files are
+        committed, i.e. later files are committed immediately by the
+        caller.
+        """
+        pending_files = _PendingFiles(files)
+        with self.condition:
+            stopped = self.stopped
+            if not stopped:
+                if not self.pending:
+                    self.first_arrival = time.monotonic()
+                self.pending.append(pending_files)
+                self.condition.notify_all()
+        if stopped:
+            return self.commit_function(self.dataset_root, files, self.home)
+        pending_files.done.wait()
+        if pending_files.error is not None:
+            raise pending_files.error
+        return pending_files.commit_hash
+
+    def _next_batch(self) -> List[_PendingFiles]:
+        with self.condition:
+            while not self.pending:
+                if self.stopped:
+                    return []
+                self.condition.wait()
+            while len(self.pending) < self.size and not self.stopped:
+                remaining = self.first_arrival + self.window - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            batch, self.pending = self.pending[:self.size], self.pending[self.size:]
+            self.first_arrival = time.monotonic()
+            return batch
+
+    def run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            try:
+                # Files, e.g. signature files, might be shared between records
+                files = dict.fromkeys(
+                    file
+                    for pending_files in batch
+                    for file in pending_files.files)
+                commit_hash = self.commit_function(
+                    self.dataset_root,
+                    list(files),
+                    self.home)
+            except BaseException as exception:
+                for pending_files in batch:
+                    pending_files.error = exception
+                    pending_files.done.set()
+                continue
+            for pending_files in batch:
+                pending_files.commit_hash = commit_hash
+                pending_files.done.set()
+
+    def stop(self):
+        """Stop the committer after all pending files are committed"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+
+_committers: Dict[Tuple[Path, Path], GroupCommitter] = dict()
+_committers_lock = threading.Lock()
+
+
+def get_group_committer(dataset_root: Path,
+                        home: Path,
+                        commit_function: BatchCommitFunction,
+                        window: float,
+                        size: int
+                        ) -> GroupCommitter:
+    """Get the running group committer for the dataset, start one if necessary"""
+    with _committers_lock:
+        committer = _committers.get((dataset_root, home))
+        if committer is None or not committer.is_alive():
+            committer = GroupCommitter(
+                dataset_root, home, commit_function, window, size)
+            _committers[(dataset_root, home)] = committer
+            committer.start()
+        else:
+            committer.commit_function = commit_function
+            committer.window, committer.size = window, size
+        return committer
+
+
+def get_group_committers() -> List[GroupCommitter]:
+    with _committers_lock:
+        return list(_committers.values())
@@ -0,0 +1,117 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+
+# Upper bounds of the duration histogram buckets in seconds
+duration_buckets = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    def __init__(self, buckets=duration_buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        for index, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.total += value
+
+
+def _label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class Metrics:
+    """Process-wide stage durations and response counts
+
+    Stages are e.g. "parse", "save", or "render". The metrics are
+    rendered in the Prometheus text exposition format.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stage_durations: Dict[str, Histogram] = dict()
+        self.responses: Dict[str, int] = dict()
+
+    def observe(self, stage: str, duration: float):
+        with self.lock:
+            histogram = self.stage_durations.get(stage)
+            if histogram is None:
+                histogram = Histogram()
+                self.stage_durations[stage] = histogram
+            histogram.observe(duration)
+
+    def count_response(self, status: str):
+        status_code = status.split(" ", 1)[0]
+        with self.lock:
+            self.responses[status_code] = self.responses.get(status_code, 0) + 1
+
+    def render(self) -> List[str]:
+        lines = [
+            "# HELP sfb1451_entry_stage_duration_seconds Duration of request processing stages\n",
+            "# TYPE sfb1451_entry_stage_duration_seconds histogram\n",
+        ]
+        with self.lock:
+            for stage, histogram in sorted(self.stage_durations.items()):
+                stage_label = f'stage="{_label_value(stage)}"'
+                cumulative_count = 0
+                for upper_bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative_count += count
+                    lines.append(
+                        f"sfb1451_entry_stage_duration_seconds_bucket"
+                        f'{{{stage_label},le="{upper_bound}"}} {cumulative_count}\n')
+                lines.extend([
+                    f'sfb1451_entry_stage_duration_seconds_bucket{{{stage_label},le="+Inf"}} {histogram.count}\n',
+                    f"sfb1451_entry_stage_duration_seconds_sum{{{stage_label}}} {histogram.total}\n",
+                    f"sfb1451_entry_stage_duration_seconds_count{{{stage_label}}} {histogram.count}\n",
+                ])
+            lines.extend([
+                "# HELP sfb1451_entry_responses_total Number of responses by status code\n",
+                "# TYPE sfb1451_entry_responses_total counter\n",
+                *[
+                    f'sfb1451_entry_responses_total{{status="{status_code}"}} {count}\n'
+                    for status_code, count in sorted(self.responses.items())
+                ]
+            ])
+        return lines
+
+
+metrics = Metrics()
+
+# Stage durations of the request that is processed by the current thread,
+# or by the current asyncio task
+_request_timing: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timing", default=None)
+
+
+@contextmanager
+def request_timing() -> Iterator[Dict[str, float]]:
+    """Collect the stage durations of the current request in a dictionary"""
+    timing: Dict[str, float] = dict()
+    token = _request_timing.set(timing)
+    try:
+        yield timing
+    finally:
+        _request_timing.reset(token)
+
+
+@contextmanager
+def timed(stage: str):
+    """Measure the duration of a stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        metrics.observe(stage, duration)
+        stages = _request_timing.get()
+        if stages is not None:
+            stages[stage] = stages.get(stage, 0.0) + duration
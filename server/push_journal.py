@@ -0,0 +1,81 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+
+
+class PushJournal:
+    """Commits that were saved locally, but not yet pushed to entrystore
+
+    The journal is a file with one JSON object per line. Lines are
+    appended by the server processes and removed by the sync tool, after
+    the commits were pushed. All access is serialized with a lock on the
+    journal file, so that server processes and the sync tool can use the
+    journal at the same time.
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        # The journal itself is replaced by remove(), so a separate
+        # file is locked.
+        lock_path = self.path.with_name(self.path.name + ".lock")
+        with self.lock, lock_path.open("a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_lines(self) -> List[str]:
+        if not self.path.exists():
+            return []
+        with self.path.open() as f:
+            return [line for line in f if line.strip()]
+
+    def append(self, commit_hash: str, files: List[str]):
+        entry = {"commit": commit_hash, "files": files, "time": time.time()}
+        with self._locked(), self.path.open("a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def entries(self) -> List[dict]:
+        with self._locked():
+            return [json.loads(line) for line in self._read_lines()]
+
+    def remove(self, count: int):
+        """Remove the first count entries, e.g. after they were pushed"""
+        with self._locked():
+            remaining = self._read_lines()[count:]
+            temporary_path = self.path.with_name(self.path.name + ".tmp")
+            with temporary_path.open("w") as temporary_file:
+                temporary_file.writelines(remaining)
+                temporary_file.flush()
+                os.fsync(temporary_file.fileno())
+            os.replace(temporary_path, self.path)
+
+
+def get_unpushed_journal_path(dataset_root: Path) -> Path:
+    """Journal of the commits that a stopped push scheduler did not push"""
+    return dataset_root / ".git" / "sfb1451-entry-unpushed-commits"
+
+
+_journals: Dict[Path, PushJournal] = dict()
+_journals_lock = threading.Lock()
+
+
+def get_push_journal(path: Path) -> PushJournal:
+    """Get the process-wide journal object for path"""
+    with _journals_lock:
+        journal = _journals.get(path)
+        if journal is None:
+            journal = PushJournal(path)
+            _journals[path] = journal
+        return journal
@@ -0,0 +1,168 @@
+import sys
+import threading
+import time
+from pathlib import Path
+from traceback import format_exception
+from typing import Dict, List, Optional, Set, Tuple
+
+from circuit_breaker import CircuitBreaker
+from push_journal import get_push_journal, get_unpushed_journal_path
+from storage_backend import StorageBackend
+
+
+# Delay before the first retry of a failed push. The delay is doubled
+# for every further failure, up to maximum_retry_delay seconds.
+initial_retry_delay = 1.0
+maximum_retry_delay = 300.0
+maximum_retry_exponent = 16
+
+
+class PushScheduler(threading.Thread):
+    """Push local commits to the entrystore sibling in the background
+
+    All commits that are reported via `notify` while a push is running
+    or while the scheduler waits for a retry are pushed together by the
+    next push. If a circuit breaker is set, push results are reported to
+    it, and while it is open, retries are not delayed by more than its
+    probe interval.
+    """
+    def __init__(self,
+                 dataset_root: Path,
+                 home: Path,
+                 backend: StorageBackend,
+                 circuit_breaker: Optional[CircuitBreaker] = None):
+        super().__init__(name=f"push-scheduler-{dataset_root}", daemon=True)
+        self.dataset_root = dataset_root
+        self.home = home
+        self.backend = backend
+        self.circuit_breaker = circuit_breaker
+        self.condition = threading.Condition()
+        self.pending: Set[str] = set()
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_push: Optional[float] = None
+        self.stopped = False
+
+    def notify(self, commit_hash: str):
+        with self.condition:
+            self.pending.add(commit_hash)
+            self.condition.notify_all()
+
+    def backlog(self) -> int:
+        """Number of local commits that are not yet pushed"""
+        with self.condition:
+            return len(self.pending)
+
+    def _retry_delay(self) -> float:
+        # The exponent is limited, because 2 ** exponent is converted to a
+        # float, which overflows after about 1000 failures
+        delay = min(
+            maximum_retry_delay,
+            initial_retry_delay * 2 ** min(self.failures - 1, maximum_retry_exponent))
+        if self.circuit_breaker is not None and self.circuit_breaker.is_open():
+            return min(delay, self.circuit_breaker.probe_interval)
+        return delay
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                commits = set(self.pending)
+                # Only one push is attempted after stop()
+                final_attempt = self.stopped
+
+            try:
+                self.backend.push(self.dataset_root, self.home)
+            except Exception:
+                with self.condition:
+                    self.failures += 1
+                    self.last_error = "".join(format_exception(*sys.exc_info()))
+                    if self.circuit_breaker is not None:
+                        self.circuit_breaker.record_failure(self.last_error)
+                    print(
+                        f"push-scheduler: push of {self.dataset_root} failed "
+                        f"({self.failures} time(s)), {len(self.pending)} "
+                        f"commit(s) pending:\n{self.last_error}",
+                        file=sys.stderr)
+                    if final_attempt:
+                        unpushed_commits = sorted(self.pending)
+                        break
+                    # New commits do not shorten the delay, they are
+                    # pushed by the retry
+                    retry_time = time.monotonic() + self._retry_delay()
+                    while not self.stopped and time.monotonic() < retry_time:
+                        self.condition.wait(retry_time - time.monotonic())
+                continue
+
+            with self.condition:
+                self.pending -= commits
+                self.failures = 0
+                self.last_error = None
+                self.last_push = time.time()
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_success()
+
+        self._journal_unpushed_commits(unpushed_commits)
+
+    def _journal_unpushed_commits(self, commits: List[str]):
+        journal_path = get_unpushed_journal_path(self.dataset_root)
+        try:
+            journal = get_push_journal(journal_path)
+            for commit_hash in commits:
+                journal.append(commit_hash, [])
+        except OSError as os_error:
+            print(
+                f"push-scheduler: could not write {journal_path}: {os_error}",
+                file=sys.stderr)
+            return
+        print(
+            f"push-scheduler: stopped, {len(commits)} commit(s) of "
+            f"{self.dataset_root} are not pushed, push them with "
+            f"tools/sync_offline_records.py {self.dataset_root} {journal_path}",
+            file=sys.stderr)
+
+    def stop(self):
+        """Stop the scheduler after all pending commits are pushed
+
+        After stop() was called, a push is attempted once more, without
+        delay. If it fails, the scheduler stops, and the commits that are
+        not pushed are recorded in the journal at
+        get_unpushed_journal_path().
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+
+_schedulers: Dict[Tuple[Path, Path], PushScheduler] = dict()
+_schedulers_lock = threading.Lock()
+
+
+def get_push_scheduler(dataset_root: Path,
+                       home: Path,
+                       backend: StorageBackend,
+                       circuit_breaker: Optional[CircuitBreaker] = None
+                       ) -> PushScheduler:
+    """Get the running push scheduler for the dataset, start one if necessary"""
+    with _schedulers_lock:
+        scheduler = _schedulers.get((dataset_root, home))
+        if scheduler is not None and scheduler.is_alive():
+            if circuit_breaker is not None:
+                scheduler.circuit_breaker = circuit_breaker
+        else:
+            stopped_scheduler = scheduler
+            scheduler = PushScheduler(dataset_root, home, backend, circuit_breaker)
+            if stopped_scheduler is not None:
+                # Keep the commits that a stopped scheduler did not push
+                scheduler.pending |= stopped_scheduler.pending
+            _schedulers[(dataset_root, home)] = scheduler
+            scheduler.start()
+        return scheduler
+
+
+def get_push_schedulers() -> List[PushScheduler]:
+    with _schedulers_lock:
+        return list(_schedulers.values())
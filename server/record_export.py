@@ -0,0 +1,283 @@
+import csv
+import json
+import subprocess
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import store_data
+
+
+# Column type of every value fetcher in store_data.field_value_fetcher,
+# fields without value fetcher are strings
+fetcher_types = {
+    store_data.get_string_value: "string",
+    store_data.get_int_value: "int",
+    store_data.get_float_value: "float",
+    store_data.get_checkbox_value: "bool",
+}
+
+# Columns that describe the record itself, followed by the form fields
+source_columns = [
+    ("path", "string"),
+    ("time_stamp", "float"),
+    ("hash-value", "string"),
+]
+
+# Only the fields that store_data.field_schema stores in a record
+columns: List[Tuple[str, str]] = [
+    *source_columns,
+    *[
+        (descriptor.name, fetcher_types.get(descriptor.value_fetcher, "string"))
+        for descriptor in store_data.field_schema.descriptors
+        if descriptor.required or descriptor.patient_required
+        if descriptor.name not in dict(source_columns)
+    ]
+]
+
+column_converters = {
+    "string": str,
+    "int": int,
+    "float": float,
+    "bool": bool,
+}
+
+
+def _git(dataset_root: Path, *arguments: str) -> str:
+    return subprocess.run(
+        ["git", "-C", str(dataset_root), *arguments],
+        check=True,
+        stdout=subprocess.PIPE).stdout.decode()
+
+
+def get_committed_records(dataset_root: Path,
+                          since_commit: Optional[str] = None
+                          ) -> Tuple[str, List[str]]:
+    """Get the records that were added in the commits after since_commit
+
+    Returns the current HEAD commit and the paths of the records, relative
+    to dataset_root, in path order. If since_commit is None, all records
+    in HEAD are returned. Moved records are not reported as added.
+    """
+    head = _git(dataset_root, "rev-parse", "--verify", "HEAD").strip()
+    if since_commit is None:
+        output = _git(
+            dataset_root, "ls-tree", "-r", "-z", "--name-only",
+            head, "--", "input")
+    else:
+        output = _git(
+            dataset_root, "diff", "-z", "--name-only", "-M", "--diff-filter=A",
+            since_commit, head, "--", "input")
+    return head, sorted(
+        path
+        for path in output.split("\0")
+        if path.endswith(".json"))
+
+
+def read_records(dataset_root: Path, paths: Iterable[str]) -> Iterator[Tuple[str, dict]]:
+    for path in paths:
+        with (dataset_root / path).open() as f:
+            yield path, json.load(f)
+
+
+def _typed(value, column_type: str):
+    if value is None or value == "":
+        return None
+    return column_converters[column_type](value)
+
+
+def record_rows(records: Iterable[Tuple[str, dict]]) -> Iterator[List]:
+    """Convert records into rows of typed values, in the order of `columns`
+
+    Fields that are not contained in a record, e.g. because the record was
+    created with an older form version, are None.
+    """
+    for path, result_object in records:
+        values = {
+            **result_object["data"],
+            "path": path,
+            "time_stamp": result_object["source"]["time_stamp"],
+            "hash-value": result_object["source"]["hash-value"],
+        }
+        yield [
+            _typed(values.get(name), column_type)
+            for name, column_type in columns
+        ]
+
+
+def row_batches(rows: Iterable[List], batch_size: int) -> Iterator[Dict[str, list]]:
+    """Group rows into column-oriented batches of at most batch_size rows"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield dict(zip((name for name, _ in columns), zip(*batch)))
+            batch = []
+    if batch:
+        yield dict(zip((name for name, _ in columns), zip(*batch)))
+
+
+class TableWriter:
+    extension = ""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def write_batch(self, batch: Dict[str, list]):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+
+class CsvWriter(TableWriter):
+    extension = "csv"
+
+    def __init__(self, path: Path):
+        super().__init__(path)
+        self.file = path.open("x", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, _ in columns])
+
+    def write_batch(self, batch: Dict[str, list]):
+        self.writer.writerows(zip(*batch.values()))
+
+    def close(self):
+        self.file.close()
+
+
+class _ArrowWriter(TableWriter):
+
+    def __init__(self, path: Path):
+        super().__init__(path)
+        # Import pyarrow only if a Parquet or Arrow table is written
+        import pyarrow
+        self.pyarrow = pyarrow
+        arrow_types = {
+            "string": pyarrow.string(),
+            "int": pyarrow.int64(),
+            "float": pyarrow.float64(),
+            "bool": pyarrow.bool_(),
+        }
+        self.schema = pyarrow.schema([
+            (name, arrow_types[column_type])
+            for name, column_type in columns])
+        self.writer = self._create_writer()
+
+    def _create_writer(self):
+        raise NotImplementedError
+
+    def write_batch(self, batch: Dict[str, list]):
+        self.writer.write_batch(
+            self.pyarrow.record_batch(
+                [list(values) for values in batch.values()],
+                schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class ParquetWriter(_ArrowWriter):
+    extension = "parquet"
+
+    def _create_writer(self):
+        import pyarrow.parquet
+        return pyarrow.parquet.ParquetWriter(str(self.path), self.schema)
+
+
+class ArrowIpcWriter(_ArrowWriter):
+    extension = "arrow"
+
+    def _create_writer(self):
+        return self.pyarrow.ipc.new_file(str(self.path), self.schema)
+
+
+table_writers = {
+    "csv": CsvWriter,
+    "parquet": ParquetWriter,
+    "arrow": ArrowIpcWriter,
+}
+
+
+class RecordExporter:
+    """Export the records of a dataset into a directory of table files
+
+    Every export run writes the records that were committed since the
+    previous run into a new part file, e.g. "part-00003.parquet". The
+    commit up to which records are exported is kept in export-state.json
+    in the output directory. A part file is written under a temporary
+    name and renamed before the state is written. Part files that the
+    state does not count, e.g. after a crash, are removed by the next run.
+    """
+    state_file_name = "export-state.json"
+
+    def __init__(self,
+                 dataset_root: Path,
+                 output_directory: Path,
+                 table_format: str = "csv",
+                 batch_size: int = 1000):
+        if table_format not in table_writers:
+            raise ValueError(f"unknown table format: {table_format}")
+        self.dataset_root = dataset_root
+        self.output_directory = output_directory
+        self.table_format = table_format
+        self.batch_size = batch_size
+
+    def read_state(self) -> dict:
+        state_path = self.output_directory / self.state_file_name
+        if not state_path.exists():
+            return {"format": self.table_format, "commit": None, "parts": 0}
+        with state_path.open() as f:
+            state = json.load(f)
+        if state["format"] != self.table_format:
+            raise ValueError(
+                f"{self.output_directory} contains an export in format "
+                f"{state['format']}, not in {self.table_format}")
+        return state
+
+    def write_state(self, state: dict):
+        state_path = self.output_directory / self.state_file_name
+        temporary_path = state_path.with_suffix(".tmp")
+        with temporary_path.open("w") as f:
+            json.dump(state, f)
+        temporary_path.replace(state_path)
+
+    def part_path(self, part: int) -> Path:
+        extension = table_writers[self.table_format].extension
+        return self.output_directory / f"part-{part:05d}.{extension}"
+
+    def remove_stale_parts(self, state: dict):
+        """Remove part files that are not counted in state"""
+        for path in self.output_directory.glob(".part-*.tmp"):
+            path.unlink()
+        part = state["parts"]
+        while self.part_path(part).exists():
+            self.part_path(part).unlink()
+            part += 1
+
+    def export(self) -> int:
+        """Export all records that were not yet exported
+
+        Returns the number of exported records.
+        """
+        self.output_directory.mkdir(parents=True, exist_ok=True)
+        state = self.read_state()
+        self.remove_stale_parts(state)
+        head, paths = get_committed_records(self.dataset_root, state["commit"])
+        if paths:
+            part_path = self.part_path(state["parts"])
+            temporary_path = part_path.with_name(f".{part_path.name}.tmp")
+            writer = table_writers[self.table_format](temporary_path)
+            try:
+                rows = record_rows(read_records(self.dataset_root, paths))
+                for batch in row_batches(rows, self.batch_size):
+                    writer.write_batch(batch)
+            except:
+                writer.close()
+                temporary_path.unlink()
+                raise
+            writer.close()
+            temporary_path.replace(part_path)
+            state["parts"] += 1
+        state["commit"] = head
+        self.write_state(state)
+        return len(paths)
@@ -0,0 +1,211 @@
+import json
+import sqlite3
+import subprocess
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+
+class DuplicateRecord(Exception):
+    def __init__(self, entry: dict):
+        super().__init__(f"record with hash value {entry['hash_value']} already exists")
+        self.entry = entry
+
+
+class RecordIndex:
+    """SQLite index of all records in the dataset
+
+    Records are indexed by hash value, subject pseudonym, project code,
+    and date of test. The index can be rebuilt from the records in the
+    dataset at any time, see rebuild().
+    """
+
+    columns = (
+        "hash_value",
+        "subject_pseudonym",
+        "project_code",
+        "date_of_test",
+        "path",
+        "time_stamp",
+        "commit_hash",
+    )
+
+    def __init__(self, index_path: Path):
+        self.path = index_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            str(index_path),
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS records (
+                hash_value TEXT PRIMARY KEY,
+                subject_pseudonym TEXT,
+                project_code TEXT,
+                date_of_test TEXT,
+                path TEXT,
+                time_stamp REAL,
+                commit_hash TEXT
+            );
+            CREATE INDEX IF NOT EXISTS records_subject
+                ON records (subject_pseudonym, date_of_test);
+            CREATE INDEX IF NOT EXISTS records_project
+                ON records (project_code, date_of_test);
+        """)
+
+    def _entries(self, query: str, parameters: Iterable) -> List[dict]:
+        with self.lock:
+            rows = self.connection.execute(query, tuple(parameters)).fetchall()
+        return [dict(zip(self.columns, row)) for row in rows]
+
+    def get(self, hash_value: str) -> Optional[dict]:
+        entries = self._entries(
+            f"SELECT {', '.join(self.columns)} FROM records WHERE hash_value = ?",
+            [hash_value])
+        return entries[0] if entries else None
+
+    def find(self,
+             subject_pseudonym: str,
+             date_of_test: Optional[str] = None,
+             project_code: Optional[str] = None
+             ) -> List[dict]:
+        conditions = {
+            "subject_pseudonym": subject_pseudonym,
+            "date_of_test": date_of_test,
+            "project_code": project_code,
+        }
+        conditions = {key: value for key, value in conditions.items() if value is not None}
+        where_clause = " AND ".join(f"{key} = ?" for key in conditions)
+        return self._entries(
+            f"SELECT {', '.join(self.columns)} FROM records "
+            f"WHERE {where_clause} ORDER BY time_stamp",
+            conditions.values())
+
+    def add(self, path: str, result_object: dict, commit_hash: Optional[str] = None):
+        """Add a record to the index
+
+        Raises DuplicateRecord, if a record with the same hash value is
+        already indexed.
+        """
+        entry = self._entry(path, result_object, commit_hash)
+        with self.lock:
+            try:
+                self.connection.execute(
+                    f"INSERT INTO records ({', '.join(self.columns)}) "
+                    f"VALUES ({', '.join('?' * len(self.columns))})",
+                    [entry[column] for column in self.columns])
+                return
+            except sqlite3.IntegrityError:
+                pass
+        raise DuplicateRecord(self.get(entry["hash_value"]) or entry)
+
+    def remove(self, hash_value: str):
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM records WHERE hash_value = ?",
+                [hash_value])
+
+    def set_commit_hash(self, hash_value: str, commit_hash: str):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE records SET commit_hash = ? WHERE hash_value = ?",
+                [commit_hash, hash_value])
+
+    def rebuild(self, dataset_root: Path) -> int:
+        """Replace the index content with the records in dataset_root
+
+        Returns the number of indexed records. If several records have
+        the same hash value, the first one in path order is indexed.
+        Records that are already indexed keep their commit hash, e.g. after
+        they were moved. Other records get the last commit that changed
+        them, or no commit hash, if they are not committed.
+        """
+        with self.lock:
+            commit_hashes = dict(self.connection.execute(
+                "SELECT hash_value, commit_hash FROM records "
+                "WHERE commit_hash IS NOT NULL").fetchall())
+        entries = []
+        for record_path in sorted((dataset_root / "input").glob("**/*.json")):
+            with record_path.open() as f:
+                result_object = json.load(f)
+            entries.append(self._entry(
+                str(record_path.relative_to(dataset_root)),
+                result_object,
+                commit_hashes.get(result_object["source"]["hash-value"])))
+
+        unresolved_paths = {entry["path"] for entry in entries if entry["commit_hash"] is None}
+        if unresolved_paths:
+            last_commits = get_last_commits(dataset_root, unresolved_paths)
+            for entry in entries:
+                if entry["commit_hash"] is None:
+                    entry["commit_hash"] = last_commits.get(entry["path"])
+
+        with self.lock:
+            self.connection.execute("BEGIN")
+            self.connection.execute("DELETE FROM records")
+            self.connection.executemany(
+                f"INSERT OR IGNORE INTO records ({', '.join(self.columns)}) "
+                f"VALUES ({', '.join('?' * len(self.columns))})",
+                [[entry[column] for column in self.columns] for entry in entries])
+            self.connection.execute("COMMIT")
+            return self.connection.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    @staticmethod
+    def _entry(path: str, result_object: dict, commit_hash: Optional[str] = None) -> dict:
+        data = result_object["data"]
+        return {
+            "hash_value": result_object["source"]["hash-value"],
+            "subject_pseudonym": data.get("subject-pseudonym"),
+            "project_code": data.get("project-code"),
+            "date_of_test": data.get("date-of-test"),
+            "path": path,
+            "time_stamp": result_object["source"]["time_stamp"],
+            "commit_hash": commit_hash,
+        }
+
+
+def get_last_commits(dataset_root: Path, paths: Set[str]) -> Dict[str, str]:
+    """Get the last commit that changed each of the paths in input/
+
+    The history is read in a single pass. Paths that were never committed,
+    or that are not in a git repository, are missing in the result.
+    """
+    try:
+        log = subprocess.run(
+            [
+                "git", "-C", str(dataset_root),
+                "-c", "core.quotePath=false",
+                "log", "--format=commit %H", "--name-only", "--no-renames",
+                "--", "input"
+            ],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL).stdout.decode()
+    except (OSError, subprocess.CalledProcessError):
+        return dict()
+
+    last_commits = dict()
+    commit_hash = None
+    # The log starts with the newest commit
+    for line in log.splitlines():
+        if line.startswith("commit "):
+            commit_hash = line[len("commit "):]
+        elif line in paths and line not in last_commits:
+            last_commits[line] = commit_hash
+    return last_commits
+
+
+_indices: Dict[Path, RecordIndex] = dict()
+_indices_lock = threading.Lock()
+
+
+def get_record_index(index_path: Path) -> RecordIndex:
+    """Get the process-wide index object for index_path"""
+    with _indices_lock:
+        index = _indices.get(index_path)
+        if index is None:
+            index = RecordIndex(index_path)
+            _indices[index_path] = index
+        return index
@@ -0,0 +1,161 @@
+import math
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# A compiled check gets the type-converted record and the received data,
+# and returns an error message, or None if the record passes the check.
+RecordCheck = Callable[[Dict[str, object], Dict[str, List[str]]], Optional[str]]
+
+# A date is given by one "YYYY-MM-DD"-field, or by a year-, a month-, and a
+# day-field.
+DateFields = Sequence[str]
+
+PartialDate = Tuple[Optional[int], Optional[int], Optional[int]]
+
+
+def get_number(value) -> Optional[float]:
+    """Convert a record value to a number, empty values are None"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return float(value)
+
+
+def _parse_int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_partial_date(record: Dict[str, object], date_fields: DateFields) -> PartialDate:
+    """Read a date, unknown components are None, like parseDate in entry.html"""
+    if len(date_fields) == 1:
+        components = str(record.get(date_fields[0]) or "").split("-")
+    else:
+        components = [record.get(name) for name in date_fields]
+    if len(components) != 3:
+        return None, None, None
+    year, month, day = map(_parse_int, components)
+    return year, month, day
+
+
+def compare_partial_dates(date_a: PartialDate, date_b: PartialDate) -> int:
+    """Compare the known components of two dates, like compareDate in entry.html"""
+    for component_a, component_b in zip(date_a, date_b):
+        if component_a is None or component_b is None:
+            return 0
+        if component_a != component_b:
+            return component_a - component_b
+    return 0
+
+
+def range_check(name: str, minimum: float, maximum: float) -> RecordCheck:
+    def check(record, received_data):
+        try:
+            value = get_number(record.get(name))
+        except ValueError:
+            return f"{name}: {record[name]!r} is not a number"
+        if value is None or minimum <= value <= maximum:
+            return None
+        return f"{name}: {value} is not between {minimum} and {maximum}"
+    return check
+
+
+def per_unit_maximum_check(name: str, unit_name: str, maximum_per_unit: float) -> RecordCheck:
+    def check(record, received_data):
+        value, units = get_number(record.get(name)), get_number(record.get(unit_name))
+        if value is None or units is None or value <= units * maximum_per_unit:
+            return None
+        return f"{name}: {value} is larger than {maximum_per_unit} per {unit_name} ({units * maximum_per_unit})"
+    return check
+
+
+def date_order_check(earlier: DateFields, later: DateFields, message: str) -> RecordCheck:
+    def check(record, received_data):
+        earlier_date = get_partial_date(record, earlier)
+        later_date = get_partial_date(record, later)
+        if compare_partial_dates(earlier_date, later_date) > 0:
+            return message
+        return None
+    return check
+
+
+def sum_limit_check(name: str, summands: Sequence[str], message: str) -> RecordCheck:
+    def check(record, received_data):
+        value = get_number(record.get(name))
+        if value is None:
+            return None
+        total = sum(get_number(record.get(summand)) or 0 for summand in summands)
+        if value > total:
+            return message
+        return None
+    return check
+
+
+def posted_sum_check(sum_name: str, summands: Sequence[str]) -> RecordCheck:
+    # Sum fields are computed by the entry form and are usually disabled,
+    # i.e. not posted. If they are posted, they have to match the summands.
+    def check(record, received_data):
+        posted_sum = received_data.get(sum_name, [""])[0]
+        if posted_sum == "":
+            return None
+        try:
+            total = sum(get_number(record.get(summand)) or 0 for summand in summands)
+            if math.isclose(float(posted_sum), total, abs_tol=1e-9):
+                return None
+        except ValueError:
+            pass
+        return f"{sum_name}: {posted_sum} is not the sum of {', '.join(summands)}"
+    return check
+
+
+class RuleSet:
+    """Compiled range and consistency checks of a record"""
+
+    def __init__(self, checks: List[RecordCheck]):
+        self.checks = tuple(checks)
+
+    def check(self,
+              record: Dict[str, object],
+              received_data: Dict[str, List[str]]
+              ) -> List[str]:
+        """Return the error messages of all failed checks"""
+        messages = []
+        for check in self.checks:
+            message = check(record, received_data)
+            if message is not None:
+                messages.append(message)
+        return messages
+
+
+def compile_rules(field_ranges: Dict[str, Tuple[float, float]],
+                  per_unit_maxima: List[Tuple[str, str, float]],
+                  date_order_rules: List[Tuple[DateFields, DateFields, str]],
+                  sum_limit_rules: List[Tuple[str, List[str], str]],
+                  sum_fields: Dict[str, List[str]]
+                  ) -> RuleSet:
+
+    return RuleSet([
+        *[
+            range_check(name, minimum, maximum)
+            for name, (minimum, maximum) in field_ranges.items()
+        ],
+        *[
+            per_unit_maximum_check(name, unit_name, maximum_per_unit)
+            for name, unit_name, maximum_per_unit in per_unit_maxima
+        ],
+        *[
+            date_order_check(earlier, later, message)
+            for earlier, later, message in date_order_rules
+        ],
+        *[
+            sum_limit_check(name, summands, message)
+            for name, summands, message in sum_limit_rules
+        ],
+        *[
+            posted_sum_check(sum_name, summands)
+            for sum_name, summands in sum_fields.items()
+        ]
+    ])
@@ -0,0 +1,224 @@
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy
+
+from record_export import (
+    columns,
+    get_committed_records,
+    read_records,
+    record_rows,
+    row_batches,
+    source_columns,
+)
+
+
+source_column_names = {name for name, _ in source_columns}
+
+# Missing values are counted for all form fields, the remaining
+# statistics are computed for numeric and checkbox fields.
+fields = [name for name, _ in columns if name not in source_column_names]
+numeric_fields = [
+    name
+    for name, column_type in columns
+    if name not in source_column_names and column_type in ("int", "float", "bool")
+]
+
+GroupKey = Tuple[Optional[str], Optional[str]]
+
+
+class GroupSummary:
+    """Running summary of the records of one project and form version"""
+
+    def __init__(self):
+        self.records = 0
+        self.missing = numpy.zeros(len(fields), dtype=numpy.int64)
+        self.count = numpy.zeros(len(numeric_fields), dtype=numpy.int64)
+        self.total = numpy.zeros(len(numeric_fields))
+        self.total_of_squares = numpy.zeros(len(numeric_fields))
+        self.minimum = numpy.full(len(numeric_fields), numpy.inf)
+        self.maximum = numpy.full(len(numeric_fields), -numpy.inf)
+
+    def add(self, missing: numpy.ndarray, values: numpy.ndarray):
+        """Add rows, missing is a boolean (rows × fields) array, values
+        is a (rows × numeric fields) array, in which NaN marks missing values"""
+        present = ~numpy.isnan(values)
+        zeroed = numpy.where(present, values, 0.0)
+        self.records += missing.shape[0]
+        self.missing += missing.sum(axis=0)
+        self.count += present.sum(axis=0)
+        self.total += zeroed.sum(axis=0)
+        self.total_of_squares += (zeroed * zeroed).sum(axis=0)
+        self.minimum = numpy.minimum(
+            self.minimum,
+            numpy.where(present, values, numpy.inf).min(axis=0, initial=numpy.inf))
+        self.maximum = numpy.maximum(
+            self.maximum,
+            numpy.where(present, values, -numpy.inf).max(axis=0, initial=-numpy.inf))
+
+    def merge(self, other: "GroupSummary"):
+        self.records += other.records
+        self.missing += other.missing
+        self.count += other.count
+        self.total += other.total
+        self.total_of_squares += other.total_of_squares
+        self.minimum = numpy.minimum(self.minimum, other.minimum)
+        self.maximum = numpy.maximum(self.maximum, other.maximum)
+
+    def to_dict(self) -> dict:
+        return {
+            "records": self.records,
+            "missing": self.missing.tolist(),
+            "count": self.count.tolist(),
+            "total": self.total.tolist(),
+            "total_of_squares": self.total_of_squares.tolist(),
+            # JSON has no infinity, empty columns are stored as null
+            "minimum": [None if numpy.isinf(value) else value for value in self.minimum.tolist()],
+            "maximum": [None if numpy.isinf(value) else value for value in self.maximum.tolist()],
+        }
+
+    @classmethod
+    def from_dict(cls, summary_dict: dict) -> "GroupSummary":
+        summary = cls()
+        summary.records = summary_dict["records"]
+        summary.missing = numpy.array(summary_dict["missing"], dtype=numpy.int64)
+        summary.count = numpy.array(summary_dict["count"], dtype=numpy.int64)
+        summary.total = numpy.array(summary_dict["total"], dtype=float)
+        summary.total_of_squares = numpy.array(summary_dict["total_of_squares"], dtype=float)
+        summary.minimum = numpy.array(
+            [numpy.inf if value is None else value for value in summary_dict["minimum"]],
+            dtype=float)
+        summary.maximum = numpy.array(
+            [-numpy.inf if value is None else value for value in summary_dict["maximum"]],
+            dtype=float)
+        return summary
+
+
+class RecordStatistics:
+    """Per project and form version statistics over all committed records
+
+    The summaries are kept in a checkpoint file together with the commit
+    up to which records were added. update() reads only the records that
+    were committed after that commit, queries only combine the stored
+    summaries.
+    """
+    def __init__(self, checkpoint_path: Path, batch_size: int = 1000):
+        self.checkpoint_path = checkpoint_path
+        self.batch_size = batch_size
+        self.commit: Optional[str] = None
+        self.groups: Dict[GroupKey, GroupSummary] = dict()
+        if checkpoint_path.exists():
+            self._load()
+
+    def _load(self):
+        with self.checkpoint_path.open() as f:
+            checkpoint = json.load(f)
+        # Start from scratch, if the form fields have changed
+        if checkpoint["fields"] != fields or checkpoint["numeric_fields"] != numeric_fields:
+            return
+        self.commit = checkpoint["commit"]
+        self.groups = {
+            (group["project-code"], group["form-data-version"]): GroupSummary.from_dict(group["summary"])
+            for group in checkpoint["groups"]
+        }
+
+    def save(self):
+        checkpoint = {
+            "commit": self.commit,
+            "fields": fields,
+            "numeric_fields": numeric_fields,
+            "groups": [
+                {
+                    "project-code": project_code,
+                    "form-data-version": version,
+                    "summary": summary.to_dict(),
+                }
+                for (project_code, version), summary in self.groups.items()
+            ]
+        }
+        temporary_path = self.checkpoint_path.with_suffix(".tmp")
+        with temporary_path.open("w") as f:
+            json.dump(checkpoint, f)
+        temporary_path.replace(self.checkpoint_path)
+
+    def add_batch(self, batch: Dict[str, tuple]):
+        keys = list(zip(batch["project-code"], batch["form-data-version"]))
+        missing = numpy.array(
+            [[value is None for value in batch[name]] for name in fields],
+            dtype=bool).T
+        # None becomes NaN, booleans become 0.0 and 1.0
+        values = numpy.array(
+            [batch[name] for name in numeric_fields],
+            dtype=float).T
+
+        key_indices: Dict[GroupKey, int] = dict()
+        row_groups = numpy.array([key_indices.setdefault(key, len(key_indices)) for key in keys])
+        for key, index in key_indices.items():
+            rows = row_groups == index
+            self.groups.setdefault(key, GroupSummary()).add(missing[rows], values[rows])
+
+    def update(self, dataset_root: Path) -> int:
+        """Add the records that were committed since the last update
+
+        Returns the number of added records.
+        """
+        head, paths = get_committed_records(dataset_root, self.commit)
+        rows = record_rows(read_records(dataset_root, paths))
+        for batch in row_batches(rows, self.batch_size):
+            self.add_batch(batch)
+        self.commit = head
+        self.save()
+        return len(paths)
+
+    def summary(self,
+                project_code: Optional[str] = None,
+                version: Optional[str] = None
+                ) -> GroupSummary:
+        """Combined summary of all groups that match the given project and version"""
+        result = GroupSummary()
+        for (group_project_code, group_version), summary in self.groups.items():
+            if project_code is not None and group_project_code != project_code:
+                continue
+            if version is not None and group_version != version:
+                continue
+            result.merge(summary)
+        return result
+
+    def field_statistics(self,
+                         project_code: Optional[str] = None,
+                         version: Optional[str] = None
+                         ) -> Dict[str, dict]:
+        """Count, missing-value rate, and for numeric fields mean, standard
+        deviation, minimum, and maximum of every field"""
+        summary = self.summary(project_code, version)
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            mean = summary.total / summary.count
+            deviation = numpy.sqrt(numpy.maximum(
+                summary.total_of_squares / summary.count - mean * mean,
+                0.0))
+
+        statistics = {
+            name: {
+                "count": summary.records - int(missing),
+                "missing_rate": int(missing) / summary.records if summary.records else None,
+            }
+            for name, missing in zip(fields, summary.missing)
+        }
+        for index, name in enumerate(numeric_fields):
+            if summary.count[index] == 0:
+                continue
+            statistics[name].update({
+                "mean": float(mean[index]),
+                "standard_deviation": float(deviation[index]),
+                "minimum": float(summary.minimum[index]),
+                "maximum": float(summary.maximum[index]),
+            })
+        return statistics
+
+    def record_counts(self) -> List[Tuple[Optional[str], Optional[str], int]]:
+        """Number of records per project and form version"""
+        return sorted(
+            ((project_code, version, summary.records)
+             for (project_code, version), summary in self.groups.items()),
+            key=lambda entry: (str(entry[0]), str(entry[1])))
@@ -0,0 +1,219 @@
+"""Capture submissions in a request log and replay them
+
+The request log contains personal data: all posted fields of every
+captured form, i.e. pseudonyms, dates of birth, and all patient and test
+data, unencrypted. Restrict access to it like access to the dataset, and
+remove it when it is no longer needed.
+
+By default, the signature image and the free-text remarks are not logged.
+The signature is replaced by its length, and a replay posts a dummy data
+URL of that length. The remarks are replaced by their SHA-256 hash, also
+in the hashed string, and the hash value is recomputed, so that a
+replayed form is still accepted. Records that are replayed from such an
+entry are made up, they must only be stored in throwaway datasets. With
+keep_personal_data, all fields are logged unchanged. Every entry records
+whether it was sanitized.
+"""
+import hashlib
+import io
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+from urllib.parse import urlencode
+
+from error_journal import ErrorJournal
+
+
+class RequestLog(ErrorJournal):
+    """Size-limited log of captured submissions, one JSON object per line
+
+    An entry contains the time, the request path, the idempotency key, if
+    one was sent, and the parsed content, i.e. "fields" of a posted form or
+    "records" of a batch. Client addresses and other headers are not
+    logged. The log is rotated and locked like the error journal.
+    """
+    def __init__(self, path: Path, max_bytes: int = 100 * 1024 * 1024, backup_count: int = 10):
+        super().__init__(path, max_bytes, backup_count)
+
+    def chronological_entries(self) -> Iterator[dict]:
+        """All entries, oldest first"""
+        return self._read_entries(
+            [*map(self.backup_path, range(self.backup_count, 0, -1)), self.path])
+
+
+_logs: Dict[Path, RequestLog] = dict()
+_logs_lock = threading.Lock()
+
+
+def get_request_log(path: Path,
+                    max_bytes: int = 100 * 1024 * 1024,
+                    backup_count: int = 10
+                    ) -> RequestLog:
+    """Get the process-wide request log object for path"""
+    with _logs_lock:
+        request_log = _logs.get(path)
+        if request_log is None:
+            request_log = RequestLog(path, max_bytes, backup_count)
+            _logs[path] = request_log
+        else:
+            request_log.max_bytes = max_bytes
+            request_log.backup_count = backup_count
+        return request_log
+
+
+omitted_signature_prefix = "omitted:"
+dummy_signature_prefix = "data:image/png;base64,"
+
+
+def sanitize_fields(fields: object) -> object:
+    """Replace signature data and remarks of a form, see module docstring"""
+    if not isinstance(fields, dict):
+        return fields
+    sanitized = dict(fields)
+    signature_data = sanitized.get("signature-data")
+    if isinstance(signature_data, str) and signature_data:
+        sanitized["signature-data"] = f"{omitted_signature_prefix}{len(signature_data)}"
+
+    remarks = sanitized.get("additional-remarks")
+    hashed_string = sanitized.get("hashed-string")
+    if isinstance(remarks, str) and remarks:
+        remarks_hash = "sha256:" + hashlib.sha256(remarks.encode()).hexdigest()
+        sanitized["additional-remarks"] = remarks_hash
+        if isinstance(hashed_string, str):
+            remarks_part = f"additional-remarks:{remarks}"
+            if remarks_part in hashed_string:
+                sanitized["hashed-string"] = hashed_string.replace(
+                    remarks_part, f"additional-remarks:{remarks_hash}")
+            else:
+                # Not the hashed string of this form, it is rejected anyway
+                sanitized["hashed-string"] = "sha256:" + hashlib.sha256(hashed_string.encode()).hexdigest()
+            # Only correct hash values are replaced by correct hash values
+            if sanitized.get("hash-value") == hashlib.sha256(hashed_string.encode()).hexdigest():
+                sanitized["hash-value"] = hashlib.sha256(
+                    sanitized["hashed-string"].encode()).hexdigest()
+    return sanitized
+
+
+def restore_fields(fields: object) -> object:
+    """Replace an omitted signature by a dummy data URL of the same length"""
+    if not isinstance(fields, dict):
+        return fields
+    signature_data = fields.get("signature-data")
+    if not (isinstance(signature_data, str) and signature_data.startswith(omitted_signature_prefix)):
+        return fields
+    length = int(signature_data[len(omitted_signature_prefix):])
+    padding_length = max(4, (length - len(dummy_signature_prefix)) // 4 * 4)
+    return {
+        **fields,
+        "signature-data": dummy_signature_prefix + "A" * padding_length
+    }
+
+
+def capture_request(request_log: RequestLog,
+                    environ,
+                    content: dict,
+                    keep_personal_data: bool = False):
+    """Append a submission to the log, never fail the request
+
+    content contains either "fields" of a form or "records" of a batch.
+    """
+    if not keep_personal_data:
+        content = {
+            name: (
+                [sanitize_fields(record) for record in value]
+                if name == "records" and isinstance(value, list)
+                else sanitize_fields(value)
+            )
+            for name, value in content.items()
+        }
+    entry = {
+        "time": time.time(),
+        "path": environ.get("PATH_INFO", ""),
+        "sanitized": not keep_personal_data,
+        **content
+    }
+    if environ.get("HTTP_IDEMPOTENCY_KEY"):
+        entry["idempotency_key"] = environ["HTTP_IDEMPOTENCY_KEY"]
+    try:
+        request_log.append(entry)
+    except OSError as os_error:
+        print(f"request log {request_log.path} not writable: {os_error}", file=sys.stderr)
+
+
+def is_sanitized(entry: dict) -> bool:
+    """Whether signature and remarks of the entry were replaced
+
+    Entries without marker are considered sanitized.
+    """
+    return entry.get("sanitized", True)
+
+
+def create_replay_environ(entry: dict, configuration: Dict[str, str]) -> dict:
+    """Create the WSGI environ that posts a logged submission again"""
+    if "records" in entry:
+        content_type = "application/json"
+        body = json.dumps([restore_fields(record) for record in entry["records"]]).encode()
+    else:
+        content_type = "application/x-www-form-urlencoded"
+        body = urlencode(list(restore_fields(entry["fields"]).items())).encode()
+    environ = {
+        **configuration,
+        "REQUEST_METHOD": "POST",
+        "PATH_INFO": entry["path"],
+        "CONTENT_TYPE": content_type,
+        "CONTENT_LENGTH": str(len(body)),
+        "REMOTE_ADDR": "127.0.0.1",
+        "wsgi.input": io.BytesIO(body),
+    }
+    if entry.get("idempotency_key"):
+        environ["HTTP_IDEMPOTENCY_KEY"] = entry["idempotency_key"]
+    return environ
+
+
+def call_application(application: Callable, environ: dict) -> Tuple[str, bytes]:
+    status = []
+
+    def start_response(response_status, _):
+        status.append(response_status)
+
+    content = b"".join(application(environ, start_response))
+    return status[0], content
+
+
+def replay(entries: Iterable[dict],
+           application: Callable,
+           configuration: Dict[str, str],
+           speed: float = 0.0,
+           concurrency: int = 1
+           ) -> List[Tuple[str, bytes, float]]:
+    """Post logged submissions to a WSGI application in the same process
+
+    With speed 0, entries are posted as fast as `concurrency` threads
+    allow. Otherwise they are posted at their logged time intervals,
+    divided by speed, i.e. speed 1 replays in real time. Returns status,
+    content, and duration of every request, in the order of the entries.
+    """
+    def post(entry: dict) -> Tuple[str, bytes, float]:
+        start = time.perf_counter()
+        status, content = call_application(
+            application,
+            create_replay_environ(entry, configuration))
+        return status, content, time.perf_counter() - start
+
+    futures = []
+    with ThreadPoolExecutor(concurrency) as executor:
+        replay_start = time.monotonic()
+        first_time = None
+        for entry in entries:
+            if speed > 0:
+                if first_time is None:
+                    first_time = entry["time"]
+                delay = replay_start + (entry["time"] - first_time) / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(executor.submit(post, entry))
+    return [future.result() for future in futures]
@@ -0,0 +1,353 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from traceback import format_exception
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from record_index import get_record_index
+
+
+# A spool is a directory with the subdirectories "pending", "claimed",
+# and "done". Every stored record that still has to be committed is
+# described by a receipt in "pending". A worker moves a receipt to
+# "claimed" while it commits the record, and writes the receipt, now
+# containing the commit hash, to "done" when the commit succeeded. Receipts
+# in "done" are removed after done_retention seconds, their references are
+# unknown afterwards. Receipts that cannot be read are moved to "failed".
+PENDING = "pending"
+CLAIMED = "claimed"
+DONE = "done"
+FAILED = "failed"
+
+receipt_keys = ("reference", "dataset_root", "files", "home")
+
+# Seconds between two scans of the pending-directory. The scan picks up
+# receipts that were written by other processes or that could not be
+# committed on an earlier attempt.
+poll_interval = 1.0
+
+# Seconds between two removals of expired receipts from "done"
+cleanup_interval = 3600.0
+
+# Delay before the first retry of a failed commit. The delay is doubled
+# for every further failure, up to maximum_retry_delay seconds.
+initial_retry_delay = 1.0
+maximum_retry_delay = 300.0
+maximum_retry_exponent = 16
+
+
+# Commit function signature: (dataset_root, files, home) -> commit hash
+CommitFunction = Callable[[Path, List[Path], Path], str]
+
+
+class Spool:
+    def __init__(self, spool_directory: Path):
+        self.directory = spool_directory
+        for name in (PENDING, CLAIMED, DONE, FAILED):
+            (self.directory / name).mkdir(parents=True, exist_ok=True)
+
+    def _path(self, state: str, name: str) -> Path:
+        return self.directory / state / name
+
+    def _write_receipt(self, path: Path, receipt: dict):
+        temp_path = path.parent / ("." + path.name + ".tmp")
+        with temp_path.open("w") as f:
+            json.dump(receipt, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        _fsync(path.parent)
+
+    def enqueue(self,
+                dataset_root: Path,
+                files: List[Path],
+                home: Path,
+                record_index: Optional[Path] = None,
+                hash_values: Iterable[str] = ()
+                ) -> str:
+        """Write a pending receipt for files, return its reference
+
+        The files, and the directories up to dataset_root, are synced
+        before the receipt is written, because a pending receipt must
+        only refer to files that survive a crash. If record_index is
+        given, the worker stores the commit hash of the records with
+        the given hash values in it.
+        """
+        directories = set()
+        for file in files:
+            _fsync(file)
+            directories.update(
+                directory
+                for directory in file.parents
+                if directory == dataset_root or dataset_root in directory.parents)
+        for directory in directories:
+            _fsync(directory)
+
+        # References sort in the order in which they were created
+        reference = f"{time.time_ns():016x}{uuid.uuid4().hex[:16]}"
+        self._write_receipt(
+            self._path(PENDING, reference + ".json"),
+            {
+                "reference": reference,
+                "dataset_root": str(dataset_root),
+                "files": [str(file) for file in files],
+                "home": str(home),
+                "record_index": str(record_index) if record_index else None,
+                "hash_values": list(hash_values)
+            })
+        return reference
+
+    def claim(self) -> Optional[Tuple[Path, dict]]:
+        """Move the oldest pending receipt to the claimed-directory"""
+        claimed = self.claim_batch(1)
+        return claimed[0] if claimed else None
+
+    def claim_batch(self, size: int) -> List[Tuple[Path, dict]]:
+        """Move up to size of the oldest pending receipts to the claimed-directory"""
+        claimed = []
+        for path in sorted(self._path(PENDING, "").glob("*.json")):
+            if len(claimed) == size:
+                break
+            claimed_path = self._path(CLAIMED, f"{os.getpid()}-{path.name}")
+            try:
+                os.rename(path, claimed_path)
+            except FileNotFoundError:
+                # Another worker claimed the receipt
+                continue
+            try:
+                with claimed_path.open() as f:
+                    receipt = json.load(f)
+                if not isinstance(receipt, dict) or not all(key in receipt for key in receipt_keys):
+                    raise ValueError("incomplete receipt")
+            except (OSError, ValueError) as error:
+                # A broken receipt must not stop the worker
+                self.quarantine(claimed_path, path.name, error)
+                continue
+            claimed.append((claimed_path, receipt))
+        return claimed
+
+    def quarantine(self, claimed_path: Path, name: str, error: Exception):
+        print(f"spool: moving unreadable receipt {name} to {FAILED}: {error}", file=sys.stderr)
+        try:
+            os.rename(claimed_path, self._path(FAILED, name))
+        except OSError as os_error:
+            print(f"spool: moving receipt {name} failed: {os_error}", file=sys.stderr)
+
+    def complete(self, claimed_path: Path, receipt: dict, commit_hash: str):
+        self._write_receipt(
+            self._path(DONE, receipt["reference"] + ".json"),
+            {**receipt, "commit": commit_hash})
+        claimed_path.unlink()
+
+    def release(self, claimed_path: Path, receipt: dict):
+        os.rename(
+            claimed_path,
+            self._path(PENDING, receipt["reference"] + ".json"))
+
+    def recover(self):
+        """Return receipts that were claimed by dead processes to pending"""
+        for path in self._path(CLAIMED, "").glob("*.json"):
+            pid, name = path.name.split("-", 1)
+            if int(pid) != os.getpid() and _process_exists(int(pid)):
+                continue
+            try:
+                os.rename(path, self._path(PENDING, name))
+            except FileNotFoundError:
+                pass
+
+    def remove_done(self, max_age: float) -> int:
+        """Remove receipts that were completed more than max_age seconds ago"""
+        removed = 0
+        oldest_time = time.time() - max_age
+        for path in self._path(DONE, "").glob("*.json"):
+            try:
+                if path.stat().st_mtime < oldest_time:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def lookup(self, reference: str) -> Optional[str]:
+        """Get the commit hash of a spooled record
+
+        Returns None, if the record is not yet committed. Raises a
+        KeyError, if the reference is unknown.
+        """
+        if not reference.isalnum():
+            raise KeyError(reference)
+        done_path = self._path(DONE, reference + ".json")
+        if done_path.exists():
+            with done_path.open() as f:
+                return json.load(f)["commit"]
+        if self._path(PENDING, reference + ".json").exists():
+            return None
+        if list(self._path(CLAIMED, "").glob(f"*-{reference}.json")):
+            return None
+        raise KeyError(reference)
+
+
+def _fsync(path: Path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _process_exists(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SpoolWorker(threading.Thread):
+    def __init__(self,
+                 spool: Spool,
+                 commit_function: CommitFunction,
+                 batch_size: int = 1,
+                 batch_window: float = 0.0,
+                 done_retention: float = 7 * 24 * 3600.0):
+        super().__init__(name=f"spool-worker-{spool.directory}", daemon=True)
+        self.spool = spool
+        self.commit_function = commit_function
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.done_retention = done_retention
+        self.last_cleanup: Optional[float] = None
+        self.failures = 0
+        self.wake_up = threading.Event()
+        self.stopped = threading.Event()
+
+    def run(self):
+        self.spool.recover()
+        while not self.stopped.is_set():
+            self.drain()
+            self.clean_up()
+            if self.failures:
+                # New records do not shorten the delay after a failed commit
+                self.stopped.wait(self._retry_delay())
+            elif self.wake_up.wait(poll_interval) and self.batch_window > 0:
+                # Collect records that arrive shortly after the first one
+                self.stopped.wait(self.batch_window)
+            self.wake_up.clear()
+
+    def _retry_delay(self) -> float:
+        return min(
+            maximum_retry_delay,
+            initial_retry_delay * 2 ** min(self.failures - 1, maximum_retry_exponent))
+
+    def drain(self):
+        while not self.stopped.is_set():
+            claimed = self.spool.claim_batch(self.batch_size)
+            if not claimed:
+                return
+
+            # Records of one dataset are committed together
+            batches: Dict[Tuple[str, str], List[Tuple[Path, dict]]] = dict()
+            for claimed_path, receipt in claimed:
+                key = (receipt["dataset_root"], receipt["home"])
+                batches.setdefault(key, []).append((claimed_path, receipt))
+
+            failed = False
+            for (dataset_root, home), batch in batches.items():
+                try:
+                    # Files, e.g. signature files, might be shared between records
+                    files = dict.fromkeys(
+                        Path(file)
+                        for _, receipt in batch
+                        for file in receipt["files"])
+                    commit_hash = self.commit_function(
+                        Path(dataset_root),
+                        list(files),
+                        Path(home))
+                except Exception as exception:
+                    # Only the first of consecutive failures is logged in full
+                    if self.failures == 0:
+                        print(
+                            f"spool: committing {len(batch)} record(s) failed, will retry:\n",
+                            "".join(format_exception(*sys.exc_info())),
+                            file=sys.stderr)
+                    else:
+                        print(
+                            f"spool: committing {len(batch)} record(s) failed again "
+                            f"({self.failures + 1} times in a row): {exception!r}",
+                            file=sys.stderr)
+                    for claimed_path, receipt in batch:
+                        self.spool.release(claimed_path, receipt)
+                    failed = True
+                    continue
+                for claimed_path, receipt in batch:
+                    self.spool.complete(claimed_path, receipt, commit_hash)
+                    self.update_record_index(receipt, commit_hash)
+
+            # Retry failed commits after the retry delay
+            if failed:
+                self.failures += 1
+                return
+            self.failures = 0
+
+    @staticmethod
+    def update_record_index(receipt: dict, commit_hash: str):
+        if not receipt.get("record_index"):
+            return
+        try:
+            record_index = get_record_index(Path(receipt["record_index"]))
+            for hash_value in receipt["hash_values"]:
+                record_index.set_commit_hash(hash_value, commit_hash)
+        except sqlite3.Error as sqlite_error:
+            # The record is committed, the index can be rebuilt
+            print(
+                f"spool: updating record index {receipt['record_index']} failed: {sqlite_error}",
+                file=sys.stderr)
+
+    def clean_up(self):
+        now = time.monotonic()
+        if self.last_cleanup is not None and now - self.last_cleanup < cleanup_interval:
+            return
+        self.last_cleanup = now
+        try:
+            self.spool.remove_done(self.done_retention)
+        except OSError as os_error:
+            print(f"spool: removing done receipts failed: {os_error}", file=sys.stderr)
+
+    def stop(self):
+        self.stopped.set()
+        self.wake_up.set()
+
+
+_workers: Dict[Path, SpoolWorker] = dict()
+_workers_lock = threading.Lock()
+
+
+def get_spool_worker(spool: Spool,
+                     commit_function: CommitFunction,
+                     batch_size: int = 1,
+                     batch_window: float = 0.0,
+                     done_retention: float = 7 * 24 * 3600.0
+                     ) -> SpoolWorker:
+    """Get the running worker for the spool, start one if necessary"""
+    with _workers_lock:
+        worker = _workers.get(spool.directory)
+        if worker is None or not worker.is_alive():
+            worker = SpoolWorker(spool, commit_function, batch_size, batch_window, done_retention)
+            _workers[spool.directory] = worker
+            worker.start()
+        else:
+            worker.batch_size, worker.batch_window = batch_size, batch_window
+            worker.done_retention = done_retention
+        return worker
+
+
+def get_spool_workers() -> List[SpoolWorker]:
+    with _workers_lock:
+        return list(_workers.values())
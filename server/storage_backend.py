@@ -0,0 +1,179 @@
+import os
+import subprocess
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+
+
+# HOME is a process-wide setting, but the datalad python API reads it from
+# os.environ and offers no per-call environment for the git and git-annex
+# processes that it starts. DataladApiBackend therefore sets HOME only
+# while it holds this lock. Every function of this module that reads the
+# environment holds the lock as well, i.e. it never sees the HOME of a
+# datalad-api operation. Other code in a process that uses the datalad-api
+# backend must not read HOME from os.environ.
+environ_lock = threading.Lock()
+
+
+def get_environment(**variables: str) -> Dict[str, str]:
+    """Get a copy of the process environment with the given changes"""
+    with environ_lock:
+        return {**os.environ, **variables}
+
+
+class StorageBackend:
+    """Save files to a dataset, push the dataset, and report its HEAD"""
+
+    def save(self, dataset_root: Path, files: List[Path], message: str, home: Path):
+        raise NotImplementedError
+
+    def push(self, dataset_root: Path, home: Path):
+        raise NotImplementedError
+
+    def head(self, dataset_root: Path) -> str:
+        raise NotImplementedError
+
+
+class SubprocessBackend(StorageBackend):
+    """Run the datalad and git command line tools for every operation"""
+
+    @staticmethod
+    def save_command(dataset_root: Path, files: List[Path], message: str) -> List[str]:
+        return [
+            "datalad",
+            "save",
+            "-d", str(dataset_root),
+            "-m", message,
+            *[str(file) for file in files]
+        ]
+
+    @staticmethod
+    def push_command(dataset_root: Path) -> List[str]:
+        return [
+            "datalad",
+            "push",
+            "-d", str(dataset_root),
+            "--to", "entrystore"
+        ]
+
+    @staticmethod
+    def head_command(dataset_root: Path) -> List[str]:
+        return [
+            "git",
+            "--git-dir", str(dataset_root / ".git"),
+            "rev-parse",
+            "HEAD"
+        ]
+
+    @staticmethod
+    def environment(home: Path) -> Dict[str, str]:
+        return get_environment(HOME=str(home))
+
+    def save(self, dataset_root: Path, files: List[Path], message: str, home: Path):
+        subprocess.run(
+            self.save_command(dataset_root, files, message),
+            check=True,
+            env=self.environment(home))
+
+    def push(self, dataset_root: Path, home: Path):
+        subprocess.run(
+            self.push_command(dataset_root),
+            check=True,
+            env=self.environment(home))
+
+    def head(self, dataset_root: Path) -> str:
+        return subprocess.run(
+            self.head_command(dataset_root),
+            check=True,
+            env=get_environment(),
+            stdout=subprocess.PIPE).stdout.decode().strip()
+
+
+class DataladApiBackend(StorageBackend):
+    """Use the datalad python API within the server process
+
+    Datalad is imported once per process and dataset objects are kept
+    across requests, so no new python interpreter is started for a
+    submission. All operations of this backend are serialized by
+    environ_lock, see there.
+    """
+
+    def __init__(self):
+        self.datasets: Dict[Path, object] = dict()
+
+    def _get_dataset(self, dataset_root: Path):
+        dataset = self.datasets.get(dataset_root)
+        if dataset is None:
+            # Import datalad only if this backend is used
+            from datalad.api import Dataset
+            dataset = Dataset(str(dataset_root))
+            self.datasets[dataset_root] = dataset
+        return dataset
+
+    @contextmanager
+    def _home(self, home: Path):
+        # Must be called with environ_lock held
+        original_home = os.environ.get("HOME")
+        os.environ["HOME"] = str(home)
+        try:
+            yield
+        finally:
+            if original_home is None:
+                del os.environ["HOME"]
+            else:
+                os.environ["HOME"] = original_home
+
+    def save(self, dataset_root: Path, files: List[Path], message: str, home: Path):
+        with environ_lock, self._home(home):
+            self._get_dataset(dataset_root).save(
+                path=[str(file) for file in files],
+                message=message,
+                result_renderer="disabled")
+
+    def push(self, dataset_root: Path, home: Path):
+        with environ_lock, self._home(home):
+            self._get_dataset(dataset_root).push(
+                to="entrystore",
+                result_renderer="disabled")
+
+    def head(self, dataset_root: Path) -> str:
+        with environ_lock:
+            return self._get_dataset(dataset_root).repo.get_hexsha()
+
+
+def get_sibling_url(dataset_root: Path, sibling: str = "entrystore") -> str:
+    """Get the configured URL of a sibling, without contacting it"""
+    return subprocess.run(
+        [
+            "git",
+            "--git-dir", str(dataset_root / ".git"),
+            "remote",
+            "get-url",
+            sibling
+        ],
+        check=True,
+        env=get_environment(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE).stdout.decode().strip()
+
+
+storage_backends = {
+    "subprocess": SubprocessBackend,
+    "datalad-api": DataladApiBackend
+}
+
+_backend_instances: Dict[str, StorageBackend] = dict()
+_backend_instances_lock = threading.Lock()
+
+
+def get_storage_backend(name: str) -> StorageBackend:
+    """Get the process-wide instance of the backend with the given name"""
+    with _backend_instances_lock:
+        backend = _backend_instances.get(name)
+        if backend is None:
+            if name not in storage_backends:
+                raise ValueError(f"unknown storage backend: {name}")
+            backend = storage_backends[name]()
+            _backend_instances[name] = backend
+        return backend
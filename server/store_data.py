@@ -1,22 +1,171 @@
+import base64
+import binascii
 import hashlib
+import importlib
 import json
-import locale
 import os
 import sys
+import threading
 import time
-import subprocess
+import uuid
+from functools import partial
 from pathlib import Path
 from traceback import format_exception
-from typing import Dict, List, Tuple, Union
-from urllib.parse import parse_qs
-
-from jinja2 import Environment, select_autoescape
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, unquote_to_bytes
+
+# Start of the import of this module, see startup_timing
+_import_start = time.perf_counter()
+
+# jinja2 is imported when the result template is compiled, i.e. by the
+# warm-up or by the first submission, which keeps the import light.
+if TYPE_CHECKING:
+    from jinja2 import Template
+
+# The WSGI script is deployed together with its helper modules. Make sure
+# they can be imported, independent of the python path of the server.
+if str(Path(__file__).parent) not in sys.path:
+    sys.path.insert(0, str(Path(__file__).parent))
+
+from circuit_breaker import CircuitBreaker, get_circuit_breaker, get_circuit_breakers
+from commit_lock import get_commit_lock, get_commit_locks
+from error_journal import get_error_journal, report_error
+from field_schema import compile_schema
+from batch_parser import BatchError, get_record_fields, parse_batch, read_batch
+from form_parser import FormError, FormParser, read_form
+from group_commit import get_group_committer, get_group_committers
+from metrics import metrics, request_timing, timed
+from record_index import DuplicateRecord, RecordIndex, get_record_index
+from request_log import capture_request, get_request_log
+from record_rules import compile_rules
+from push_journal import PushJournal, get_push_journal
+from push_scheduler import get_push_scheduler, get_push_schedulers
+from spool import Spool, get_spool_worker, get_spool_workers
+from storage_backend import StorageBackend, get_sibling_url, get_storage_backend
+from submission_cache import SubmissionCache, get_submission_cache
 
 
 DATASET_ROOT_KEY = "de.inm7.sfb1451.entry.dataset_root"
 HOME_KEY = "de.inm7.sfb1451.entry.home"
 TEMPLATE_DIRECTORY_KEY = "de.inm7.sfb1451.entry.templates"
 
+# If this key is set, records are written to the dataset and the commit
+# is performed by a background worker that drains the spool directory.
+# Spool references of committed records can be resolved for
+# SPOOL_RETENTION_KEY (default: 604800, i.e. seven days) seconds.
+SPOOL_DIRECTORY_KEY = "de.inm7.sfb1451.entry.spool"
+SPOOL_RETENTION_KEY = "de.inm7.sfb1451.entry.spool_retention"
+
+# Records that arrive within BATCH_WINDOW_KEY seconds, up to a maximum of
+# BATCH_SIZE_KEY records, are saved and pushed in a single commit.
+BATCH_WINDOW_KEY = "de.inm7.sfb1451.entry.batch_window"
+BATCH_SIZE_KEY = "de.inm7.sfb1451.entry.batch_size"
+
+# Name of the storage backend, i.e. "subprocess" (default) or "datalad-api".
+# The datalad-api backend sets HOME process-wide while it runs, see
+# storage_backend.environ_lock.
+STORAGE_BACKEND_KEY = "de.inm7.sfb1451.entry.storage_backend"
+
+# If this key is set to a true value, e.g. "yes", requests only wait for
+# the local commit. Commits are pushed to entrystore in the background.
+DEFERRED_PUSH_KEY = "de.inm7.sfb1451.entry.deferred_push"
+
+
+# If this key is set, compiled templates are cached in the given directory
+# and survive process restarts.
+TEMPLATE_BYTECODE_CACHE_KEY = "de.inm7.sfb1451.entry.template_bytecode_cache"
+
+result_template_name = "success.html.jinja2"
+
+# Seconds between two checks of the result template for modifications.
+template_check_interval = 2.0
+
+
+# If this key is set to a true value, signature data is stored in a
+# separate, content-addressed file that is added to git-annex. The record
+# only references the signature file.
+SIGNATURE_FILES_KEY = "de.inm7.sfb1451.entry.signature_files"
+
+signature_file_extensions = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/svg+xml": ".svg",
+}
+
+
+# If this key is set, records are only committed locally (offline mode).
+# The commits are recorded in a journal at the given path and pushed to
+# entrystore later by tools/sync_offline_records.py.
+PUSH_JOURNAL_KEY = "de.inm7.sfb1451.entry.push_journal"
+
+# If a push to entrystore fails, the record is accepted with its local
+# commit, and the push scheduler retries the push in the background. After
+# PUSH_FAILURE_THRESHOLD_KEY (default: 3) consecutive failures, requests
+# stop pushing until a background push, which is retried at least every
+# PUSH_PROBE_INTERVAL_KEY (default: 30) seconds, succeeds again.
+PUSH_FAILURE_THRESHOLD_KEY = "de.inm7.sfb1451.entry.push_failure_threshold"
+PUSH_PROBE_INTERVAL_KEY = "de.inm7.sfb1451.entry.push_probe_interval"
+
+# If this key is set, the stage durations of every request are appended
+# as a JSON line to the file at the given path.
+TIMING_LOG_KEY = "de.inm7.sfb1451.entry.timing_log"
+
+# If this key is set, unexpected errors are written to a journal at the
+# given path, see tools/search_error_journal.py, otherwise to stderr. The
+# journal is rotated when it exceeds ERROR_JOURNAL_SIZE_KEY bytes (default:
+# 10 MiB), the five most recent journals are kept.
+ERROR_JOURNAL_KEY = "de.inm7.sfb1451.entry.error_journal"
+ERROR_JOURNAL_SIZE_KEY = "de.inm7.sfb1451.entry.error_journal_size"
+
+# If this key is set, posted forms and batches are appended to a request
+# log at the given path, see request_log.py and tools/replay_requests.py.
+# The log is rotated when it exceeds REQUEST_LOG_SIZE_KEY bytes (default:
+# 100 MiB), REQUEST_LOG_BACKUPS_KEY (default: 10) older logs are kept.
+# The log contains personal data. Signatures and remarks are only logged,
+# if REQUEST_LOG_PERSONAL_DATA_KEY is set to a true value.
+REQUEST_LOG_KEY = "de.inm7.sfb1451.entry.request_log"
+REQUEST_LOG_PERSONAL_DATA_KEY = "de.inm7.sfb1451.entry.request_log_personal_data"
+REQUEST_LOG_SIZE_KEY = "de.inm7.sfb1451.entry.request_log_size"
+REQUEST_LOG_BACKUPS_KEY = "de.inm7.sfb1451.entry.request_log_backups"
+
+# If this key is set, all stored records are indexed in an SQLite
+# database at the given path, and resubmitted forms are rejected.
+RECORD_INDEX_KEY = "de.inm7.sfb1451.entry.record_index"
+
+# If this key is set, the receipts of the last SUBMISSION_CACHE_SIZE_KEY
+# (default: 1000) submissions are kept in an SQLite database at the given
+# path. A retried submission, i.e. one with the same Idempotency-Key header
+# or, without header, the same hash value, gets the original receipt and
+# is not stored again.
+SUBMISSION_CACHE_KEY = "de.inm7.sfb1451.entry.submission_cache"
+SUBMISSION_CACHE_SIZE_KEY = "de.inm7.sfb1451.entry.submission_cache_size"
+
+# If this key is set to a true value, the process validates the schema,
+# compiles the result template, checks the dataset and its sibling, and
+# opens configured databases once at process start, see warm_up(). With
+# mod_wsgi, load the script at process start with WSGIImportScript and set
+# the configuration in SFB1451_ENTRY_* environment variables, e.g.
+# SFB1451_ENTRY_WARMUP=yes, because SetEnv values are only visible to
+# requests. WARMUP_HOOK_KEY names a function, "module:function", that is
+# called with the configuration at the end of the warm-up.
+WARMUP_KEY = "de.inm7.sfb1451.entry.warmup"
+WARMUP_HOOK_KEY = "de.inm7.sfb1451.entry.warmup_hook"
+
+environment_prefix = "SFB1451_ENTRY_"
+
+
+def is_enabled(environ, key: str) -> bool:
+    return environ.get(key, "").lower() in ("1", "yes", "true", "on")
+
+
+def configuration_from_environment(environment=os.environ) -> Dict[str, str]:
+    """Read configuration keys from SFB1451_ENTRY_<NAME> variables"""
+    return {
+        "de.inm7.sfb1451.entry." + name[len(environment_prefix):].lower(): value
+        for name, value in environment.items()
+        if name.startswith(environment_prefix)
+    }
+
 
 # The following fields are required in the user input. They can either
 # come from the posted data or from the auto_fields-array.
@@ -278,43 +427,154 @@ def convert_value(value: str) -> Union[str, float, int]:
     return value
 
 
-def add_file_to_dataset(dataset_root: Path, file: Path, home: Path):
-    subprocess.run(
-        [
-            "datalad",
-            "save",
-            "-d", str(dataset_root),
-            "-m", f"adding file {file.relative_to(dataset_root)}",
-            str(file)
-        ],
-        check=True,
-        env={
-            **os.environ,
-            "HOME": str(home)
-        })
-
-    subprocess.run(
-        [
-            "datalad",
-            "push",
-            "-d", str(dataset_root),
-            "--to", "entrystore"
-        ],
-        check=True,
-        env={
-            **os.environ,
-            "HOME": str(home)
-        })
-
-    return subprocess.run(
-        [
-            "git",
-            "--git-dir", str(dataset_root / ".git"),
-            "rev-parse",
-            "HEAD"
-        ],
-        check=True,
-        stdout=subprocess.PIPE).stdout.decode().strip()
+def add_file_to_dataset(dataset_root: Path,
+                        file: Path,
+                        home: Path,
+                        backend: Optional[StorageBackend] = None,
+                        deferred_push: bool = False,
+                        push_journal: Optional[PushJournal] = None):
+    return add_files_to_dataset(dataset_root, [file], home, backend, deferred_push, push_journal)
+
+
+def get_commit_message(dataset_root: Path, files: List[Path]) -> str:
+    if len(files) == 1:
+        return f"adding file {files[0].relative_to(dataset_root)}"
+    return f"adding {len(files)} files"
+
+
+def add_files_to_dataset(dataset_root: Path,
+                         files: List[Path],
+                         home: Path,
+                         backend: Optional[StorageBackend] = None,
+                         deferred_push: bool = False,
+                         push_journal: Optional[PushJournal] = None,
+                         circuit_breaker: Optional[CircuitBreaker] = None):
+
+    backend = backend or get_storage_backend("subprocess")
+
+    # Saves from other threads and processes would race on the git index.
+    # The time that is spent waiting for the lock is reported as stage
+    # "commit-lock-wait".
+    commit_lock = get_commit_lock(dataset_root)
+    with timed("commit-lock-wait"):
+        commit_lock.acquire()
+    try:
+        with timed("save"):
+            backend.save(dataset_root, files, get_commit_message(dataset_root, files), home)
+        with timed("rev-parse"):
+            commit_hash = backend.head(dataset_root)
+    finally:
+        commit_lock.release()
+
+    if push_journal is not None:
+        # Offline mode, the commit is pushed by the sync tool
+        push_journal.append(
+            commit_hash,
+            [str(file.relative_to(dataset_root)) for file in files])
+        return commit_hash
+    if deferred_push:
+        get_push_scheduler(dataset_root, home, backend, circuit_breaker).notify(commit_hash)
+        return commit_hash
+    if circuit_breaker is None:
+        with timed("push"):
+            backend.push(dataset_root, home)
+        return commit_hash
+    if circuit_breaker.is_open():
+        # Entrystore is not reachable, the commit is pushed when it is back
+        get_push_scheduler(dataset_root, home, backend, circuit_breaker).notify(commit_hash)
+        return commit_hash
+    try:
+        with timed("push"):
+            backend.push(dataset_root, home)
+    except Exception:
+        # The record is safe in the local commit, retry in the background
+        error = "".join(format_exception(*sys.exc_info()))
+        print(
+            f"push of {dataset_root} failed, commit {commit_hash} is pushed "
+            f"in the background:\n{error}",
+            file=sys.stderr)
+        circuit_breaker.record_failure(error)
+        get_push_scheduler(dataset_root, home, backend, circuit_breaker).notify(commit_hash)
+        return commit_hash
+    circuit_breaker.record_success()
+    return commit_hash
+
+
+def get_push_circuit_breaker(environ, dataset_root: Path) -> CircuitBreaker:
+    return get_circuit_breaker(
+        dataset_root,
+        int(environ.get(PUSH_FAILURE_THRESHOLD_KEY, 3)),
+        float(environ.get(PUSH_PROBE_INTERVAL_KEY, 30.0)))
+
+
+_last_time_stamp = float("-inf")
+_time_stamp_lock = threading.Lock()
+
+
+def get_time_stamp() -> float:
+    """Get the current time, strictly increasing within the process"""
+    global _last_time_stamp
+    with _time_stamp_lock:
+        _last_time_stamp = max(time.time(), _last_time_stamp + 1e-6)
+        return _last_time_stamp
+
+
+def get_record_directory(dataset_root: Path, version: str, time_stamp: float) -> Path:
+    """Records are sharded by form version and UTC date of submission"""
+    date = time.gmtime(time_stamp)
+    return dataset_root.joinpath(
+        "input",
+        version,
+        f"{date.tm_year:04d}",
+        f"{date.tm_mon:02d}",
+        f"{date.tm_mday:02d}")
+
+
+def get_record_path(dataset_root: Path, version: str, time_stamp: float) -> Path:
+    # The random suffix keeps names unique across processes
+    directory = get_record_directory(dataset_root, version, time_stamp)
+    return directory / f"{time_stamp:.6f}-{uuid.uuid4().hex[:12]}.json"
+
+
+def decode_data_url(data_url: str) -> Tuple[str, bytes]:
+    """Get the media type and the content of a data URL"""
+    header, separator, data = data_url.partition(",")
+    if not header.startswith("data:") or not separator:
+        raise ValueError("not a data URL")
+    media_type, *parameters = header[len("data:"):].split(";")
+    if "base64" in parameters:
+        try:
+            return media_type, base64.b64decode(data, validate=True)
+        except binascii.Error as error:
+            raise ValueError(f"invalid base64 data: {error}")
+    return media_type, unquote_to_bytes(data)
+
+
+def store_signature_file(directory: Path, media_type: str, content: bytes) -> List[Path]:
+    """Write signature content to a content-addressed file in directory
+
+    Identical signatures are stored only once. The signature directory
+    contains a .gitattributes-file that adds all signature files to
+    git-annex. Returns the signature file path and the paths of all
+    files that have to be saved in the dataset.
+    """
+    extension = signature_file_extensions.get(media_type, ".bin")
+
+    signature_directory = directory / "signatures"
+    signature_directory.mkdir(parents=True, exist_ok=True)
+
+    attributes_file = signature_directory / ".gitattributes"
+    if not attributes_file.exists():
+        attributes_file.write_text("* annex.largefiles=anything\n")
+
+    signature_file = signature_directory / (hashlib.sha256(content).hexdigest() + extension)
+    if not signature_file.exists():
+        # Threads of a process might write the same signature concurrently
+        temp_file = signature_directory / f".{signature_file.name}.{uuid.uuid4().hex}.tmp"
+        temp_file.write_bytes(content)
+        os.replace(temp_file, signature_file)
+
+    return [signature_file, attributes_file]
 
 
 def checkbox_message(value):
@@ -366,18 +626,79 @@ def date_message(year, month, day):
     ])
 
 
-def create_result_page(commit_hash: str,
+class _CachedTemplate:
+    def __init__(self, template: "Template", mtime: float, checked: float):
+        self.template = template
+        self.mtime = mtime
+        self.checked = checked
+
+
+# Compiled result templates, keyed by template directory and bytecode
+# cache directory.
+_template_cache: Dict[Tuple[Path, Optional[Path]], _CachedTemplate] = dict()
+_template_cache_lock = threading.Lock()
+
+
+def get_result_template(templates_directory: Path,
+                        bytecode_cache_directory: Optional[Path] = None
+                        ) -> "Template":
+    """Get the compiled result template
+
+    The template is compiled once per process. It is recompiled, if the
+    modification time of the template file changed. The modification
+    time is checked at most every template_check_interval seconds.
+    """
+    key = (templates_directory, bytecode_cache_directory)
+    now = time.monotonic()
+    cached_template = _template_cache.get(key)
+    if cached_template and now - cached_template.checked < template_check_interval:
+        return cached_template.template
+
+    with _template_cache_lock:
+        mtime = (templates_directory / result_template_name).stat().st_mtime
+        cached_template = _template_cache.get(key)
+        if cached_template is None or cached_template.mtime != mtime:
+            from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+            bytecode_cache = None
+            if bytecode_cache_directory is not None:
+                bytecode_cache_directory.mkdir(parents=True, exist_ok=True)
+                bytecode_cache = FileSystemBytecodeCache(str(bytecode_cache_directory))
+            environment = Environment(
+                autoescape=True,
+                loader=FileSystemLoader(str(templates_directory)),
+                bytecode_cache=bytecode_cache,
+                auto_reload=False)
+            cached_template = _CachedTemplate(
+                environment.get_template(result_template_name), mtime, now)
+            _template_cache[key] = cached_template
+        cached_template.checked = now
+        return cached_template.template
+
+
+def get_reference(commit_hash: Optional[str],
+                  time_stamp: float,
+                  spool_reference: Optional[str] = None
+                  ) -> str:
+    """The reference under which a stored record can be found"""
+    if spool_reference is None:
+        return f"{time_stamp}-{commit_hash}"
+    return f"{time_stamp}-spool-{spool_reference}"
+
+
+def create_result_page(commit_hash: Optional[str],
                        time_stamp: float,
                        json_top_data: dict,
-                       templates_directory: Path):
+                       templates_directory: Path,
+                       spool_reference: Optional[str] = None,
+                       bytecode_cache_directory: Optional[Path] = None):
 
-    jinja_template_path = templates_directory / "success.html.jinja2"
-    jinja_template = Environment(autoescape=select_autoescape()).from_string(
-        jinja_template_path.read_text(encoding="utf-8")
-    )
+    jinja_template = get_result_template(
+        templates_directory,
+        bytecode_cache_directory)
     return jinja_template.render(
         sub_project="Z03",
-        reference=f"{time_stamp}-{commit_hash}",
+        reference=get_reference(commit_hash, time_stamp, spool_reference),
+        spool_reference=spool_reference,
         record=json_top_data["data"],
         date_message=date_message,
         disease_message=disease_message,
@@ -645,6 +966,242 @@ field_value_fetcher = {
 }
 
 
+# Value ranges of numeric fields, as defined by the min- and max-attributes
+# and the options of the entry form. Empty values are not checked.
+field_ranges = {
+    "patient-year-first-symptom": (1900, 2050),
+    "patient-month-first-symptom": (1, 12),
+    "patient-day-first-symptom": (1, 31),
+    "patient-year-diagnosis": (1900, 2050),
+    "patient-month-diagnosis": (1, 12),
+    "patient-day-diagnosis": (1, 31),
+    "laterality-quotient": (-100, 100),
+    "maximum-ftf-left": (0.0, 10.0),
+    "maximum-ftf-right": (0.0, 10.0),
+    "maximum-gs-left": (0.0, 160.0),
+    "maximum-gs-right": (0.0, 160.0),
+    "purdue-pegboard-left": (0, 25),
+    "purdue-pegboard-right": (0, 25),
+    "turn-cards-left": (0.0, 150.0),
+    "turn-cards-right": (0.0, 150.0),
+    "small-things-left": (0.0, 150.0),
+    "small-things-right": (0.0, 150.0),
+    "simulated-feeding-left": (0.0, 150.0),
+    "simulated-feeding-right": (0.0, 150.0),
+    "checkers-left": (0.0, 150.0),
+    "checkers-right": (0.0, 150.0),
+    "large-light-things-left": (0.0, 150.0),
+    "large-light-things-right": (0.0, 150.0),
+    "large-heavy-things-left": (0.0, 150.0),
+    "large-heavy-things-right": (0.0, 150.0),
+    "arat-left": (0, 57),
+    "arat-right": (0, 57),
+    "tug-executed": (0, 60),
+    "tug-imagined": (0, 60),
+    "go-nogo-block-count": (1, 6),
+    "go-nogo-total-errors": (0, 360),
+    "go-nogo-wrong-errors": (0, 360),
+    "go-nogo-recognized-errors": (0, 360),
+    "go-nogo-correct-answer-time": (50.0, 1200.0),
+    "go-nogo-recognized-error-time": (50.0, 1000.0),
+    "kas-pantomime-bukko-facial": (0, 20),
+    "kas-pantomime-arm-hand": (0, 20),
+    "kas-imitation-bukko-facial": (0, 20),
+    "kas-imitation-arm-hand": (0, 20),
+    "kopss-orientation": (0, 9),
+    "kopss-speech": (0.0, 18.0),
+    "kopss-praxie": (0, 18),
+    "kopss-visual-spatial-performance": (0, 17),
+    "kopss-calculating": (0, 8),
+    "kopss-executive-performance": (0.0, 18.0),
+    "kopss-memory": (0, 20),
+    "kopss-affect": (0, 9),
+    "kopss-behavior-observation": (0, 9),
+    "acl-k-loud-reading": (0.0, 9.0),
+    "acl-k-color-form-test": (0, 12),
+    "acl-k-supermarket-task": (0, 10),
+    "acl-k-communication-ability": (0, 9),
+    "bdi-ii-score": (0, 63),
+    "madrs-score": (0, 60),
+    "demtect-wordlist": (0, 3),
+    "demtect-convert-numbers": (0, 3),
+    "demtect-supermarket-task": (0, 4),
+    "demtect-numbers-reverse": (0, 3),
+    "demtect-wordlist-recall": (0, 5),
+    "time-tmt-a": (0.0, 150.0),
+    "time-tmt-b": (0.0, 300.0),
+    "mrs-score": (0, 6),
+    "euroqol-vas": (0, 100),
+    "isced-value": (0, 6),
+    "psqi-sleep-quality": (0, 3),
+    "psqi-sleep-latency": (0, 3),
+    "psqi-sleep-duration": (0, 3),
+    "psqi-sleep-efficiency": (0, 3),
+    "psqi-sleep-disturbance": (0, 3),
+    "psqi-meds": (0, 3),
+    "psqi-day-dysfunction": (0, 3),
+}
+
+
+# Fields whose maximum depends on another field, i.e. (name, unit field,
+# maximum per unit). The entry form allows 60 go/nogo errors per block.
+per_unit_maxima = [
+    ("go-nogo-total-errors", "go-nogo-block-count", 60),
+    ("go-nogo-wrong-errors", "go-nogo-block-count", 60),
+    ("go-nogo-recognized-errors", "go-nogo-block-count", 60),
+]
+
+
+birth_date_fields = ("date-of-birth",)
+test_date_fields = ("date-of-test",)
+first_symptom_date_fields = (
+    "patient-year-first-symptom",
+    "patient-month-first-symptom",
+    "patient-day-first-symptom")
+diagnosis_date_fields = (
+    "patient-year-diagnosis",
+    "patient-month-diagnosis",
+    "patient-day-diagnosis")
+
+# Dates that must not be in the wrong order, see validateDates in entry.html.
+# Date components that are not known are not compared.
+date_order_rules = [
+    (birth_date_fields, first_symptom_date_fields,
+     "The date of birth must be before the date of the first symptoms"),
+    (birth_date_fields, diagnosis_date_fields,
+     "The date of birth must be before the date of the diagnosis"),
+    (birth_date_fields, test_date_fields,
+     "The date of birth must be before the date of the test"),
+    (first_symptom_date_fields, diagnosis_date_fields,
+     "The date of the first symptoms must be before the date of the diagnosis"),
+    (first_symptom_date_fields, test_date_fields,
+     "The date of the first symptoms must be before the date of the test"),
+    (diagnosis_date_fields, test_date_fields,
+     "The date of the diagnosis must be before the date of the test"),
+]
+
+
+# Fields that must not be larger than the sum of other fields, see
+# validateGoNogoErrors in entry.html
+sum_limit_rules = [
+    ("go-nogo-recognized-errors", ["go-nogo-total-errors", "go-nogo-wrong-errors"],
+     "go-nogo-recognized-errors must not be larger than the sum of "
+     "go-nogo-total-errors and go-nogo-wrong-errors"),
+]
+
+
+# Sums that the entry form computes, see kasSum etc. in entry.html
+sum_fields = {
+    "kas-sum": [
+        "kas-pantomime-bukko-facial",
+        "kas-pantomime-arm-hand",
+        "kas-imitation-bukko-facial",
+        "kas-imitation-arm-hand",
+    ],
+    "kopss-sum": [
+        "kopss-orientation",
+        "kopss-speech",
+        "kopss-praxie",
+        "kopss-visual-spatial-performance",
+        "kopss-calculating",
+        "kopss-executive-performance",
+        "kopss-memory",
+    ],
+    "acl-k-sum": [
+        "acl-k-loud-reading",
+        "acl-k-color-form-test",
+        "acl-k-supermarket-task",
+        "acl-k-communication-ability",
+    ],
+    "demtect-sum": [
+        "demtect-wordlist",
+        "demtect-convert-numbers",
+        "demtect-supermarket-task",
+        "demtect-numbers-reverse",
+        "demtect-wordlist-recall",
+    ],
+    "psqi-sum": [
+        "psqi-sleep-quality",
+        "psqi-sleep-latency",
+        "psqi-sleep-duration",
+        "psqi-sleep-efficiency",
+        "psqi-sleep-disturbance",
+        "psqi-meds",
+        "psqi-day-dysfunction",
+    ],
+}
+
+# The laterality checks of the entry form (validateLaterality) can be
+# overridden by switches that are not posted, they are not checked here.
+
+
+# Fields that the entry form posts, but that are not stored
+ignored_form_fields = [
+    "ftf-incorrectly-executed",
+    "kas-sum",
+    "kopss-sum",
+    "acl-k-sum",
+    "demtect-sum",
+    "psqi-sum",
+]
+
+
+# All fields that may be posted. Other fields are rejected.
+known_form_fields = {
+    *required_fields,
+    *required_patient_fields,
+    *auto_fields,
+    *field_value_fetcher,
+    *[name + "-valid" for name in optional_checkbox_fields],
+    "hashed-string",
+    "hash-value",
+    "signature-data",
+    *ignored_form_fields,
+}
+
+
+# Size limits in bytes of url-encoded data. Requests that exceed a limit
+# are rejected before the rest of the body is read.
+default_field_size_limit = 16 * 1024
+field_size_limits = {
+    "hashed-string": 64 * 1024,
+    "signature-data": 2 * 1024 * 1024,
+}
+request_body_size_limit = 4 * 1024 * 1024
+
+# Limits of batches, i.e. of JSON arrays or newline-delimited JSON of form
+# records that are posted to ".../batch", see store_batch()
+batch_record_limit = 1000
+batch_body_size_limit = 64 * 1024 * 1024
+
+
+def create_form_parser() -> FormParser:
+    return FormParser(
+        known_form_fields,
+        field_size_limits,
+        default_field_size_limit,
+        request_body_size_limit)
+
+
+# All field tables compiled into one schema, see field_schema.py
+field_schema = compile_schema(
+    required_fields,
+    required_patient_fields,
+    auto_fields,
+    optional_checkbox_fields,
+    hashed_content_fields,
+    field_value_fetcher)
+
+
+# All rule tables compiled into one rule set, see record_rules.py
+record_rules = compile_rules(
+    field_ranges,
+    per_unit_maxima,
+    date_order_rules,
+    sum_limit_rules,
+    sum_fields)
+
+
 def get_field_value(fields, field_name):
     value = fields[field_name][0]
     if field_name in field_value_fetcher:
@@ -699,106 +1256,471 @@ def create_missing_key_result(missing_keys: List[str]):
         "\n"])
 
 
-def application(environ, start_response):
+def create_rule_violation_result(messages: List[str]):
+    return create_bad_request_result([
+        "The following values are out of range or inconsistent:\n",
+        *[f"{message}\n" for message in messages]])
+
 
+def get_content_length(environ) -> int:
     try:
-        request_body_size = int(environ.get("CONTENT_LENGTH", 0))
-        request_body = environ["wsgi.input"].read(request_body_size).decode("utf-8")
-    except (ValueError, KeyError):
-        request_body_size = 0
-        request_body = ""
+        return int(environ.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return 0
+
 
+def application(environ, start_response):
+
+    form_parser = create_form_parser()
     try:
-        status, content_type, content = protected_application(environ, request_body)
+        with request_timing() as timing, timed("request"):
+            status, content_type, content = protected_application(environ, form_parser)
     except:
-        status = "500 INTERNAL ERROR"
-        content_type = "text/plain; charset=utf-8"
-        content_strings = [
-            "An unexpected error occured during processing. If this error\n",
-            "persists, please send an email with the following information\n",
-            "to <c.moench@fz-juelich.de> or <m.szczepanik@fz-juelich.de>:\n",
-            "\n",
-            "--------\n",
-            "1. Stacktrace:\n",
-            "".join(format_exception(*sys.exc_info())),
-            "2. Environment:\n",
-            str(environ),
-            "\n",
-            f"3. WSGI input data ({request_body_size}):\n",
-            request_body,
-            "\n",
-            "--------\n",
-            "4. Locale encoding:\n",
-            locale.getencoding(),
-            "\n",
-            "--------\n",
-        ]
-        content = encode_result_strings(content_strings)
+        status, content_type, content = create_internal_error_result(environ, form_parser)
 
     content_length = sum([len(line) for line in content])
     response_headers = [
         ('Content-type', content_type),
         ('Content-Length', str(content_length))]
 
+    record_response(environ, status, timing)
+
     start_response(status, response_headers)
     return content
 
 
-def protected_application(environ, request_body):
+def create_internal_error_result(environ, form_parser: FormParser):
+    """Report the exception that is currently handled
+
+    The exception, environ, and the received fields are written to the
+    error journal. The response only contains the error ID.
+    """
+    error_id = report_error(
+        (
+            get_error_journal(
+                Path(environ[ERROR_JOURNAL_KEY]),
+                int(environ.get(ERROR_JOURNAL_SIZE_KEY, 10 * 1024 * 1024)))
+            if environ.get(ERROR_JOURNAL_KEY)
+            else None
+        ),
+        environ,
+        form_parser.fields)
+    content_strings = [
+        "An unexpected error occured during processing. If this error\n",
+        "persists, please send an email with the following error ID\n",
+        "to <c.moench@fz-juelich.de> or <m.szczepanik@fz-juelich.de>:\n",
+        "\n",
+        f"error ID: {error_id} ({sys.exc_info()[0].__name__})\n",
+    ]
+    return (
+        "500 INTERNAL ERROR",
+        "text/plain; charset=utf-8",
+        encode_result_strings(content_strings))
+
+
+# Durations in seconds of the import of this module, of the warm-up
+# stages, and of the first request and the first submission of the process
+startup_timing: Dict[str, float] = dict()
+# Problems that the warm-up found, e.g. a dataset without sibling
+startup_problems: List[str] = []
+_startup_lock = threading.Lock()
+
 
+def record_first_request(environ, timing: Dict[str, float]):
+    if "first-submission" in startup_timing:
+        return
+    names = ["first-request"]
+    if environ.get("REQUEST_METHOD") == "POST":
+        names.append("first-submission")
+    with _startup_lock:
+        for name in names:
+            if name not in startup_timing:
+                startup_timing[name] = timing.get("request", 0.0)
+
+
+def record_response(environ, status: str, timing: Dict[str, float]):
+    metrics.count_response(status)
+    record_first_request(environ, timing)
+    if environ.get(TIMING_LOG_KEY):
+        write_timing_log(Path(environ[TIMING_LOG_KEY]), environ, status, timing)
+
+
+_timing_log_lock = threading.Lock()
+
+
+def write_timing_log(log_path: Path, environ, status: str, timing: Dict[str, float]):
+    entry = {
+        "time": time.time(),
+        "method": environ.get("REQUEST_METHOD"),
+        "path": environ.get("PATH_INFO", ""),
+        "status": int(status.split(" ", 1)[0]),
+        "stages": {stage: round(duration, 6) for stage, duration in timing.items()},
+    }
+    with _timing_log_lock, log_path.open("a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+# /status and /metrics are not protected, they identify datasets by
+# numbers in the order in which the process first reported them. The
+# server log maps the numbers to dataset paths.
+_dataset_numbers: Dict[Path, int] = dict()
+_dataset_numbers_lock = threading.Lock()
+
+
+def get_dataset_number(dataset_root: Path) -> int:
+    with _dataset_numbers_lock:
+        number = _dataset_numbers.get(dataset_root)
+        if number is None:
+            number = len(_dataset_numbers) + 1
+            _dataset_numbers[dataset_root] = number
+            print(f"dataset {number}: {dataset_root}", file=sys.stderr)
+        return number
+
+
+def create_metrics_result():
+    lines = metrics.render()
+    lines.extend([
+        "# HELP sfb1451_entry_startup_seconds Duration of the import, the warm-up stages, and the first requests\n",
+        "# TYPE sfb1451_entry_startup_seconds gauge\n",
+        *[
+            f'sfb1451_entry_startup_seconds{{phase="{phase}"}} {duration}\n'
+            for phase, duration in list(startup_timing.items())
+        ],
+        "# HELP sfb1451_entry_startup_problems Number of problems that the warm-up found\n",
+        "# TYPE sfb1451_entry_startup_problems gauge\n",
+        f"sfb1451_entry_startup_problems {len(startup_problems)}\n",
+        "# HELP sfb1451_entry_push_backlog Number of local commits that are not yet pushed\n",
+        "# TYPE sfb1451_entry_push_backlog gauge\n",
+        *[
+            f'sfb1451_entry_push_backlog{{dataset="{get_dataset_number(scheduler.dataset_root)}"}} {scheduler.backlog()}\n'
+            for scheduler in get_push_schedulers()
+        ],
+        "# HELP sfb1451_entry_commit_lock_waiting Number of threads that wait for the commit lock\n",
+        "# TYPE sfb1451_entry_commit_lock_waiting gauge\n",
+        *[
+            f'sfb1451_entry_commit_lock_waiting{{dataset="{get_dataset_number(commit_lock.dataset_root)}"}} {commit_lock.waiting_count()}\n'
+            for commit_lock in get_commit_locks()
+        ],
+        "# HELP sfb1451_entry_push_circuit_open Whether pushes to entrystore are skipped\n",
+        "# TYPE sfb1451_entry_push_circuit_open gauge\n",
+        *[
+            f'sfb1451_entry_push_circuit_open{{dataset="{get_dataset_number(circuit_breaker.dataset_root)}"}} {int(circuit_breaker.is_open())}\n'
+            for circuit_breaker in get_circuit_breakers()
+        ],
+        "# HELP sfb1451_entry_push_circuit_trips_total Number of times the push circuit breaker opened\n",
+        "# TYPE sfb1451_entry_push_circuit_trips_total counter\n",
+        *[
+            f'sfb1451_entry_push_circuit_trips_total{{dataset="{get_dataset_number(circuit_breaker.dataset_root)}"}} {circuit_breaker.trips}\n'
+            for circuit_breaker in get_circuit_breakers()
+        ]
+    ])
+    return (
+        "200 OK",
+        "text/plain; version=0.0.4; charset=utf-8",
+        encode_result_strings(lines))
+
+
+def stop_background_workers(timeout: Optional[float] = None):
+    """Stop all background threads after pending work is done
+
+    Spool workers are stopped first, spooled records that are not yet
+    committed stay in the spool. Group committers commit their pending
+    files, and push schedulers push all pending commits, before they stop.
+    """
+    for workers in (get_spool_workers, get_group_committers, get_push_schedulers):
+        stopped_workers = workers()
+        for worker in stopped_workers:
+            worker.stop()
+        for worker in stopped_workers:
+            worker.join(timeout)
+
+
+def create_spool_status_result(spool: Spool, reference: str):
+    try:
+        commit_hash = spool.lookup(reference)
+    except KeyError:
+        return (
+            "404 NOT FOUND",
+            "text/plain; charset=utf-8",
+            encode_result_strings([f"Unknown spool reference: {reference}\n"]))
+    return (
+        "200 OK",
+        "text/plain; charset=utf-8",
+        encode_result_strings([
+            "pending\n" if commit_hash is None else f"{commit_hash}\n"]))
+
+
+def describe_age(time_stamp: Optional[float]) -> Optional[str]:
+    return None if time_stamp is None else f"{time.time() - time_stamp:.0f} s ago"
+
+
+def create_status_result():
+    """Report state, counts, and ages of the push machinery
+
+    /status is not protected, it does not contain dataset paths or error
+    messages. Datasets are numbered as in /metrics. Problems and push
+    errors are written to the server log.
+    """
+    lines = [
+        "startup:\n",
+        *[
+            f"  {phase}: {duration:.6f} s\n"
+            for phase, duration in list(startup_timing.items())
+        ],
+        f"  problems: {len(startup_problems)}\n"]
+    for circuit_breaker in get_circuit_breakers():
+        lines.extend([
+            f"push circuit breaker {get_dataset_number(circuit_breaker.dataset_root)}:\n",
+            f"  state: {circuit_breaker.state()}\n",
+            f"  consecutive failures: {circuit_breaker.failures}\n",
+            f"  opened: {describe_age(circuit_breaker.opened_at)}\n"])
+    for scheduler in get_push_schedulers():
+        lines.extend([
+            f"push scheduler {get_dataset_number(scheduler.dataset_root)}:\n",
+            f"  backlog: {scheduler.backlog()}\n",
+            f"  failures: {scheduler.failures}\n",
+            f"  last push: {describe_age(scheduler.last_push)}\n"])
+    return (
+        "200 OK",
+        "text/plain; charset=utf-8",
+        encode_result_strings(lines))
+
+
+def write_record_files(dataset_root: Path,
+                       output_file: Path,
+                       result_object: dict,
+                       signature: Optional[Tuple[str, bytes]]
+                       ) -> List[Path]:
+    """Write the record and signature files, return the files to commit"""
+    with timed("write"):
+        signature_files = []
+        if signature is not None:
+            # Signatures are shared between all records of a form version
+            signature_files = store_signature_file(
+                dataset_root / "input" / result_object["source"]["version"],
+                *signature)
+            result_object["source"]["signature-file"] = str(
+                signature_files[0].relative_to(dataset_root))
+
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        with output_file.open("x") as f:
+            json.dump(result_object, f)
+
+    return [output_file, *signature_files]
+
+
+def store_record(environ,
+                 dataset_root: Path,
+                 home: Path,
+                 output_file: Path,
+                 result_object: dict,
+                 signature: Optional[Tuple[str, bytes]]
+                 ) -> Tuple[Optional[str], Optional[str]]:
+    """Write the record and signature files and commit them
+
+    Returns the commit hash, or the spool reference, if the commit is
+    performed by the spool worker.
+    """
+    files = write_record_files(dataset_root, output_file, result_object, signature)
+    return commit_files(
+        environ, dataset_root, home, files,
+        [result_object["source"]["hash-value"]])
+
+
+def commit_files(environ,
+                 dataset_root: Path,
+                 home: Path,
+                 files: List[Path],
+                 hash_values: List[str]
+                 ) -> Tuple[Optional[str], Optional[str]]:
+    """Commit written files in the way that environ configures
+
+    Returns the commit hash, or the spool reference, if the commit is
+    performed by the spool worker. The spool worker stores the commit
+    hash of the records with the given hash values in the record index.
+    """
+    batch_window = float(environ.get(BATCH_WINDOW_KEY, 0))
+    batch_size = int(environ.get(BATCH_SIZE_KEY, 1))
+    backend = get_storage_backend(environ.get(STORAGE_BACKEND_KEY, "subprocess"))
+    deferred_push = is_enabled(environ, DEFERRED_PUSH_KEY)
+    push_journal = (
+        get_push_journal(Path(environ[PUSH_JOURNAL_KEY]))
+        if environ.get(PUSH_JOURNAL_KEY)
+        else None)
+    commit_function = partial(
+        add_files_to_dataset,
+        backend=backend,
+        deferred_push=deferred_push,
+        push_journal=push_journal,
+        circuit_breaker=get_push_circuit_breaker(environ, dataset_root))
+
+    if environ.get(SPOOL_DIRECTORY_KEY):
+        # Let the spool worker commit the record, return a spool reference
+        spool = Spool(Path(environ[SPOOL_DIRECTORY_KEY]))
+        with timed("spool"):
+            spool_reference = spool.enqueue(
+                dataset_root, files, home,
+                Path(environ[RECORD_INDEX_KEY]) if environ.get(RECORD_INDEX_KEY) else None,
+                hash_values)
+        get_spool_worker(
+            spool, commit_function,
+            batch_size, batch_window,
+            float(environ.get(SPOOL_RETENTION_KEY, 7 * 24 * 3600))).wake_up.set()
+        return None, spool_reference
+
+    if batch_window > 0 or batch_size > 1:
+        committer = get_group_committer(
+            dataset_root, home, commit_function,
+            batch_window, batch_size)
+        # Includes the time that is spent waiting for the batch
+        with timed("group-commit"):
+            return committer.commit(files), None
+
+    return commit_function(dataset_root, files, home), None
+
+
+def create_duplicate_record_result(entry: dict):
+    return (
+        "409 CONFLICT",
+        "text/plain; charset=utf-8",
+        encode_result_strings([
+            "This form was already stored with the reference:\n",
+            f"{entry['time_stamp']}-{entry['commit_hash'] or 'pending'}\n"]))
+
+
+def create_cached_submission_result(entry: dict, hash_value: str):
+    if entry["hash_value"] != hash_value:
+        return (
+            "422 UNPROCESSABLE ENTITY",
+            "text/plain; charset=utf-8",
+            encode_result_strings([
+                "The idempotency key was already used for a different form\n"]))
+    if entry["status"] is None:
+        return (
+            "409 CONFLICT",
+            "text/plain; charset=utf-8",
+            encode_result_strings([
+                "This form is still being stored, please retry later\n"]))
+    return entry["status"], entry["content_type"], [entry["body"]]
+
+
+class Submission:
+    """A validated submission that is ready to be stored"""
+
+    __slots__ = (
+        "dataset_root",
+        "home",
+        "output_file",
+        "result_object",
+        "signature",
+        "hash_value",
+        "record_index",
+        "submission_cache",
+        "idempotency_key",
+    )
+
+    def __init__(self,
+                 dataset_root: Path,
+                 home: Path,
+                 output_file: Path,
+                 result_object: dict,
+                 signature: Optional[Tuple[str, bytes]],
+                 hash_value: str,
+                 record_index: Optional[RecordIndex],
+                 submission_cache: Optional[SubmissionCache] = None,
+                 idempotency_key: Optional[str] = None):
+        self.dataset_root = dataset_root
+        self.home = home
+        self.output_file = output_file
+        self.result_object = result_object
+        self.signature = signature
+        self.hash_value = hash_value
+        self.record_index = record_index
+        self.submission_cache = submission_cache
+        self.idempotency_key = idempotency_key
+
+    def discard(self):
+        # The record was not stored, allow a resubmission
+        if self.record_index is not None:
+            self.record_index.remove(self.hash_value)
+        if self.submission_cache is not None:
+            self.submission_cache.release(self.idempotency_key)
+
+
+def route_request(environ):
+    """Handle all requests except for submissions
+
+    Returns None for POST requests, which are submissions.
+    """
     request_method = environ["REQUEST_METHOD"]
-    if request_method != "POST":
-        return create_bad_request_result(["Only POST is supported\n"])
 
-    dataset_root = Path(environ[DATASET_ROOT_KEY])
-    home = Path(environ[HOME_KEY])
-    template_directory = Path(environ[TEMPLATE_DIRECTORY_KEY])
+    if request_method == "GET" and environ.get("PATH_INFO", "").endswith("/status"):
+        return create_status_result()
 
-    # Parse data and check value structure
-    received_data = parse_qs(request_body)
-    for value in received_data.values():
-        if not isinstance(value, list) or not len(value) == 1:
-            raise ValueError(f"expected list of length one, got: {repr(value)}")
+    if request_method == "GET" and environ.get("PATH_INFO", "").endswith("/metrics"):
+        return create_metrics_result()
 
-    # Add auto fields to the received data
-    add_auto_fields(received_data)
+    # Resolve spool references to commit hashes
+    if request_method == "GET" and environ.get(SPOOL_DIRECTORY_KEY):
+        query = parse_qs(environ.get("QUERY_STRING", ""))
+        if "spool-reference" in query:
+            return create_spool_status_result(
+                Spool(Path(environ[SPOOL_DIRECTORY_KEY])),
+                query["spool-reference"][0])
 
-    # Correct the optional checkbox field in the received data
-    correct_optional_checkbox_fields(received_data)
+    if request_method != "POST":
+        return create_bad_request_result(["Only POST is supported\n"])
+
+    return None
 
-    # Read the mandatory keys into the result dictionary
-    entered_data_object, missing_keys = read_mandatory_fields(
-        required_fields,
-        received_data)
 
-    if missing_keys:
-        return create_missing_key_result(missing_keys)
+def prepare_submission(environ, received_data: Dict[str, List[str]]):
+    """Validate the received data and create the record
 
-    if entered_data_object["subject-group"] == "patient":
-        entered_patient_data, missing_patient_keys = read_mandatory_fields(
-            required_patient_fields,
-            received_data)
+    Returns a Submission, or the result that rejects the request.
+    """
+    dataset_root = Path(environ[DATASET_ROOT_KEY])
+    home = Path(environ[HOME_KEY])
 
-        entered_data_object.update(entered_patient_data)
-        missing_keys.extend(missing_patient_keys)
+    # Read, type-convert, and hash all fields in a single pass
+    with timed("fields"):
+        schema_result = field_schema.process(received_data)
+    if schema_result.missing_keys:
+        return create_missing_key_result(schema_result.missing_keys)
+    entered_data_object = schema_result.record
 
-    if missing_keys:
-        return create_missing_key_result(missing_keys)
+    # Reject records with out-of-range or inconsistent values before
+    # they are committed
+    with timed("rules"):
+        rule_violations = record_rules.check(entered_data_object, received_data)
+    if rule_violations:
+        return create_rule_violation_result(rule_violations)
 
     # Check the hash value
-    local_hash_string = get_canonic_content_string(received_data)
+    with timed("hash"):
+        local_hash_string = schema_result.hash_string
+        local_hash_value = hashlib.sha256(local_hash_string.encode()).hexdigest()
     if local_hash_string != received_data["hashed-string"][0]:
         return create_bad_request_result([
             "Local hash input-string does not match submitted values\n",
             "LOCAL: " + local_hash_string + "\n",
             "SENT:  " + received_data["hashed-string"][0] + "\n"])
 
-    local_hash_value = hashlib.sha256(local_hash_string.encode()).hexdigest()
     if local_hash_value != received_data["hash-value"][0]:
         return create_bad_request_result([
             "Server side hash value does not match submitted hash value\n"])
 
-    time_stamp = time.time()
+    signature_data = received_data.get("signature-data", auto_fields["signature-data"])[0]
+
+    signature = None
+    if signature_data != "" and is_enabled(environ, SIGNATURE_FILES_KEY):
+        try:
+            signature = decode_data_url(signature_data)
+        except ValueError as value_error:
+            return create_bad_request_result([
+                f"signature-data is not a valid data URL: {value_error}\n"])
+
+    time_stamp = get_time_stamp()
 
     result_object = {
         "source": {
@@ -809,24 +1731,371 @@ def protected_application(environ, request_body):
             "hash-value": received_data["hash-value"][0],
             "signature-data": (
                 None
-                if received_data["signature-data"][0] == ""
-                else received_data["signature-data"][0]
+                if signature_data == "" or signature is not None
+                else signature_data
             )
         },
         "data": entered_data_object
     }
 
-    directory = dataset_root / "input" / result_object["source"]["version"]
-    directory.mkdir(parents=True, exist_ok=True)
+    output_file = get_record_path(
+        dataset_root,
+        received_data["form-data-version"][0],
+        time_stamp)
+
+    # Answer retried submissions with the original receipt
+    submission_cache = None
+    idempotency_key = environ.get("HTTP_IDEMPOTENCY_KEY") or local_hash_value
+    if environ.get(SUBMISSION_CACHE_KEY):
+        submission_cache = get_submission_cache(
+            Path(environ[SUBMISSION_CACHE_KEY]),
+            int(environ.get(SUBMISSION_CACHE_SIZE_KEY, 1000)))
+        with timed("submission-cache"):
+            cache_entry = submission_cache.claim(idempotency_key, local_hash_value)
+        if cache_entry is not None:
+            return create_cached_submission_result(cache_entry, local_hash_value)
+
+    # Reject resubmitted forms before anything is written
+    record_index = None
+    if environ.get(RECORD_INDEX_KEY):
+        record_index = get_record_index(Path(environ[RECORD_INDEX_KEY]))
+        try:
+            record_index.add(
+                str(output_file.relative_to(dataset_root)),
+                result_object)
+        except DuplicateRecord as duplicate_record:
+            if submission_cache is not None:
+                submission_cache.release(idempotency_key)
+            return create_duplicate_record_result(duplicate_record.entry)
+
+    return Submission(
+        dataset_root,
+        home,
+        output_file,
+        result_object,
+        signature,
+        local_hash_value,
+        record_index,
+        submission_cache,
+        idempotency_key)
+
+
+def create_submission_result(environ,
+                             submission: Submission,
+                             commit_hash: Optional[str],
+                             spool_reference: Optional[str]):
+
+    if submission.record_index is not None and commit_hash is not None:
+        submission.record_index.set_commit_hash(submission.hash_value, commit_hash)
+
+    bytecode_cache_directory = environ.get(TEMPLATE_BYTECODE_CACHE_KEY)
+    try:
+        with timed("render"):
+            result_message = create_result_page(
+                commit_hash,
+                submission.result_object["source"]["time_stamp"],
+                submission.result_object,
+                Path(environ[TEMPLATE_DIRECTORY_KEY]),
+                spool_reference=spool_reference,
+                bytecode_cache_directory=(
+                    Path(bytecode_cache_directory)
+                    if bytecode_cache_directory
+                    else None))
+    except:
+        if submission.submission_cache is not None:
+            submission.submission_cache.release(submission.idempotency_key)
+        raise
+
+    result = (
+        "200 OK",
+        "text/html; charset=utf-8",
+        encode_result_strings([result_message]))
+    if submission.submission_cache is not None:
+        submission.submission_cache.complete(
+            submission.idempotency_key,
+            result[0],
+            result[1],
+            b"".join(result[2]))
+    return result
+
+
+def log_request(environ, content: dict):
+    """Capture a parsed submission, if a request log is configured"""
+    if environ.get(REQUEST_LOG_KEY):
+        with timed("request-log"):
+            capture_request(
+                get_request_log(
+                    Path(environ[REQUEST_LOG_KEY]),
+                    int(environ.get(REQUEST_LOG_SIZE_KEY, 100 * 1024 * 1024)),
+                    int(environ.get(REQUEST_LOG_BACKUPS_KEY, 10))),
+                environ,
+                content,
+                is_enabled(environ, REQUEST_LOG_PERSONAL_DATA_KEY))
+
+
+def is_batch_request(environ) -> bool:
+    return environ.get("PATH_INFO", "").endswith("/batch")
+
+
+def get_batch_record_status(result) -> dict:
+    """Describe the result that rejected a record of a batch"""
+    status, content_type, content = result
+    return {
+        "status": int(status.split(" ", 1)[0]),
+        "message": (
+            b"".join(content).decode()
+            if content_type.startswith("text/plain")
+            # A receipt from the submission cache
+            else "This form was already stored\n"
+        )
+    }
+
 
-    output_file = directory / (str(time_stamp) + ".json")
-    with output_file.open("x") as f:
-        json.dump(result_object, f)
+def store_batch(environ, body: bytes):
+    """Validate the records of a batch and store them in a single commit
 
-    commit_hash = add_file_to_dataset(dataset_root, directory / output_file, home)
+    Every record is checked like a posted form, including its hash value.
+    Valid records are stored, invalid records are reported. The result is
+    a JSON object with the status of every record.
+    """
+    try:
+        with timed("batch-parse"):
+            records = parse_batch(body, batch_record_limit)
+    except BatchError as batch_error:
+        return create_bad_request_result([f"{batch_error}\n"])
+    log_request(environ, {"records": records})
+
+    # An Idempotency-Key header identifies the whole batch, so records are
+    # identified by their hash values.
+    record_environ = {
+        name: value
+        for name, value in environ.items()
+        if name != "HTTP_IDEMPOTENCY_KEY"
+    }
+    form_parser = create_form_parser()
+    record_statuses: List[Optional[dict]] = []
+    submissions: List[Tuple[int, Submission]] = []
+    try:
+        for index, record in enumerate(records):
+            try:
+                received_data = get_record_fields(record, form_parser)
+            except FormError as form_error:
+                record_statuses.append(get_batch_record_status(
+                    create_bad_request_result([f"{form_error}\n"])))
+                continue
+            submission = prepare_submission(record_environ, received_data)
+            if isinstance(submission, Submission):
+                submissions.append((index, submission))
+                record_statuses.append(None)
+            else:
+                record_statuses.append(get_batch_record_status(submission))
+
+        commit_hash, spool_reference = None, None
+        if submissions:
+            files = []
+            for _, submission in submissions:
+                files.extend(write_record_files(
+                    submission.dataset_root,
+                    submission.output_file,
+                    submission.result_object,
+                    submission.signature))
+            # Records can share a signature file
+            commit_hash, spool_reference = commit_files(
+                environ,
+                Path(environ[DATASET_ROOT_KEY]),
+                Path(environ[HOME_KEY]),
+                list(dict.fromkeys(files)),
+                [submission.hash_value for _, submission in submissions])
+    except:
+        for _, submission in submissions:
+            submission.discard()
+        raise
+
+    for index, submission in submissions:
+        # Keep the receipt of every record for retried submissions
+        create_submission_result(record_environ, submission, commit_hash, spool_reference)
+        record_statuses[index] = {
+            "status": 200,
+            "reference": get_reference(
+                commit_hash,
+                submission.result_object["source"]["time_stamp"],
+                spool_reference)
+        }
 
-    result_message = create_result_page(commit_hash, time_stamp, result_object, template_directory)
+    result_object = {
+        "stored": len(submissions),
+        "rejected": len(records) - len(submissions),
+        "records": [
+            {"index": index, **record_status}
+            for index, record_status in enumerate(record_statuses)
+        ]
+    }
     return (
         "200 OK",
-        "text/html; charset=utf-8",
-        encode_result_strings([result_message]))
+        "application/json; charset=utf-8",
+        encode_result_strings([json.dumps(result_object)]))
+
+
+def protected_application(environ, form_parser: FormParser):
+
+    result = route_request(environ)
+    if result is not None:
+        return result
+
+    if is_batch_request(environ):
+        try:
+            with timed("parse"):
+                body = read_batch(
+                    environ["wsgi.input"],
+                    get_content_length(environ),
+                    batch_body_size_limit)
+        except BatchError as batch_error:
+            return create_bad_request_result([f"{batch_error}\n"])
+        return store_batch(environ, body)
+
+    # Parse data while it is read, reject malformed data early
+    try:
+        with timed("parse"):
+            received_data = read_form(
+                environ["wsgi.input"],
+                get_content_length(environ),
+                form_parser)
+    except FormError as form_error:
+        return create_bad_request_result([f"{form_error}\n"])
+    log_request(environ, {"fields": {name: values[0] for name, values in received_data.items()}})
+
+    submission = prepare_submission(environ, received_data)
+    if not isinstance(submission, Submission):
+        return submission
+
+    try:
+        commit_hash, spool_reference = store_record(
+            environ,
+            submission.dataset_root,
+            submission.home,
+            submission.output_file,
+            submission.result_object,
+            submission.signature)
+    except:
+        submission.discard()
+        raise
+
+    return create_submission_result(environ, submission, commit_hash, spool_reference)
+
+
+def validate_schema() -> List[str]:
+    """Check that the field and rule tables are consistent
+
+    Rules are checked on the record, i.e. they may only refer to required
+    and patient fields. Returns a description of every problem.
+    """
+    problems = []
+    record_fields = {*required_fields, *required_patient_fields}
+    hashed_names = [name for name, _ in hashed_content_fields]
+    for name in dict.fromkeys(hashed_names):
+        if hashed_names.count(name) > 1:
+            problems.append(f"{name} is hashed more than once")
+        if name not in known_form_fields:
+            problems.append(f"hashed field {name} is not a form field")
+    rule_fields = [
+        *field_ranges,
+        *[name for limited_name, unit_name, _ in per_unit_maxima for name in (limited_name, unit_name)],
+        *[name for earlier, later, _ in date_order_rules for name in (*earlier, *later)],
+        *[name for limited_name, summands, _ in sum_limit_rules for name in (limited_name, *summands)],
+        *[summand for summands in sum_fields.values() for summand in summands],
+    ]
+    for name in dict.fromkeys(rule_fields):
+        if name not in record_fields:
+            problems.append(f"rule field {name} is not a record field")
+    for name, (minimum, maximum) in field_ranges.items():
+        if minimum > maximum:
+            problems.append(f"range of {name} is empty: {minimum} > {maximum}")
+    for name in sum_fields:
+        if name not in known_form_fields:
+            problems.append(f"sum field {name} is not a form field")
+    return problems
+
+
+def warm_up(configuration: Dict[str, str]) -> Dict[str, float]:
+    """Prepare the process for requests with the given configuration
+
+    Validates the schema, compiles the result template, checks the dataset
+    and its entrystore sibling, initializes the storage backend, opens the
+    configured databases, and calls the warm-up hook. All of this is cached
+    per process, so the first request does not pay for it. Returns the
+    stage durations.
+
+    An invalid schema raises ValueError. Other problems are written to
+    stderr and counted by /status, because they can be fixed while the
+    server is running.
+    """
+    problems = []
+    with request_timing() as timing:
+        with timed("warmup"):
+            with timed("warmup-schema"):
+                schema_problems = validate_schema()
+            if schema_problems:
+                raise ValueError("invalid schema:\n" + "\n".join(schema_problems))
+
+            if configuration.get(TEMPLATE_DIRECTORY_KEY):
+                bytecode_cache_directory = configuration.get(TEMPLATE_BYTECODE_CACHE_KEY)
+                with timed("warmup-template"):
+                    try:
+                        get_result_template(
+                            Path(configuration[TEMPLATE_DIRECTORY_KEY]),
+                            Path(bytecode_cache_directory) if bytecode_cache_directory else None)
+                    except Exception as exception:
+                        problems.append(f"result template: {exception}")
+
+            if configuration.get(DATASET_ROOT_KEY):
+                dataset_root = Path(configuration[DATASET_ROOT_KEY])
+                with timed("warmup-dataset"):
+                    try:
+                        get_storage_backend(
+                            configuration.get(STORAGE_BACKEND_KEY, "subprocess")
+                        ).head(dataset_root)
+                    except Exception as exception:
+                        problems.append(f"dataset {dataset_root}: {exception}")
+                    # Records are only pushed later in offline mode
+                    if not configuration.get(PUSH_JOURNAL_KEY):
+                        try:
+                            get_sibling_url(dataset_root)
+                        except Exception as exception:
+                            problems.append(f"sibling entrystore of {dataset_root}: {exception}")
+
+            with timed("warmup-databases"):
+                try:
+                    if configuration.get(RECORD_INDEX_KEY):
+                        get_record_index(Path(configuration[RECORD_INDEX_KEY]))
+                    if configuration.get(SUBMISSION_CACHE_KEY):
+                        get_submission_cache(
+                            Path(configuration[SUBMISSION_CACHE_KEY]),
+                            int(configuration.get(SUBMISSION_CACHE_SIZE_KEY, 1000)))
+                except Exception as exception:
+                    problems.append(f"databases: {exception}")
+
+            hook = configuration.get(WARMUP_HOOK_KEY)
+            if hook:
+                module_name, _, function_name = hook.partition(":")
+                with timed("warmup-hook"):
+                    try:
+                        getattr(importlib.import_module(module_name), function_name)(configuration)
+                    except Exception as exception:
+                        problems.append(f"warm-up hook {hook}: {exception!r}")
+
+    with _startup_lock:
+        startup_timing.update(timing)
+        startup_problems.extend(problems)
+    for problem in problems:
+        print(f"warm-up: {problem}", file=sys.stderr)
+    return timing
+
+
+startup_timing["import"] = time.perf_counter() - _import_start
+
+# mod_wsgi loads the script as module "_mod_wsgi_<hash>", e.g. at process
+# start with WSGIImportScript. Other servers call warm_up() themselves.
+if __name__.startswith("_mod_wsgi_"):
+    _environment_configuration = configuration_from_environment()
+    if is_enabled(_environment_configuration, WARMUP_KEY):
+        warm_up(_environment_configuration)
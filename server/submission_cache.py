@@ -0,0 +1,121 @@
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Optional
+
+
+class SubmissionCache:
+    """Receipts of recent submissions, by idempotency key
+
+    A submission claims its key before it is stored, and saves its receipt,
+    i.e. the response, after it was stored. A retried submission with the
+    same key gets the saved receipt. The cache is an SQLite database that
+    is shared by all server processes. It keeps the receipts of the last
+    `capacity` submissions, and all pending claims.
+
+    Claims of submissions that were not completed within `pending_timeout`
+    seconds, e.g. because the process died, can be taken over by a retry.
+    """
+
+    columns = ("key", "hash_value", "created", "status", "content_type", "body")
+
+    def __init__(self,
+                 cache_path: Path,
+                 capacity: int = 1000,
+                 pending_timeout: float = 600.0):
+        self.path = cache_path
+        self.capacity = capacity
+        self.pending_timeout = pending_timeout
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            str(cache_path),
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS receipts (
+                sequence INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT UNIQUE NOT NULL,
+                hash_value TEXT,
+                created REAL,
+                status TEXT,
+                content_type TEXT,
+                body BLOB
+            );
+        """)
+
+    def claim(self, key: str, hash_value: str) -> Optional[dict]:
+        """Claim key for a new submission
+
+        Returns None if the key was claimed. Otherwise, returns the entry of
+        the earlier submission with this key. Its status is None, if the
+        earlier submission is still being stored.
+        """
+        now = time.time()
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.connection.execute(
+                    f"SELECT {', '.join(self.columns)} FROM receipts WHERE key = ?",
+                    [key]).fetchone()
+                if row is None:
+                    self.connection.execute(
+                        "INSERT INTO receipts (key, hash_value, created) VALUES (?, ?, ?)",
+                        [key, hash_value, now])
+                    # Pending claims are kept, unless they were abandoned,
+                    # otherwise a concurrent retry would be stored again
+                    self.connection.execute(
+                        "DELETE FROM receipts WHERE sequence <= "
+                        "(SELECT MAX(sequence) FROM receipts) - ? "
+                        "AND (status IS NOT NULL OR created + ? < ?)",
+                        [self.capacity, self.pending_timeout, now])
+                    entry = None
+                else:
+                    entry = dict(zip(self.columns, row))
+                    if entry["status"] is None and entry["created"] + self.pending_timeout < now:
+                        # Take over an abandoned claim
+                        self.connection.execute(
+                            "UPDATE receipts SET hash_value = ?, created = ? WHERE key = ?",
+                            [hash_value, now, key])
+                        entry = None
+                self.connection.execute("COMMIT")
+            except:
+                self.connection.execute("ROLLBACK")
+                raise
+
+        if entry is not None and entry["body"] is not None:
+            entry["body"] = zlib.decompress(entry["body"])
+        return entry
+
+    def complete(self, key: str, status: str, content_type: str, body: bytes):
+        """Save the receipt of a stored submission"""
+        with self.lock:
+            self.connection.execute(
+                "UPDATE receipts SET status = ?, content_type = ?, body = ? WHERE key = ?",
+                [status, content_type, zlib.compress(body), key])
+
+    def release(self, key: str):
+        """Release the claim of a submission that was not stored"""
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM receipts WHERE key = ? AND status IS NULL",
+                [key])
+
+
+_caches: Dict[Path, SubmissionCache] = dict()
+_caches_lock = threading.Lock()
+
+
+def get_submission_cache(cache_path: Path, capacity: int = 1000) -> SubmissionCache:
+    """Get the process-wide cache object for cache_path"""
+    with _caches_lock:
+        cache = _caches.get(cache_path)
+        if cache is None:
+            cache = SubmissionCache(cache_path, capacity)
+            _caches[cache_path] = cache
+        else:
+            cache.capacity = capacity
+        return cache
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from typing import List, Optional
+from unittest.mock import patch
+
+
+server_dir = Path(__file__).parents[1]
+template_dir = Path(__file__).parents[2] / "templates"
+
+sys.path.insert(0, str(server_dir))
+
+
+from asgi_app import create_application
+from store_data import DATASET_ROOT_KEY, HOME_KEY, TEMPLATE_DIRECTORY_KEY, configuration_from_environment
+from test_store_data import create_batch_record, get_stored_records, minimal_form_data
+
+
+def call_application(application,
+                     method: str,
+                     path: str,
+                     body: bytes = b"",
+                     chunk_size: Optional[int] = None):
+
+    chunk_size = chunk_size or max(len(body), 1)
+    messages = [
+        {
+            "type": "http.request",
+            "body": body[start:start + chunk_size],
+            "more_body": start + chunk_size < len(body)
+        }
+        for start in range(0, max(len(body), 1), chunk_size)
+    ]
+    sent: List[dict] = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": b"",
+        "headers": [(b"content-length", str(len(body)).encode())],
+        "client": ("1.2.3.4", 1234),
+    }
+    asyncio.run(application(scope, receive, send))
+    return sent[0]["status"], sent[1]["body"].decode()
+
+
+class TestAsgiApp(unittest.TestCase):
+
+    def test_configuration_from_environment(self):
+        self.assertEqual(
+            configuration_from_environment({
+                "SFB1451_ENTRY_DATASET_ROOT": "/d",
+                "SFB1451_ENTRY_BATCH_WINDOW": "0.5",
+                "HOME": "/h",
+            }),
+            {
+                "de.inm7.sfb1451.entry.dataset_root": "/d",
+                "de.inm7.sfb1451.entry.batch_window": "0.5",
+            })
+
+    def test_rejected_requests(self):
+        application = create_application({
+            DATASET_ROOT_KEY: "",
+            HOME_KEY: "",
+            TEMPLATE_DIRECTORY_KEY: ""
+        })
+        status, text = call_application(application, "GET", "/store-data")
+        self.assertEqual((status, text), (400, "Only POST is supported\n"))
+
+        status, text = call_application(
+            application, "POST", "/store-data",
+            minimal_form_data.encode() + b"&no-such-field=1")
+        self.assertEqual((status, text), (400, "unknown form field: no-such-field\n"))
+
+        status, text = call_application(application, "GET", "/store-data/metrics")
+        self.assertEqual(status, 200)
+        self.assertIn("sfb1451_entry_responses_total", text)
+
+    def test_datalad_saving(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dataset_path = Path(temp_dir) / "dataset"
+            sibling_path = Path(temp_dir) / "entrystore"
+            subprocess.run(["datalad", "create", "--no-annex", str(dataset_path)], check=True)
+            sibling_path.mkdir()
+            subprocess.run(
+                ["datalad", "create-sibling", "-d", str(dataset_path), "-s", "entrystore", str(sibling_path)],
+                check=True)
+
+            application = create_application({
+                DATASET_ROOT_KEY: str(dataset_path),
+                HOME_KEY: os.environ["HOME"],
+                TEMPLATE_DIRECTORY_KEY: str(template_dir),
+            })
+            with patch("time.time") as time_mock:
+                time_mock.return_value = 0.0
+                status, _ = call_application(
+                    application, "POST", "/store-data",
+                    minimal_form_data.encode(), chunk_size=1000)
+            self.assertEqual(status, 200)
+
+            expected_path, = get_stored_records(dataset_path)
+            expected_sibling_path = sibling_path / expected_path.relative_to(dataset_path)
+            self.assertTrue(expected_sibling_path.exists())
+
+            with patch("time.time") as time_mock:
+                time_mock.return_value = 0.0
+                status, text = call_application(
+                    application, "POST", "/store-data/batch",
+                    json.dumps([create_batch_record("test-112")]).encode())
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(text)["stored"], 1)
+            self.assertEqual(len(get_stored_records(dataset_path)), 2)
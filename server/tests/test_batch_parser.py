@@ -0,0 +1,70 @@
+import asyncio
+import io
+import json
+import sys
+import unittest
+from pathlib import Path
+
+
+server_dir = Path(__file__).parents[1]
+
+sys.path.insert(0, str(server_dir))
+
+
+from batch_parser import BatchError, get_record_fields, parse_batch, read_batch, receive_batch
+from form_parser import FormError
+from store_data import create_form_parser
+
+
+class TestBatchParser(unittest.TestCase):
+
+    def test_formats(self):
+        records = [{"a": "1"}, {"b": "2"}]
+        self.assertEqual(parse_batch(json.dumps(records).encode(), 10), records)
+        self.assertEqual(parse_batch(b'\n  [{"a": "1"}]', 10), [{"a": "1"}])
+        self.assertEqual(
+            parse_batch(b'{"a": "1"}\n\n{"b": "2"}\n', 10),
+            records)
+
+    def test_malformed_batches(self):
+        for body, message in [
+                (b"", "batch contains no records"),
+                (b"[]", "batch contains no records"),
+                (b'[{"a": "1"}, {"b": "2"}]', "batch contains 2 records, limit is 1"),
+                (b'{"a": "1"}\n{"b"', "line 2 is not valid JSON: "),
+                (b"[\xff]", "batch is not UTF-8 encoded")]:
+            with self.subTest(body=body):
+                with self.assertRaises(BatchError) as context:
+                    parse_batch(body, 1)
+                self.assertTrue(str(context.exception).startswith(message))
+
+    def test_size_limit(self):
+        self.assertEqual(read_batch(io.BytesIO(b"[{}]"), 4, 4), b"[{}]")
+        self.assertRaises(BatchError, read_batch, io.BytesIO(b"[{}, {}]"), 8, 4)
+
+        messages = [
+            {"type": "http.request", "body": b"[{},", "more_body": True},
+            {"type": "http.request", "body": b" {}]", "more_body": False},
+        ]
+
+        async def receive():
+            return messages.pop(0)
+
+        # Without content length, the size is checked while receiving
+        with self.assertRaises(BatchError):
+            asyncio.run(receive_batch(receive, None, 6))
+
+    def test_record_fields(self):
+        form_parser = create_form_parser()
+        self.assertEqual(
+            get_record_fields({"sex": "male", "additional-remarks": ""}, form_parser),
+            {"sex": ["male"]})
+        for record, message in [
+                ([], "record is not a JSON object"),
+                ({"no-such-field": "1"}, "unknown form field: no-such-field"),
+                ({"sex": 1}, "form field is not a string: sex"),
+                ({"sex": "x" * 20000}, "form field too large: sex")]:
+            with self.subTest(record=record):
+                with self.assertRaises(FormError) as context:
+                    get_record_fields(record, form_parser)
+                self.assertEqual(str(context.exception), message)
@@ -0,0 +1,93 @@
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+
+server_dir = Path(__file__).parents[1]
+
+sys.path.insert(0, str(server_dir))
+
+
+import store_data
+from circuit_breaker import CircuitBreaker
+from push_scheduler import PushScheduler, get_push_scheduler
+from storage_backend import StorageBackend
+
+
+class UnreachableSiblingBackend(StorageBackend):
+    def __init__(self):
+        self.commits = 0
+        self.pushes = 0
+        self.request_pushes = 0
+        self.reachable = False
+
+    def save(self, dataset_root: Path, files, message: str, home: Path):
+        self.commits += 1
+
+    def head(self, dataset_root: Path) -> str:
+        return f"commit-{self.commits}"
+
+    def push(self, dataset_root: Path, home: Path):
+        self.pushes += 1
+        if threading.current_thread() is threading.main_thread():
+            self.request_pushes += 1
+        if not self.reachable:
+            raise RuntimeError("sibling not reachable")
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_open_and_close(self):
+        circuit_breaker = CircuitBreaker(Path("/d"), 2, 30.0)
+        circuit_breaker.record_failure("error 1")
+        self.assertEqual(circuit_breaker.state(), "closed")
+        circuit_breaker.record_failure("error 2")
+        self.assertEqual(circuit_breaker.state(), "open")
+        self.assertEqual(circuit_breaker.trips, 1)
+        circuit_breaker.record_failure("error 3")
+        self.assertEqual(circuit_breaker.trips, 1)
+
+        circuit_breaker.record_success()
+        self.assertEqual(circuit_breaker.state(), "closed")
+        self.assertEqual(circuit_breaker.failures, 0)
+
+    def test_probe_interval_limits_retry_delay(self):
+        circuit_breaker = CircuitBreaker(Path("/d"), 1, 5.0)
+        scheduler = PushScheduler(Path("/d"), Path("/h"), StorageBackend(), circuit_breaker)
+        scheduler.failures = 10
+        self.assertGreater(scheduler._retry_delay(), 5.0)
+        circuit_breaker.record_failure("error")
+        self.assertEqual(scheduler._retry_delay(), 5.0)
+
+    def test_records_accepted_while_sibling_unreachable(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dataset_root = Path(temp_dir)
+            (dataset_root / ".git").mkdir()
+            home = Path("/h")
+            backend = UnreachableSiblingBackend()
+            circuit_breaker = CircuitBreaker(dataset_root, 2, 0.01)
+
+            commit_hashes = [
+                store_data.add_files_to_dataset(
+                    dataset_root,
+                    [dataset_root / f"{index}.json"],
+                    home,
+                    backend,
+                    circuit_breaker=circuit_breaker)
+                for index in range(5)]
+            self.assertEqual(commit_hashes, [f"commit-{index}" for index in range(1, 6)])
+
+            # Only the requests before the breaker opened tried to push,
+            # further attempts are made by the push scheduler.
+            scheduler = get_push_scheduler(dataset_root, home, backend)
+            self.assertIs(scheduler.circuit_breaker, circuit_breaker)
+            self.assertEqual(backend.request_pushes, 2)
+            self.assertTrue(circuit_breaker.is_open())
+
+            backend.reachable = True
+            scheduler.stop()
+            scheduler.join(10)
+            self.assertEqual(scheduler.backlog(), 0)
+            self.assertFalse(circuit_breaker.is_open())
@@ -0,0 +1,79 @@
+import fcntl
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+
+server_dir = Path(__file__).parents[1]
+
+sys.path.insert(0, str(server_dir))
+
+
+from commit_lock import CommitLock
+
+
+class TestCommitLock(unittest.TestCase):
+
+    def _create_lock(self, temp_dir: str) -> CommitLock:
+        dataset_root = Path(temp_dir)
+        (dataset_root / ".git").mkdir()
+        return CommitLock(dataset_root)
+
+    def test_threads_acquire_in_order(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            commit_lock = self._create_lock(temp_dir)
+            order = []
+
+            def commit(index):
+                with commit_lock:
+                    order.append(index)
+
+            commit_lock.acquire()
+            threads = []
+            for index in range(5):
+                thread = threading.Thread(target=commit, args=(index,))
+                thread.start()
+                threads.append(thread)
+                # Wait until the thread is queued
+                while commit_lock.waiting_count() <= index:
+                    time.sleep(0.001)
+            commit_lock.release()
+            for thread in threads:
+                thread.join(10)
+
+            self.assertEqual(order, list(range(5)))
+            self.assertEqual(commit_lock.waiting_count(), 0)
+
+    def test_waits_for_other_process(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            commit_lock = self._create_lock(temp_dir)
+            acquired = threading.Event()
+
+            def commit():
+                with commit_lock:
+                    acquired.set()
+
+            # A lock on a separately opened file excludes the commit lock,
+            # like the lock of another process.
+            with commit_lock.path.open("a") as other_lock_file:
+                fcntl.flock(other_lock_file, fcntl.LOCK_EX)
+                thread = threading.Thread(target=commit)
+                thread.start()
+                self.assertFalse(acquired.wait(0.2))
+                fcntl.flock(other_lock_file, fcntl.LOCK_UN)
+
+            self.assertTrue(acquired.wait(10))
+            thread.join(10)
+
+    def test_lock_released_after_error(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            commit_lock = self._create_lock(temp_dir)
+            with self.assertRaises(ValueError):
+                with commit_lock:
+                    raise ValueError("save failed")
+
+            with commit_lock.path.open("a") as other_lock_file:
+                fcntl.flock(other_lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
@@ -0,0 +1,57 @@
+import io
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from pathlib import Path
+
+
+server_dir = Path(__file__).parents[1]
+
+sys.path.insert(0, str(server_dir))
+
+
+from error_journal import ErrorJournal, report_error
+
+
+def raise_and_report(journal, fields):
+    try:
+        raise ValueError("unexpected value")
+    except ValueError:
+        return report_error(journal, {"PATH_INFO": "/store-data", "wsgi.input": object()}, fields)
+
+
+class TestErrorJournal(unittest.TestCase):
+
+    def test_report_and_find(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            journal = ErrorJournal(Path(temp_dir) / "errors")
+            error_id = raise_and_report(
+                journal,
+                {"subject-pseudonym": ["test-111"], "signature-data": ["x" * 100000]})
+
+            entry = journal.find(error_id)
+            self.assertIn("ValueError: unexpected value", entry["exception"])
+            self.assertEqual(entry["environ"], {"PATH_INFO": "/store-data"})
+            self.assertEqual(entry["fields"]["subject-pseudonym"], ["test-111"])
+            self.assertLess(len(entry["fields"]["signature-data"][0]), 3000)
+            self.assertIsNone(journal.find("no-such-id"))
+
+    def test_rotation(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            journal = ErrorJournal(Path(temp_dir) / "errors", max_bytes=4096, backup_count=2)
+            error_ids = [raise_and_report(journal, {}) for _ in range(40)]
+
+            self.assertLessEqual(journal.path.stat().st_size, 4096)
+            self.assertTrue(journal.backup_path(2).exists())
+            self.assertFalse(journal.backup_path(3).exists())
+            found_ids = {entry["id"] for entry in journal.entries()}
+            self.assertIn(error_ids[-1], found_ids)
+            self.assertNotIn(error_ids[0], found_ids)
+
+    def test_without_journal(self):
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            error_id = raise_and_report(None, {})
+        self.assertIn(error_id, stderr.getvalue())
+        self.assertIn("unexpected value", stderr.getvalue())
@@ -0,0 +1,92 @@
+import copy
+import sys
+import unittest
+from pathlib import Path
+from urllib.parse import parse_qs
+
+
+server_dir = Path(__file__).parents[1]
+
+sys.path.insert(0, str(server_dir))
+
+
+import store_data
+from test_store_data import minimal_form_data
+
+
+def legacy_process(received_data):
+    """The multi-pass processing that the compiled schema replaces"""
+    received_data = copy.deepcopy(received_data)
+    store_data.add_auto_fields(received_data)
+    store_data.correct_optional_checkbox_fields(received_data)
+    record, missing_keys = store_data.read_mandatory_fields(
+        store_data.required_fields,
+        received_data)
+    if missing_keys:
+        return record, missing_keys, None
+    if record["subject-group"] == "patient":
+        patient_record, missing_keys = store_data.read_mandatory_fields(
+            store_data.required_patient_fields,
+            received_data)
+        record.update(patient_record)
+        if missing_keys:
+            return record, missing_keys, None
+    return record, [], store_data.get_canonic_content_string(received_data)
+
+
+class TestFieldSchema(unittest.TestCase):
+
+    def _assert_identical(self, received_data):
+        record, missing_keys, hash_string = legacy_process(received_data)
+        result = store_data.field_schema.process(received_data)
+        self.assertEqual(result.missing_keys, missing_keys)
+        if not missing_keys:
+            self.assertEqual(list(result.record.items()), list(record.items()))
+            self.assertEqual(result.hash_string, hash_string)
+
+    def test_minimal_healthy(self):
+        self._assert_identical(parse_qs(minimal_form_data))
+
+    def test_patient_and_checkboxes(self):
+        received_data = parse_qs(minimal_form_data)
+        received_data.update({
+            "subject-group": ["patient"],
+            "patient-year-first-symptom": ["2001"],
+            "patient-main-disease": ["stroke"],
+            "patient-stronger-impacted-hand": ["left"],
+            "repeated-test": ["on"],
+            "jtt-incorrectly-executed": ["on"],
+            "jtt-incorrectly-executed-valid": ["true"],
+            "tug-a-incorrectly-executed": ["on"],
+            "maximum-ftf-left": ["12.50"],
+            "arat-left": ["3.0"],
+            "kopss-speech": ["1.5"],
+        })
+        self._assert_identical(received_data)
+
+    def test_missing_keys(self):
+        received_data = parse_qs(minimal_form_data)
+        del received_data["project-code"]
+        del received_data["date-of-test"]
+        self._assert_identical(received_data)
+        self.assertEqual(
+            store_data.field_schema.process(received_data).missing_keys,
+            ["project-code", "date-of-test"])
+
+    def test_conversion_errors(self):
+        received_data = parse_qs(minimal_form_data)
+        received_data["arat-left"] = ["3.5"]
+        self.assertRaises(ValueError, store_data.field_schema.process, received_data)
+
+        received_data = parse_qs(minimal_form_data)
+        received_data["kas-imitation-arm-hand"] = ["x"]
+        self.assertRaises(ValueError, store_data.field_schema.process, received_data)
+
+    def test_hash_errors_are_deferred(self):
+        # The hash string is not needed if keys are missing
+        received_data = parse_qs(minimal_form_data)
+        del received_data["project-code"]
+        result = store_data.field_schema.process(received_data)
+        self.assertEqual(result.missing_keys, ["project-code"])
+        with self.assertRaises(KeyError):
+            result.hash_string
@@ -0,0 +1,74 @@
+import io
+import sys
+import unittest
+from pathlib import Path
+from urllib.parse import parse_qs
+
+
+server_dir = Path(__file__).parents[1]
+
+sys.path.insert(0, str(server_dir))
+
+
+from form_parser import FormError, FormParser, read_form
+from store_data import create_form_parser
+from test_store_data import minimal_form_data
+
+
+class LimitedStream(io.BytesIO):
+    """A stream that fails if more than `limit` bytes are read"""
+    def __init__(self, content: bytes, limit: int):
+        super().__init__(content)
+        self.limit = limit
+
+    def read(self, size=-1):
+        if self.tell() + size > self.limit:
+            raise AssertionError("read beyond limit")
+        return super().read(size)
+
+
+class TestFormParser(unittest.TestCase):
+
+    def _parse(self, content: bytes, parser=None, chunk_size=64 * 1024):
+        return read_form(
+            io.BytesIO(content),
+            len(content),
+            parser or create_form_parser(),
+            chunk_size)
+
+    def test_parse_qs_compatibility(self):
+        content = minimal_form_data + "&additional-remarks=a+b%26c%3D%C3%A4&Hello&&"
+        for chunk_size in (1, 7, 1024, 64 * 1024):
+            self.assertEqual(
+                self._parse(content.encode(), chunk_size=chunk_size),
+                parse_qs(content))
+
+    def test_duplicated_field(self):
+        self.assertRaises(
+            FormError,
+            self._parse, b"sex=male&project-code=b2&sex=female")
+        # Empty values are ignored, like parse_qs does it
+        self.assertEqual(self._parse(b"sex=&sex=male"), {"sex": ["male"]})
+
+    def test_unknown_field(self):
+        self.assertRaises(FormError, self._parse, b"sex=male&no-such-field=1")
+
+    def test_incorrect_encoding(self):
+        self.assertRaises(FormError, self._parse, b"additional-remarks=%C3")
+        self.assertRaises(FormError, self._parse, b"additional-remarks=\xff")
+
+    def test_field_size_limit_fails_fast(self):
+        parser = FormParser({"a", "b"}, {"b": 100}, 10, 10000)
+        content = b"b=" + b"x" * 100 + b"&a=" + b"x" * 1000
+        stream = LimitedStream(content, 200)
+        self.assertRaises(FormError, read_form, stream, len(content), parser, 16)
+
+        parser = FormParser({"a", "b"}, {"b": 100}, 10, 10000)
+        self.assertEqual(
+            read_form(io.BytesIO(content[:102]), 102, parser),
+            {"b": ["x" * 100]})
+
+    def test_total_size_limit(self):
+        parser = FormParser({"a"}, {}, 10, 100)
+        stream = LimitedStream(b"a=1&" * 100, 0)
+        self.assertRaises(FormError, read_form, stream, 400, parser)
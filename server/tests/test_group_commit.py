@@ -0,0 +1,96 @@
+import sys
+import threading
+import unittest
+from pathlib import Path
+
+
+server_dir = Path(__file__).parents[1]
+
+sys.path.insert(0, str(server_dir))
+
+
+from group_commit import GroupCommitter
+
+
+class TestGroupCommit(unittest.TestCase):
+
+    def _commit_concurrently(self, committer, files):
+        results = dict()
+
+        def commit(file):
+            try:
+                results[file] = committer.commit([file])
+            except Exception as exception:
+                results[file] = exception
+
+        threads = [threading.Thread(target=commit, args=(file,)) for file in files]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        return results
+
+    def test_single_commit_for_window(self):
+        calls = []
+
+        def commit_function(dataset_root, files, home):
+            calls.append(sorted(files))
+            return f"commit-{len(calls)}"
+
+        committer = GroupCommitter(Path("/d"), Path("/h"), commit_function, 1.0, 10)
+        committer.start()
+        files = [Path(f"/d/{i}.json") for i in range(5)]
+        results = self._commit_concurrently(committer, files)
+        committer.stop()
+
+        self.assertEqual(calls, [files])
+        self.assertEqual(set(results.values()), {"commit-1"})
+
+    def test_batch_size_limit(self):
+        calls = []
+
+        def commit_function(dataset_root, files, home):
+            calls.append(files)
+            return f"commit-{len(calls)}"
+
+        committer = GroupCommitter(Path("/d"), Path("/h"), commit_function, 1.0, 2)
+        committer.start()
+        results = self._commit_concurrently(
+            committer,
+            [Path(f"/d/{i}.json") for i in range(4)])
+        committer.stop()
+
+        self.assertEqual([len(files) for files in calls], [2, 2])
+        self.assertEqual(sorted(results.values()), ["commit-1"] * 2 + ["commit-2"] * 2)
+
+    def test_error_reported_to_all_callers(self):
+
+        def commit_function(dataset_root, files, home):
+            raise RuntimeError("save failed")
+
+        committer = GroupCommitter(Path("/d"), Path("/h"), commit_function, 0.2, 10)
+        committer.start()
+        results = self._commit_concurrently(
+            committer,
+            [Path(f"/d/{i}.json") for i in range(3)])
+        committer.stop()
+
+        for result in results.values():
+            self.assertIsInstance(result, RuntimeError)
+
+    def test_commit_after_stop(self):
+        calls = []
+
+        def commit_function(dataset_root, files, home):
+            calls.append(files)
+            return f"commit-{len(calls)}"
+
+        committer = GroupCommitter(Path("/d"), Path("/h"), commit_function, 0.2, 10)
+        committer.start()
+        committer.stop()
+        committer.join(10)
+        self.assertFalse(committer.is_alive())
+
+        results = self._commit_concurrently(committer, [Path("/d/a.json")])
+        self.assertEqual(results, {Path("/d/a.json"): "commit-1"})
+        self.assertEqual(calls, [[Path("/d/a.json")]])
@@ -0,0 +1,49 @@
+import sys
+import unittest
+from pathlib import Path
+
+
+server_dir = Path(__file__).parents[1]
+
+sys.path.insert(0, str(server_dir))
+
+
+from metrics import Histogram, Metrics, metrics, request_timing, timed
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram(self):
+        histogram = Histogram(buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 5.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [1, 2])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.total, 6.25)
+
+    def test_render(self):
+        test_metrics = Metrics()
+        test_metrics.observe("save", 0.0003)
+        test_metrics.observe("save", 20.0)
+        test_metrics.count_response("200 OK")
+        test_metrics.count_response("400 BAD REQUEST")
+        test_metrics.count_response("200 OK")
+        lines = test_metrics.render()
+        self.assertIn('sfb1451_entry_stage_duration_seconds_bucket{stage="save",le="0.0005"} 1\n', lines)
+        self.assertIn('sfb1451_entry_stage_duration_seconds_bucket{stage="save",le="10.0"} 1\n', lines)
+        self.assertIn('sfb1451_entry_stage_duration_seconds_bucket{stage="save",le="30.0"} 2\n', lines)
+        self.assertIn('sfb1451_entry_stage_duration_seconds_bucket{stage="save",le="+Inf"} 2\n', lines)
+        self.assertIn('sfb1451_entry_stage_duration_seconds_count{stage="save"} 2\n', lines)
+        self.assertIn('sfb1451_entry_responses_total{status="200"} 2\n', lines)
+        self.assertIn('sfb1451_entry_responses_total{status="400"} 1\n', lines)
+
+    def test_request_timing(self):
+        with timed("test-outside"):
+            pass
+        with request_timing() as timing:
+            with timed("test-stage"):
+                pass
+            with timed("test-stage"):
+                pass
+        self.assertEqual(list(timing), ["test-stage"])
+        self.assertEqual(metrics.stage_durations["test-stage"].count, 2)
@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+
+server_dir = Path(__file__).parents[1]
+tool_path = Path(__file__).parents[2] / "tools" / "migrate_input_layout.py"
+
+sys.path.insert(0, str(server_dir))
+
+
+from commit_lock import CommitLock
+from record_index import RecordIndex
+
+
+def store_flat_record(dataset_root: Path, time_stamp: float, hash_value: str) -> Path:
+    record_path = dataset_root / "input" / "2.3" / f"{time_stamp:.6f}.json"
+    record_path.parent.mkdir(parents=True, exist_ok=True)
+    with record_path.open("x") as f:
+        json.dump(
+            {
+                "source": {"time_stamp": time_stamp, "hash-value": hash_value},
+                "data": {"subject-pseudonym": "test-111", "project-code": "b2"}
+            },
+            f)
+    return record_path
+
+
+class TestMigrateInputLayout(unittest.TestCase):
+
+    def test_migrate_flat_dataset(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dataset_root = Path(temp_dir) / "dataset"
+            index_path = Path(temp_dir) / "index.sqlite"
+            subprocess.run(["datalad", "create", "--no-annex", str(dataset_root)], check=True)
+            store_flat_record(dataset_root, 0.5, "hash-1")
+            store_flat_record(dataset_root, 86400.5, "hash-2")
+            subprocess.run(["datalad", "save", "-d", str(dataset_root), "-m", "add records"], check=True)
+            RecordIndex(index_path).rebuild(dataset_root)
+            # A record that the server wrote, but did not yet commit
+            uncommitted_path = dataset_root / "input" / "2.3" / "1970" / "01" / "01" / "0.700000-spooled.json"
+            uncommitted_path.parent.mkdir(parents=True)
+            store_flat_record(dataset_root, 0.7, "hash-3").rename(uncommitted_path)
+
+            # The tool waits for the commit lock of the server
+            commit_lock = CommitLock(dataset_root)
+            commit_lock.acquire()
+            process = subprocess.Popen([
+                sys.executable,
+                str(tool_path),
+                str(dataset_root),
+                "--home", os.environ["HOME"],
+                "--index", str(index_path)])
+            try:
+                time.sleep(1)
+                self.assertIsNone(process.poll())
+                self.assertTrue((dataset_root / "input" / "2.3" / "0.500000.json").exists())
+            finally:
+                commit_lock.release()
+            self.assertEqual(process.wait(60), 0)
+
+            self.assertEqual(
+                sorted(
+                    str(path.relative_to(dataset_root))
+                    for path in (dataset_root / "input").glob("**/*.json")),
+                [
+                    "input/2.3/1970/01/01/0.500000.json",
+                    "input/2.3/1970/01/01/0.700000-spooled.json",
+                    "input/2.3/1970/01/02/86400.500000.json"
+                ])
+            status = subprocess.run(
+                ["git", "-C", str(dataset_root), "status", "--porcelain", "--untracked-files=all"],
+                check=True,
+                stdout=subprocess.PIPE).stdout.decode()
+            self.assertEqual(status, "?? input/2.3/1970/01/01/0.700000-spooled.json\n")
+
+            record_index = RecordIndex(index_path)
+            self.assertEqual(
+                record_index.get("hash-2")["path"],
+                "input/2.3/1970/01/02/86400.500000.json")
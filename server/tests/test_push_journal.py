@@ -0,0 +1,32 @@
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+
+server_dir = Path(__file__).parents[1]
+
+sys.path.insert(0, str(server_dir))
+
+
+from push_journal import PushJournal
+
+
+class TestPushJournal(unittest.TestCase):
+
+    def test_append_and_remove(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            journal = PushJournal(Path(temp_dir) / "journal")
+            self.assertEqual(journal.entries(), [])
+
+            journal.append("c1", ["input/a.json"])
+            journal.append("c2", ["input/b.json", "input/c.json"])
+            self.assertEqual(
+                [(entry["commit"], entry["files"]) for entry in journal.entries()],
+                [("c1", ["input/a.json"]), ("c2", ["input/b.json", "input/c.json"])])
+
+            journal.remove(1)
+            journal.append("c3", ["input/d.json"])
+            self.assertEqual(
+                [entry["commit"] for entry in PushJournal(journal.path).entries()],
+                ["c2", "c3"])
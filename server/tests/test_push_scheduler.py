@@ -0,0 +1,110 @@
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+
+server_dir = Path(__file__).parents[1]
+
+sys.path.insert(0, str(server_dir))
+
+
+from push_journal import PushJournal, get_unpushed_journal_path
+from push_scheduler import PushScheduler
+from storage_backend import StorageBackend
+
+
+class BlockingBackend(StorageBackend):
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.pushes = 0
+        self.release = threading.Event()
+        self.pushing = threading.Event()
+
+    def push(self, dataset_root: Path, home: Path):
+        self.pushing.set()
+        self.release.wait(10)
+        self.pushes += 1
+        if self.pushes <= self.failures:
+            raise RuntimeError("sibling not reachable")
+
+
+class TestPushScheduler(unittest.TestCase):
+
+    def test_coalesced_push(self):
+        backend = BlockingBackend()
+        scheduler = PushScheduler(Path("/d"), Path("/h"), backend)
+        scheduler.start()
+
+        scheduler.notify("commit-1")
+        backend.pushing.wait(10)
+        for index in range(2, 10):
+            scheduler.notify(f"commit-{index}")
+        self.assertEqual(scheduler.backlog(), 9)
+
+        backend.release.set()
+        scheduler.stop()
+        scheduler.join(10)
+        self.assertEqual(backend.pushes, 2)
+        self.assertEqual(scheduler.backlog(), 0)
+
+    def test_retry_after_failure(self):
+        backend = BlockingBackend(failures=2)
+        backend.release.set()
+        scheduler = PushScheduler(Path("/d"), Path("/h"), backend)
+        with patch("push_scheduler.initial_retry_delay", 0.01):
+            scheduler.start()
+            scheduler.notify("commit-1")
+            while scheduler.backlog() != 0:
+                scheduler.join(0.01)
+        scheduler.stop()
+        scheduler.join(10)
+
+        self.assertEqual(backend.pushes, 3)
+        self.assertEqual(scheduler.failures, 0)
+        self.assertIsNotNone(scheduler.last_push)
+
+    def test_many_consecutive_failures(self):
+        # 2 ** failures does not fit into a float after about 1000 failures
+        scheduler = PushScheduler(Path("/d"), Path("/h"), BlockingBackend())
+        scheduler.failures = 10 ** 6
+        self.assertEqual(scheduler._retry_delay(), 300.0)
+
+        backend = BlockingBackend(failures=1100)
+        backend.release.set()
+        scheduler = PushScheduler(Path("/d"), Path("/h"), backend)
+        with patch("push_scheduler.maximum_retry_delay", 0.0):
+            scheduler.start()
+            scheduler.notify("commit-1")
+            while scheduler.backlog() != 0 and scheduler.is_alive():
+                scheduler.join(0.01)
+            self.assertEqual(scheduler.backlog(), 0)
+            self.assertEqual(backend.pushes, 1101)
+            scheduler.stop()
+            scheduler.join(10)
+
+    def test_stop_after_failed_push(self):
+        backend = BlockingBackend(failures=10 ** 6)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dataset_root = Path(temp_dir)
+            (dataset_root / ".git").mkdir()
+            scheduler = PushScheduler(dataset_root, Path("/h"), backend)
+            scheduler.start()
+            scheduler.notify("commit-1")
+            backend.pushing.wait(10)
+            scheduler.notify("commit-2")
+
+            # The running push fails, one more push is attempted after stop()
+            scheduler.stop()
+            backend.release.set()
+            scheduler.join(10)
+            self.assertFalse(scheduler.is_alive())
+            self.assertEqual(backend.pushes, 2)
+            self.assertEqual(scheduler.backlog(), 2)
+
+            journal = PushJournal(get_unpushed_journal_path(dataset_root))
+            self.assertEqual(
+                [entry["commit"] for entry in journal.entries()],
+                ["commit-1", "commit-2"])
@@ -0,0 +1,109 @@
+import csv
+import json
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+
+server_dir = Path(__file__).parents[1]
+
+sys.path.insert(0, str(server_dir))
+
+
+from record_export import RecordExporter, columns, record_rows, row_batches
+
+
+def store_record(dataset_root: Path, name: str, data: dict):
+    record_directory = dataset_root / "input" / "2.3" / "1970" / "01" / "01"
+    record_directory.mkdir(parents=True, exist_ok=True)
+    with (record_directory / name).open("x") as f:
+        json.dump({"source": {"time_stamp": 1.5, "hash-value": name}, "data": data}, f)
+    subprocess.run(["git", "-C", str(dataset_root), "add", "."], check=True)
+    subprocess.run(
+        ["git", "-C", str(dataset_root), "commit", "-q", "-m", f"add {name}"],
+        check=True)
+
+
+class TestRecordExport(unittest.TestCase):
+
+    def test_typed_rows(self):
+        row, = record_rows([(
+            "a.json",
+            {
+                "source": {"time_stamp": 1.5, "hash-value": "h1"},
+                "data": {
+                    "project-code": "b2",
+                    "repeated-test": False,
+                    "laterality-quotient": 3.0,
+                    "maximum-ftf-left": 2,
+                }
+            })])
+        values = {name: value for (name, _), value in zip(columns, row)}
+        self.assertEqual(values["path"], "a.json")
+        self.assertEqual(values["project-code"], "b2")
+        self.assertIs(values["repeated-test"], False)
+        self.assertIsInstance(values["laterality-quotient"], int)
+        self.assertIsInstance(values["maximum-ftf-left"], float)
+        self.assertIsNone(values["arat-left"])
+
+    def test_row_batches(self):
+        rows = [[index] * len(columns) for index in range(5)]
+        batches = list(row_batches(rows, 2))
+        self.assertEqual([len(batch["path"]) for batch in batches], [2, 2, 1])
+        self.assertEqual(batches[2]["time_stamp"], (4,))
+
+    def test_incremental_csv_export(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dataset_root = Path(temp_dir) / "dataset"
+            output_directory = Path(temp_dir) / "export"
+            subprocess.run(["git", "init", "-q", str(dataset_root)], check=True)
+            store_record(dataset_root, "1.json", {"project-code": "b2"})
+            store_record(dataset_root, "2.json", {"project-code": "a1"})
+
+            exporter = RecordExporter(dataset_root, output_directory, "csv", batch_size=1)
+            self.assertEqual(exporter.export(), 2)
+            self.assertEqual(exporter.export(), 0)
+            store_record(dataset_root, "3.json", {"project-code": "c3"})
+            self.assertEqual(exporter.export(), 1)
+
+            project_codes = []
+            for part in sorted(output_directory.glob("part-*.csv")):
+                with part.open(newline="") as f:
+                    project_codes.extend(row["project-code"] for row in csv.DictReader(f))
+            self.assertEqual(project_codes, ["b2", "a1", "c3"])
+
+            self.assertRaises(
+                ValueError,
+                RecordExporter(dataset_root, output_directory, "parquet").export)
+
+    def test_columns_of_stored_fields(self):
+        names = [name for name, _ in columns]
+        self.assertEqual(len(names), len(set(names)))
+        self.assertIn("patient-main-disease", names)
+        # Posted, but never stored in a record
+        self.assertNotIn("kopss-applicable", names)
+        self.assertNotIn("additional-mrt", names)
+
+    def test_stale_part_removed(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dataset_root = Path(temp_dir) / "dataset"
+            output_directory = Path(temp_dir) / "export"
+            subprocess.run(["git", "init", "-q", str(dataset_root)], check=True)
+            store_record(dataset_root, "1.json", {"project-code": "b2"})
+
+            # A crash after the part file was written, before the state was
+            output_directory.mkdir()
+            (output_directory / "part-00000.csv").write_text("path\nstale.json\n")
+            (output_directory / ".part-00001.csv.tmp").write_text("path\n")
+
+            exporter = RecordExporter(dataset_root, output_directory, "csv")
+            self.assertEqual(exporter.export(), 1)
+            self.assertEqual(
+                sorted(path.name for path in output_directory.iterdir()),
+                ["export-state.json", "part-00000.csv"])
+            with (output_directory / "part-00000.csv").open(newline="") as f:
+                self.assertEqual(
+                    [row["path"] for row in csv.DictReader(f)],
+                    ["input/2.3/1970/01/01/1.json"])
@@ -0,0 +1,104 @@
+import json
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+
+server_dir = Path(__file__).parents[1]
+
+sys.path.insert(0, str(server_dir))
+
+
+from record_index import DuplicateRecord, RecordIndex
+
+
+def create_result_object(hash_value: str,
+                         subject_pseudonym: str,
+                         date_of_test: str,
+                         time_stamp: float) -> dict:
+    return {
+        "source": {
+            "time_stamp": time_stamp,
+            "hash-value": hash_value,
+        },
+        "data": {
+            "project-code": "b2",
+            "subject-pseudonym": subject_pseudonym,
+            "date-of-test": date_of_test,
+        }
+    }
+
+
+class TestRecordIndex(unittest.TestCase):
+
+    def test_add_and_find(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            index = RecordIndex(Path(temp_dir) / "index.sqlite")
+            index.add("a.json", create_result_object("h1", "s1", "2010-01-02", 1.0))
+            index.add("b.json", create_result_object("h2", "s1", "2010-01-03", 2.0))
+            index.add("c.json", create_result_object("h3", "s2", "2010-01-02", 3.0))
+
+            self.assertEqual(
+                [entry["path"] for entry in index.find("s1")],
+                ["a.json", "b.json"])
+            self.assertEqual(
+                [entry["path"] for entry in index.find("s1", "2010-01-03")],
+                ["b.json"])
+            self.assertEqual(index.find("s2", project_code="a1"), [])
+
+            index.set_commit_hash("h1", "abc123")
+            self.assertEqual(index.get("h1")["commit_hash"], "abc123")
+            index.remove("h1")
+            self.assertIsNone(index.get("h1"))
+
+    def test_duplicate_detection(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            index = RecordIndex(Path(temp_dir) / "index.sqlite")
+            index.add("a.json", create_result_object("h1", "s1", "2010-01-02", 1.0), "abc123")
+            with self.assertRaises(DuplicateRecord) as context_manager:
+                index.add("b.json", create_result_object("h1", "s1", "2010-01-02", 2.0))
+            self.assertEqual(context_manager.exception.entry["path"], "a.json")
+            self.assertEqual(context_manager.exception.entry["commit_hash"], "abc123")
+
+    def test_rebuild(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dataset_root = Path(temp_dir)
+            record_directory = dataset_root / "input" / "2.3" / "1970" / "01" / "01"
+            record_directory.mkdir(parents=True)
+            for name, hash_value in (("1.json", "h1"), ("2.json", "h2"), ("3.json", "h1")):
+                with (record_directory / name).open("x") as f:
+                    json.dump(create_result_object(hash_value, "s1", "2010-01-02", float(name[0])), f)
+
+            index = RecordIndex(dataset_root / "index.sqlite")
+            index.add("x.json", create_result_object("h9", "s9", "2010-01-02", 9.0))
+            self.assertEqual(index.rebuild(dataset_root), 2)
+            self.assertIsNone(index.get("h9"))
+            self.assertEqual(index.get("h1")["path"], "input/2.3/1970/01/01/1.json")
+
+    def test_rebuild_keeps_commit_hashes(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dataset_root = Path(temp_dir) / "dataset"
+            record_directory = dataset_root / "input" / "2.3"
+            record_directory.mkdir(parents=True)
+            subprocess.run(["git", "init", "-q", str(dataset_root)], check=True)
+            for name, hash_value in (("1.json", "h1"), ("2.json", "h2"), ("3.json", "h3")):
+                with (record_directory / name).open("x") as f:
+                    json.dump(create_result_object(hash_value, "s1", "2010-01-02", float(name[0])), f)
+            git = ["git", "-C", str(dataset_root), "-c", "user.name=test", "-c", "user.email=test@example.com"]
+            subprocess.run([*git, "add", "input/2.3/1.json", "input/2.3/2.json"], check=True)
+            subprocess.run([*git, "commit", "-q", "-m", "add records"], check=True)
+            head = subprocess.run(
+                [*git, "rev-parse", "HEAD"],
+                check=True,
+                stdout=subprocess.PIPE).stdout.decode().strip()
+
+            index = RecordIndex(Path(temp_dir) / "index.sqlite")
+            index.add("input/2.3/old-1.json", create_result_object("h1", "s1", "2010-01-02", 1.0), "abc123")
+            self.assertEqual(index.rebuild(dataset_root), 3)
+            # Known commit hashes are kept, others are read from the history
+            self.assertEqual(index.get("h1")["commit_hash"], "abc123")
+            self.assertEqual(index.get("h1")["path"], "input/2.3/1.json")
+            self.assertEqual(index.get("h2")["commit_hash"], head)
+            self.assertIsNone(index.get("h3")["commit_hash"])
@@ -0,0 +1,101 @@
+import sys
+import unittest
+from pathlib import Path
+
+
+server_dir = Path(__file__).parents[1]
+
+sys.path.insert(0, str(server_dir))
+
+
+from record_rules import compare_partial_dates, compile_rules, get_partial_date
+from store_data import record_rules
+
+
+healthy_record = {
+    "date-of-birth": "1960-05-01",
+    "date-of-test": "2021-03-02",
+    "subject-group": "healthy",
+    "laterality-quotient": 80,
+    "go-nogo-block-count": 2,
+    "go-nogo-total-errors": 70,
+    "go-nogo-wrong-errors": 10,
+    "go-nogo-recognized-errors": 50,
+    "psqi-sleep-quality": 1,
+    "psqi-meds": 2,
+    "euroqol-vas": None,
+}
+
+
+class TestRecordRules(unittest.TestCase):
+
+    def test_valid_record(self):
+        self.assertEqual(record_rules.check(healthy_record, {}), [])
+
+    def test_range(self):
+        messages = record_rules.check(
+            {**healthy_record, "laterality-quotient": 101, "psqi-meds": -1},
+            {})
+        self.assertEqual(len(messages), 2)
+        self.assertTrue(messages[0].startswith("laterality-quotient: 101"))
+        self.assertTrue(messages[1].startswith("psqi-meds: -1"))
+
+    def test_per_unit_maximum(self):
+        messages = record_rules.check(
+            {**healthy_record, "go-nogo-block-count": 1}, {})
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(messages[0].startswith("go-nogo-total-errors: 70"))
+
+    def test_recognized_errors(self):
+        messages = record_rules.check(
+            {**healthy_record, "go-nogo-recognized-errors": 81}, {})
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(messages[0].startswith("go-nogo-recognized-errors must not"))
+
+    def test_patient_dates(self):
+        patient_record = {
+            **healthy_record,
+            "subject-group": "patient",
+            "patient-year-first-symptom": "2018",
+            "patient-month-first-symptom": "",
+            "patient-day-first-symptom": "",
+            "patient-year-diagnosis": "2018",
+            "patient-month-diagnosis": "4",
+            "patient-day-diagnosis": "",
+        }
+        self.assertEqual(record_rules.check(patient_record, {}), [])
+
+        messages = record_rules.check(
+            {**patient_record, "patient-year-diagnosis": "2017"}, {})
+        self.assertEqual(
+            messages,
+            ["The date of the first symptoms must be before the date of the diagnosis"])
+
+        messages = record_rules.check(
+            {**patient_record, "patient-year-first-symptom": "1950"}, {})
+        self.assertEqual(
+            messages,
+            ["The date of birth must be before the date of the first symptoms"])
+
+    def test_partial_dates(self):
+        self.assertEqual(
+            get_partial_date({"date": "2021-03-02"}, ("date",)),
+            (2021, 3, 2))
+        self.assertEqual(
+            get_partial_date({"y": "2021", "m": "", "d": ""}, ("y", "m", "d")),
+            (2021, None, None))
+        self.assertEqual(get_partial_date({"date": ""}, ("date",)), (None, None, None))
+        self.assertEqual(compare_partial_dates((2021, None, None), (2021, 3, 2)), 0)
+        self.assertGreater(compare_partial_dates((2021, 4, None), (2021, 3, 2)), 0)
+
+    def test_posted_sum(self):
+        self.assertEqual(record_rules.check(healthy_record, {"psqi-sum": ["3"]}), [])
+        self.assertEqual(
+            record_rules.check(healthy_record, {"psqi-sum": ["4"]}),
+            ["psqi-sum: 4 is not the sum of psqi-sleep-quality, psqi-sleep-latency, "
+             "psqi-sleep-duration, psqi-sleep-efficiency, psqi-sleep-disturbance, "
+             "psqi-meds, psqi-day-dysfunction"])
+
+    def test_not_a_number(self):
+        rules = compile_rules({"year": (1900, 2050)}, [], [], [], {})
+        self.assertEqual(rules.check({"year": "abc"}, {}), ["year: 'abc' is not a number"])
@@ -0,0 +1,68 @@
+import json
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+
+server_dir = Path(__file__).parents[1]
+
+sys.path.insert(0, str(server_dir))
+
+
+from record_statistics import RecordStatistics
+
+
+def store_record(dataset_root: Path, name: str, data: dict):
+    record_directory = dataset_root / "input" / "2.3" / "1970" / "01" / "01"
+    record_directory.mkdir(parents=True, exist_ok=True)
+    with (record_directory / name).open("x") as f:
+        json.dump({"source": {"time_stamp": 1.5, "hash-value": name}, "data": data}, f)
+    subprocess.run(["git", "-C", str(dataset_root), "add", "."], check=True)
+    subprocess.run(
+        ["git", "-C", str(dataset_root), "commit", "-q", "-m", f"add {name}"],
+        check=True)
+
+
+class TestRecordStatistics(unittest.TestCase):
+
+    def test_incremental_statistics(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dataset_root = Path(temp_dir) / "dataset"
+            checkpoint_path = Path(temp_dir) / "statistics.json"
+            subprocess.run(["git", "init", "-q", str(dataset_root)], check=True)
+            for name, project_code, arat_left in (("1.json", "b2", 10), ("2.json", "b2", None), ("3.json", "a1", 4)):
+                store_record(
+                    dataset_root,
+                    name,
+                    {
+                        "form-data-version": "2.3",
+                        "project-code": project_code,
+                        "arat-left": arat_left,
+                        "repeated-test": True,
+                    })
+
+            statistics = RecordStatistics(checkpoint_path, batch_size=2)
+            self.assertEqual(statistics.update(dataset_root), 3)
+            self.assertEqual(
+                statistics.record_counts(),
+                [("a1", "2.3", 1), ("b2", "2.3", 2)])
+
+            arat_left = statistics.field_statistics("b2")["arat-left"]
+            self.assertEqual(arat_left["count"], 1)
+            self.assertEqual(arat_left["missing_rate"], 0.5)
+            self.assertEqual(arat_left["mean"], 10.0)
+
+            store_record(dataset_root, "4.json", {"form-data-version": "2.3", "project-code": "a1", "arat-left": 6})
+
+            # A new instance continues from the checkpoint
+            statistics = RecordStatistics(checkpoint_path)
+            self.assertEqual(statistics.update(dataset_root), 1)
+            arat_left = statistics.field_statistics(version="2.3")["arat-left"]
+            self.assertEqual(arat_left["count"], 3)
+            self.assertAlmostEqual(arat_left["mean"], 20 / 3)
+            self.assertEqual((arat_left["minimum"], arat_left["maximum"]), (4.0, 10.0))
+            self.assertAlmostEqual(statistics.field_statistics("a1")["arat-left"]["standard_deviation"], 1.0)
+            self.assertEqual(statistics.field_statistics("a1")["repeated-test"]["mean"], 1.0)
+            self.assertEqual(statistics.field_statistics("a1")["subject-pseudonym"], {"count": 0, "missing_rate": 1.0})
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+from urllib.parse import parse_qs
+
+from webtest import TestApp
+
+
+server_dir = Path(__file__).parents[1]
+tool_path = Path(__file__).parents[2] / "tools" / "replay_requests.py"
+template_dir = Path(__file__).parents[2] / "templates"
+
+sys.path.insert(0, str(server_dir))
+
+
+import store_data
+from request_log import RequestLog, replay
+from store_data import (
+    DATASET_ROOT_KEY,
+    HOME_KEY,
+    PUSH_JOURNAL_KEY,
+    REQUEST_LOG_KEY,
+    REQUEST_LOG_PERSONAL_DATA_KEY,
+    TEMPLATE_DIRECTORY_KEY,
+)
+from test_store_data import create_batch_record, get_stored_records, minimal_form_data
+
+
+def create_offline_configuration(temp_dir: Path, name: str) -> dict:
+    dataset_path = temp_dir / name
+    subprocess.run(["datalad", "create", "--no-annex", str(dataset_path)], check=True)
+    return {
+        DATASET_ROOT_KEY: str(dataset_path),
+        HOME_KEY: os.environ["HOME"],
+        TEMPLATE_DIRECTORY_KEY: str(template_dir),
+        PUSH_JOURNAL_KEY: str(temp_dir / f"{name}-push-journal"),
+    }
+
+
+class TestRequestLog(unittest.TestCase):
+
+    def test_chronological_entries(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            request_log = RequestLog(Path(temp_dir) / "requests.jsonl", max_bytes=100, backup_count=3)
+            for number in range(20):
+                request_log.append({"number": number})
+
+            numbers = [entry["number"] for entry in request_log.chronological_entries()]
+            self.assertEqual(numbers, sorted(numbers))
+            self.assertEqual(numbers[-1], 19)
+            self.assertTrue(request_log.backup_path(3).exists())
+
+    def test_capture_and_replay(self):
+        with tempfile.TemporaryDirectory() as temp_dir_name, \
+                patch("time.time") as time_mock:
+
+            time_mock.return_value = 0.0
+            temp_dir = Path(temp_dir_name)
+            log_path = temp_dir / "requests.jsonl"
+            configuration = create_offline_configuration(temp_dir, "dataset")
+            app_tester = TestApp(store_data.application)
+            extra_environ = {
+                **configuration,
+                REQUEST_LOG_KEY: str(log_path),
+                "REMOTE_ADDR": "1.2.3.4"
+            }
+            app_tester.post(
+                url="/store-data",
+                params=minimal_form_data,
+                headers={"Idempotency-Key": "form-1"},
+                extra_environ=extra_environ)
+            app_tester.post(
+                url="/store-data/batch",
+                params=json.dumps([create_batch_record("test-112")]),
+                content_type="application/json",
+                extra_environ=extra_environ)
+            # Malformed forms are not captured
+            app_tester.post(
+                url="/store-data",
+                params=minimal_form_data + "&no-such-field=1",
+                extra_environ=extra_environ,
+                expect_errors=True)
+
+            entries = list(RequestLog(log_path).chronological_entries())
+            self.assertEqual(
+                [(entry["path"], entry.get("idempotency_key")) for entry in entries],
+                [("/store-data", "form-1"), ("/store-data/batch", None)])
+            self.assertEqual(
+                entries[0]["fields"],
+                {name: values[0] for name, values in parse_qs(minimal_form_data).items()})
+            self.assertEqual([entry["sanitized"] for entry in entries], [True, True])
+            self.assertNotIn("1.2.3.4", log_path.read_text())
+
+            # Replay the records into a throwaway dataset
+            replay_configuration = create_offline_configuration(temp_dir, "rebuilt")
+            results = replay(entries, store_data.application, replay_configuration, concurrency=2)
+            self.assertEqual([status for status, _, _ in results], ["200 OK", "200 OK"])
+            # Replayed records only get new time stamps and addresses
+            original_records, rebuilt_records = [
+                [json.loads(path.read_text()) for path in get_stored_records(temp_dir / name)]
+                for name in ("dataset", "rebuilt")
+            ]
+            self.assertEqual(
+                sorted((record["source"]["hash-value"], record["data"]) for record in rebuilt_records),
+                sorted((record["source"]["hash-value"], record["data"]) for record in original_records))
+
+    def test_replay_speed(self):
+        calls = []
+
+        def application(environ, start_response):
+            calls.append((time.monotonic(), environ["wsgi.input"].read()))
+            start_response("200 OK", [])
+            return [b"ok"]
+
+        entries = [
+            {"time": 100.0, "path": "/store-data", "fields": {"a": "1"}},
+            {"time": 100.4, "path": "/store-data", "fields": {"a": "2"}},
+        ]
+        results = replay(entries, application, dict(), speed=2.0)
+        self.assertEqual(results[0][:2], ("200 OK", b"ok"))
+        self.assertEqual([body for _, body in calls], [b"a=1", b"a=2"])
+        self.assertGreaterEqual(calls[1][0] - calls[0][0], 0.19)
+
+    def test_personal_data_not_logged(self):
+        record = create_batch_record("test-113")
+        record["additional-remarks"] = "tired; asked for a break"
+        record["hashed-string"] += record["additional-remarks"]
+        record["hash-value"] = hashlib.sha256(record["hashed-string"].encode()).hexdigest()
+        record["signature-data"] = "data:image/png;base64," + "iVBORw0KGgo" * 10
+
+        with tempfile.TemporaryDirectory() as temp_dir_name, \
+                patch("time.time") as time_mock:
+
+            time_mock.return_value = 0.0
+            temp_dir = Path(temp_dir_name)
+            configuration = create_offline_configuration(temp_dir, "dataset")
+            app_tester = TestApp(store_data.application)
+            for name, personal_data in (("sanitized", "false"), ("complete", "true")):
+                app_tester.post(
+                    url="/store-data/batch",
+                    params=json.dumps([record]),
+                    content_type="application/json",
+                    extra_environ={
+                        **configuration,
+                        REQUEST_LOG_KEY: str(temp_dir / f"{name}.jsonl"),
+                        REQUEST_LOG_PERSONAL_DATA_KEY: personal_data,
+                        "REMOTE_ADDR": "1.2.3.4"
+                    })
+
+            sanitized_log = (temp_dir / "sanitized.jsonl").read_text()
+            self.assertNotIn("tired", sanitized_log)
+            self.assertNotIn("iVBORw0KGgo", sanitized_log)
+            logged_record = json.loads(sanitized_log)["records"][0]
+            self.assertEqual(
+                logged_record["signature-data"],
+                f"omitted:{len(record['signature-data'])}")
+            self.assertTrue(logged_record["additional-remarks"].startswith("sha256:"))
+            self.assertEqual(
+                logged_record["hash-value"],
+                hashlib.sha256(logged_record["hashed-string"].encode()).hexdigest())
+
+            complete_entry = json.loads((temp_dir / "complete.jsonl").read_text())
+            self.assertEqual(complete_entry["records"], [record])
+            self.assertFalse(complete_entry["sanitized"])
+
+            # Sanitized submissions are still accepted
+            replay_configuration = create_offline_configuration(temp_dir, "rebuilt")
+            results = replay(
+                RequestLog(temp_dir / "sanitized.jsonl").chronological_entries(),
+                store_data.application,
+                replay_configuration)
+            self.assertEqual([status for status, _, _ in results], ["200 OK"])
+
+    def test_sanitized_replay_only_into_throwaway_dataset(self):
+        with tempfile.TemporaryDirectory() as temp_dir_name:
+            temp_dir = Path(temp_dir_name)
+            log_path = temp_dir / "requests.jsonl"
+            request_log = RequestLog(log_path)
+            request_log.append({"time": 1.0, "path": "/store-data", "sanitized": False, "fields": {}})
+            request_log.append({"time": 2.0, "path": "/store-data", "fields": {}})
+
+            result = subprocess.run(
+                [
+                    sys.executable,
+                    str(tool_path),
+                    str(log_path),
+                    "--dataset", str(temp_dir / "dataset")
+                ],
+                stderr=subprocess.PIPE)
+            self.assertEqual(result.returncode, 2)
+            self.assertIn(b"1 submission(s) were logged without signatures", result.stderr)
+            self.assertFalse((temp_dir / "dataset").exists())
@@ -0,0 +1,205 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from typing import List
+
+
+server_dir = Path(__file__).parents[1]
+
+sys.path.insert(0, str(server_dir))
+
+
+from record_index import RecordIndex
+from spool import Spool, SpoolWorker
+
+
+def create_files(directory: Path, names: List[str]) -> List[Path]:
+    """Create record files, a pending receipt must refer to existing files"""
+    directory.mkdir(parents=True, exist_ok=True)
+    files = [directory / name for name in names]
+    for file in files:
+        file.write_text("{}")
+    return files
+
+
+class TestSpool(unittest.TestCase):
+
+    def test_enqueue_and_lookup(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            spool = Spool(Path(temp_dir) / "spool")
+            dataset_root = Path(temp_dir) / "d"
+            files = create_files(dataset_root, ["a.json"])
+            reference = spool.enqueue(dataset_root, files, Path("/h"))
+            self.assertIsNone(spool.lookup(reference))
+            self.assertRaises(KeyError, spool.lookup, "0000")
+            self.assertRaises(KeyError, spool.lookup, "../done/x")
+
+            claimed_path, receipt = spool.claim()
+            self.assertEqual(receipt["reference"], reference)
+            self.assertIsNone(spool.claim())
+            self.assertIsNone(spool.lookup(reference))
+
+            spool.complete(claimed_path, receipt, "abc123")
+            self.assertEqual(spool.lookup(reference), "abc123")
+
+    def test_claim_order(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            spool = Spool(Path(temp_dir) / "spool")
+            dataset_root = Path(temp_dir) / "d"
+            files = create_files(dataset_root, [f"{i}.json" for i in range(5)])
+            references = [
+                spool.enqueue(dataset_root, [file], Path("/h"))
+                for file in files]
+            claimed = [spool.claim()[1]["reference"] for _ in range(5)]
+            self.assertEqual(references, claimed)
+
+    def test_worker_retries_failed_commits(self):
+        calls = []
+
+        def commit_function(dataset_root, files, home):
+            calls.append(files)
+            if len(calls) == 1:
+                raise RuntimeError("first commit fails")
+            return "c0ffee"
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            spool = Spool(Path(temp_dir) / "spool")
+            dataset_root = Path(temp_dir) / "d"
+            files = create_files(dataset_root, ["a.json"])
+            reference = spool.enqueue(dataset_root, files, Path("/h"))
+            worker = SpoolWorker(spool, commit_function)
+            worker.drain()
+            self.assertIsNone(spool.lookup(reference))
+            worker.drain()
+            self.assertEqual(spool.lookup(reference), "c0ffee")
+            self.assertEqual(calls, [files, files])
+
+    def test_worker_batches(self):
+        calls = []
+
+        def commit_function(dataset_root, files, home):
+            calls.append((dataset_root, files))
+            return "c0ffee"
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            spool = Spool(Path(temp_dir) / "spool")
+            dataset_root = Path(temp_dir) / "d"
+            files = create_files(dataset_root, [f"{i}.json" for i in range(5)])
+            references = [
+                spool.enqueue(dataset_root, [file], Path("/h"))
+                for file in files]
+            other_root = Path(temp_dir) / "e"
+            other_files = create_files(other_root, ["0.json"])
+            references.append(
+                spool.enqueue(other_root, other_files, Path("/h")))
+            SpoolWorker(spool, commit_function, batch_size=3).drain()
+            self.assertEqual(calls, [
+                (dataset_root, files[:3]),
+                (dataset_root, files[3:]),
+                (other_root, other_files)])
+            for reference in references:
+                self.assertEqual(spool.lookup(reference), "c0ffee")
+
+    def test_recover_claimed(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            spool = Spool(Path(temp_dir) / "spool")
+            dataset_root = Path(temp_dir) / "d"
+            files = create_files(dataset_root, ["a.json"])
+            reference = spool.enqueue(dataset_root, files, Path("/h"))
+            spool.claim()
+            spool.recover()
+            self.assertEqual(spool.claim()[1]["reference"], reference)
+
+    def test_enqueue_missing_file(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            spool = Spool(Path(temp_dir) / "spool")
+            self.assertRaises(
+                FileNotFoundError,
+                spool.enqueue, Path(temp_dir), [Path(temp_dir) / "a.json"], Path("/h"))
+            self.assertIsNone(spool.claim())
+
+    def test_remove_done(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            spool = Spool(Path(temp_dir) / "spool")
+            dataset_root = Path(temp_dir) / "d"
+            references = [
+                spool.enqueue(dataset_root, [file], Path("/h"))
+                for file in create_files(dataset_root, ["a.json", "b.json"])]
+            for commit_hash in ("c0ffee", "beef"):
+                spool.complete(*spool.claim(), commit_hash)
+            old_receipt = spool.directory / "done" / (references[0] + ".json")
+            old_time = time.time() - 3600
+            os.utime(old_receipt, (old_time, old_time))
+
+            self.assertEqual(spool.remove_done(1800), 1)
+            self.assertRaises(KeyError, spool.lookup, references[0])
+            self.assertEqual(spool.lookup(references[1]), "beef")
+
+    def test_worker_updates_record_index(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            spool = Spool(Path(temp_dir) / "spool")
+            dataset_root = Path(temp_dir) / "d"
+            index_path = Path(temp_dir) / "index.sqlite"
+            record_index = RecordIndex(index_path)
+            record_index.add("a.json", {
+                "source": {"hash-value": "1234", "time_stamp": 0.0},
+                "data": {"subject-pseudonym": "test-111"}})
+
+            spool.enqueue(
+                dataset_root,
+                create_files(dataset_root, ["a.json"]),
+                Path("/h"),
+                index_path,
+                ["1234"])
+            SpoolWorker(spool, lambda *_: "c0ffee").drain()
+            self.assertEqual(record_index.get("1234")["commit_hash"], "c0ffee")
+
+    def test_unreadable_receipt(self):
+        commits = []
+        with tempfile.TemporaryDirectory() as temp_dir:
+            spool = Spool(Path(temp_dir) / "spool")
+            dataset_root = Path(temp_dir) / "d"
+            (spool.directory / "pending" / "0000-truncated.json").write_text('{"reference": ')
+            (spool.directory / "pending" / "0001-incomplete.json").write_text('{"reference": "0001"}')
+            reference = spool.enqueue(dataset_root, create_files(dataset_root, ["a.json"]), Path("/h"))
+
+            SpoolWorker(spool, lambda *arguments: commits.append(arguments) or "c0ffee").drain()
+            self.assertEqual(spool.lookup(reference), "c0ffee")
+            self.assertEqual(len(commits), 1)
+            self.assertEqual(
+                sorted(path.name for path in (spool.directory / "failed").iterdir()),
+                ["0000-truncated.json", "0001-incomplete.json"])
+            self.assertEqual(list((spool.directory / "claimed").iterdir()), [])
+
+    def test_worker_backs_off_after_failures(self):
+        results = ["c0ffee"]
+
+        def commit_function(dataset_root, files, home):
+            if not results:
+                raise RuntimeError("dataset is broken")
+            return results.pop()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            spool = Spool(Path(temp_dir) / "spool")
+            dataset_root = Path(temp_dir) / "d"
+            files = create_files(dataset_root, [f"{i}.json" for i in range(2)])
+            worker = SpoolWorker(spool, commit_function)
+            spool.enqueue(dataset_root, files[:1], Path("/h"))
+            worker.drain()
+            self.assertEqual(worker.failures, 0)
+
+            reference = spool.enqueue(dataset_root, files[1:], Path("/h"))
+            for _ in range(3):
+                worker.drain()
+            self.assertEqual(worker.failures, 3)
+            self.assertEqual(worker._retry_delay(), 4.0)
+            worker.failures = 10 ** 6
+            self.assertEqual(worker._retry_delay(), 300.0)
+
+            results.append("beef")
+            worker.drain()
+            self.assertEqual(worker.failures, 0)
+            self.assertEqual(spool.lookup(reference), "beef")
@@ -0,0 +1,40 @@
+import os
+import sys
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+
+
+server_dir = Path(__file__).parents[1]
+
+sys.path.insert(0, str(server_dir))
+
+
+from storage_backend import DataladApiBackend, get_environment
+
+
+class TestStorageBackend(unittest.TestCase):
+
+    def test_datalad_api_home_not_visible(self):
+        original_home = os.environ.get("HOME")
+        environments = []
+        reader = threading.Thread(target=lambda: environments.append(get_environment()))
+
+        def save(**_):
+            self.assertEqual(os.environ["HOME"], "/datalad-home")
+            # Readers of the environment wait until HOME is restored
+            reader.start()
+            reader.join(0.2)
+            self.assertTrue(reader.is_alive())
+
+        dataset = MagicMock()
+        dataset.save.side_effect = save
+        backend = DataladApiBackend()
+        backend.datasets[Path("/d")] = dataset
+        backend.save(Path("/d"), [Path("/d/a.json")], "message", Path("/datalad-home"))
+        reader.join(10)
+
+        dataset.save.assert_called_once()
+        self.assertEqual(os.environ.get("HOME"), original_home)
+        self.assertEqual(environments[0].get("HOME"), original_home)
@@ -1,12 +1,19 @@
+import base64
+import hashlib
 import json
+import multiprocessing
 import os
+import re
 import subprocess
 import sys
+import threading
 import unittest
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 from unittest.mock import patch
+from urllib.parse import parse_qs, quote_plus
 
 from webtest import TestApp
 from webtest.app import AppError
@@ -22,9 +29,23 @@ import store_data
 from store_data import (
     get_int_value,
     DATASET_ROOT_KEY,
+    DEFERRED_PUSH_KEY,
+    ERROR_JOURNAL_KEY,
     HOME_KEY,
+    PUSH_JOURNAL_KEY,
+    RECORD_INDEX_KEY,
+    SIGNATURE_FILES_KEY,
+    SPOOL_DIRECTORY_KEY,
+    STORAGE_BACKEND_KEY,
+    SUBMISSION_CACHE_KEY,
     TEMPLATE_DIRECTORY_KEY,
+    TIMING_LOG_KEY,
+    WARMUP_HOOK_KEY,
 )
+from circuit_breaker import CircuitBreaker
+from error_journal import ErrorJournal
+from push_journal import PushJournal
+from storage_backend import get_storage_backend, storage_backends
 
 
 minimal_form_data = """form-data-version=2.3&data-entry-domain=de.sfb1451.z03&data-entry-employee=cm-test&project-code=b2&subject-pseudonym=test-111&date-of-birth=2000-01-01&sex=male&date-of-test=2010-01-02&subject-group=healthy&patient-year-first-symptom=&patient-month-first-symptom=&patient-day-first-symptom=&patient-year-diagnosis=&patient-month-diagnosis=&patient-day-diagnosis=&additional-remarks=&hashed-string=form-data-version%3A2.3%3Bdata-entry-domain%3Ade.sfb1451.z03%3Bdata-entry-employee%3Acm-test%3Bproject-code%3Ab2%3Bsubject-pseudonym%3Atest-111%3Bdate-of-birth%3A2000-01-01%3Bsex%3Amale%3Bdate-of-test%3A2010-01-02%3Brepeated-test%3AFalse%3Bpatient-year-first-symptom%3A%3Bpatient-month-first-symptom%3A%3Bpatient-day-first-symptom%3A%3Bpatient-year-diagnosis%3A%3Bpatient-month-diagnosis%3A%3Bpatient-day-diagnosis%3A%3Bpatient-main-disease%3A%3Bpatient-stronger-impacted-hand%3A%3Blaterality-quotient%3A%3Bmaximum-ftf-left%3A%3Bmaximum-ftf-right%3A%3Bmaximum-gs-left%3A%3Bmaximum-gs-right%3A%3Bpurdue-pegboard-left%3A%3Bpurdue-pegboard-right%3A%3Bturn-cards-left%3A%3Bturn-cards-right%3A%3Bsmall-things-left%3A%3Bsmall-things-right%3A%3Bsimulated-feeding-left%3A%3Bsimulated-feeding-right%3A%3Bcheckers-left%3A%3Bcheckers-right%3A%3Blarge-light-things-left%3A%3Blarge-light-things-right%3A%3Blarge-heavy-things-left%3A%3Blarge-heavy-things-right%3A%3Bjtt-incorrectly-executed%3A%3Barat-left%3A%3Barat-right%3A%3Btug-executed%3A%3Btug-a-incorrectly-executed%3A%3Btug-a-tools-required%3A%3Btug-imagined%3A%3Bgo-nogo-block-count%3A%3Bgo-nogo-total-errors%3A%3Bgo-nogo-wrong-errors%3A%3Bgo-nogo-recognized-errors%3A%3Bgo-nogo-correct-answer-time%3A%3Bgo-nogo-recognized-error-time%3A%3Bgo-nogo-incorrectly-executed%3A%3Bkas-pantomime-bukko-facial%3A%3Bkas-pantomime-arm-hand%3A%3Bkas-imitation-bukko-facial%3A%3Bkas-imitation-arm-hand%3A%3Bkopss-orientation%3A%3Bkopss-speech%3A%3Bkopss-praxie%3A%3Bkopss-visual-spatial-performance%3A%3Bkopss-calculating%3A%3Bkopss-executive-performance%3A%3Bkopss-memory%3A%3Bkopss-affect%3A%3Bkopss-behavior-observation%3A%3Bacl-k-loud-reading%3A%3Bacl-k-color-form-test%3A%3Bacl-k-supermarket-task%3A%3Bacl-k-communication-ability%3A%3Bbdi-ii-score%3A%3Bmadrs-score%3A%3Bdemtect-wordlist%3A%3Bdemtect-convert-numbers%3A%3Bdemtect-supermarket-task%3A%3Bdemtect-numbers-reverse%3A%3Bdemtect-wordlist-recall%3A%3Btime-tmt-a%3A%3Btmt-a-incorrectly-executed%3A%3Btime-tmt-b%3A%3Btmt-b-incorrectly-executed%3A%3Bmrs-score%3A%3Beuroqol-code%3A%3Beuroqol-vas%3A%3Bisced-value%3A%3Bpsqi-sleep-quality%3A%3Bpsqi-sleep-latency%3A%3Bpsqi-sleep-duration%3A%3Bpsqi-sleep-efficiency%3A%3Bpsqi-sleep-disturbance%3A%3Bpsqi-meds%3A%3Bpsqi-day-dysfunction%3A%3Badditional-mrt-url%3A%3Badditional-mrt-resting-state%3A%3Badditional-mrt-tapping-task%3A%3Badditional-mrt-anatomical-representation%3A%3Badditional-mrt-dti%3A%3Badditional-eeg-url%3A%3Badditional-blood-sampling-url%3A%3Badditional-remarks%3A&hash-value=ce79e0bf021bf3770a7747a5328ab59aab7edb26f5d90dd168c39cf0c59d548c&signature-data="""
@@ -32,6 +53,29 @@ minimal_form_data = """form-data-version=2.3&data-entry-domain=de.sfb1451.z03&da
 form_data_version = minimal_form_data.split("&")[0].split("=")[1]
 
 
+def create_batch_record(subject_pseudonym: str) -> Dict[str, str]:
+    """A record of the minimal form with another pseudonym and its hash"""
+    record = {name: values[0] for name, values in parse_qs(minimal_form_data).items()}
+    record["subject-pseudonym"] = subject_pseudonym
+    record["hashed-string"] = record["hashed-string"].replace(
+        "subject-pseudonym:test-111", f"subject-pseudonym:{subject_pseudonym}")
+    record["hash-value"] = hashlib.sha256(record["hashed-string"].encode()).hexdigest()
+    return record
+
+
+def get_stored_records(dataset_path: Path) -> List[Path]:
+    # time.time is patched to return 0.0, i.e. 1970-01-01
+    return sorted(dataset_path.glob(f"input/{form_data_version}/1970/01/01/*.json"))
+
+
+# Configurations with which the warm-up hook was called
+warmup_hook_calls = []
+
+
+def record_warmup_hook(configuration):
+    warmup_hook_calls.append(configuration)
+
+
 class TestStoreData(unittest.TestCase):
 
     def _test_exception_caught(self,
@@ -52,13 +96,25 @@ class TestStoreData(unittest.TestCase):
 
     def test_missing_environ_catching(self):
         app_tester = TestApp(store_data.application)
-        self._test_exception_caught(
-            app_tester=app_tester,
-            params="Hello",
-            extra_environ={},
-            patterns=[
-                "<c.moench@fz-juelich.de>",
-                f"KeyError: '{DATASET_ROOT_KEY}'"])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            journal_path = Path(temp_dir) / "errors"
+            with self.assertRaises(AppError) as context_manager:
+                app_tester.post(
+                    url="/store-data",
+                    params=minimal_form_data,
+                    extra_environ={ERROR_JOURNAL_KEY: str(journal_path)})
+
+            # The response only contains the error ID, the details are in
+            # the error journal
+            error_message = context_manager.exception.args[0]
+            self.assertIn("<c.moench@fz-juelich.de>", error_message)
+            self.assertNotIn("test-111", error_message)
+            error_id = re.search(r"error ID: (\S+) \(KeyError\)", error_message).group(1)
+
+            entry = ErrorJournal(journal_path).find(error_id)
+            self.assertIn(f"KeyError: '{DATASET_ROOT_KEY}'", entry["exception"])
+            self.assertEqual(entry["fields"]["subject-pseudonym"], ["test-111"])
+            self.assertEqual(entry["environ"]["PATH_INFO"], "/store-data")
 
     def test_missing_data_catching(self):
         app_tester = TestApp(store_data.application)
@@ -74,12 +130,136 @@ class TestStoreData(unittest.TestCase):
                 "keys are missing",
                 "project-code"])
 
+    def test_storage_in_same_clock_tick(self):
+        app_tester = TestApp(store_data.application)
+        with tempfile.TemporaryDirectory() as temp_dir:
+
+            with \
+                    patch("store_data.add_files_to_dataset") as add_file_mock, \
+                    patch("time.time") as time_mock:
+
+                add_file_mock.return_value = 0
+                time_mock.return_value = 0.0
+
+                for _ in range(3):
+                    app_tester.post(
+                        url="/store-data",
+                        params=minimal_form_data,
+                        extra_environ={
+                            DATASET_ROOT_KEY: temp_dir,
+                            HOME_KEY: os.environ["HOME"],
+                            TEMPLATE_DIRECTORY_KEY: str(template_dir),
+                            "REMOTE_ADDR": "1.2.3.4"
+                        })
+
+            time_stamps = []
+            for path in get_stored_records(Path(temp_dir)):
+                with path.open() as f:
+                    time_stamps.append(json.load(f)["source"]["time_stamp"])
+            self.assertEqual(len(time_stamps), 3)
+            self.assertEqual(time_stamps, sorted(set(time_stamps)))
+
+    def test_duplicate_record_rejected(self):
+        app_tester = TestApp(store_data.application)
+        with tempfile.TemporaryDirectory() as temp_dir:
+
+            with \
+                    patch("store_data.add_files_to_dataset") as add_file_mock, \
+                    patch("time.time") as time_mock:
+
+                add_file_mock.return_value = "abc123"
+                time_mock.return_value = 0.0
+
+                environ = {
+                    DATASET_ROOT_KEY: temp_dir,
+                    HOME_KEY: os.environ["HOME"],
+                    TEMPLATE_DIRECTORY_KEY: str(template_dir),
+                    RECORD_INDEX_KEY: str(Path(temp_dir) / "index.sqlite"),
+                    "REMOTE_ADDR": "1.2.3.4"
+                }
+                app_tester.post(
+                    url="/store-data",
+                    params=minimal_form_data,
+                    extra_environ=environ)
+                self._test_exception_caught(
+                    app_tester=app_tester,
+                    params=minimal_form_data,
+                    extra_environ=environ,
+                    patterns=[
+                        "409",
+                        "already stored",
+                        "-abc123"])
+
+            self.assertEqual(len(get_stored_records(Path(temp_dir))), 1)
+            self.assertEqual(add_file_mock.call_count, 1)
+
+    def test_retry_gets_original_receipt(self):
+        app_tester = TestApp(store_data.application)
+        with tempfile.TemporaryDirectory() as temp_dir:
+
+            with \
+                    patch("store_data.add_files_to_dataset") as add_files_mock, \
+                    patch("time.time") as time_mock:
+
+                add_files_mock.return_value = "abc123"
+                time_mock.return_value = 0.0
+
+                environ = {
+                    DATASET_ROOT_KEY: temp_dir,
+                    HOME_KEY: os.environ["HOME"],
+                    TEMPLATE_DIRECTORY_KEY: str(template_dir),
+                    SUBMISSION_CACHE_KEY: str(Path(temp_dir) / "cache.sqlite"),
+                    "REMOTE_ADDR": "1.2.3.4"
+                }
+                responses = [
+                    app_tester.post(
+                        url="/store-data",
+                        params=minimal_form_data,
+                        headers={"Idempotency-Key": "tablet-7-42"},
+                        extra_environ=environ)
+                    for _ in range(2)]
+
+            self.assertEqual(responses[0].body, responses[1].body)
+            self.assertIn(b"-abc123", responses[1].body)
+            self.assertEqual(len(get_stored_records(Path(temp_dir))), 1)
+            self.assertEqual(add_files_mock.call_count, 1)
+
+    def test_unknown_field_rejected(self):
+        app_tester = TestApp(store_data.application)
+        self._test_exception_caught(
+            app_tester=app_tester,
+            params=minimal_form_data + "&no-such-field=1",
+            extra_environ={
+                DATASET_ROOT_KEY: "",
+                HOME_KEY: "",
+                TEMPLATE_DIRECTORY_KEY: ""
+            },
+            patterns=[
+                "400",
+                "unknown form field: no-such-field"])
+
+    def test_rule_violation_rejected(self):
+        app_tester = TestApp(store_data.application)
+        with patch("store_data.add_files_to_dataset") as add_files_mock:
+            self._test_exception_caught(
+                app_tester=app_tester,
+                params=minimal_form_data + "&laterality-quotient=500",
+                extra_environ={
+                    DATASET_ROOT_KEY: "",
+                    HOME_KEY: "",
+                    TEMPLATE_DIRECTORY_KEY: ""
+                },
+                patterns=[
+                    "400",
+                    "laterality-quotient: 500 is not between -100 and 100"])
+            add_files_mock.assert_not_called()
+
     def test_data_storage(self):
         app_tester = TestApp(store_data.application)
         with tempfile.TemporaryDirectory() as temp_dir:
 
             with \
-                    patch("store_data.add_file_to_dataset") as add_file_mock, \
+                    patch("store_data.add_files_to_dataset") as add_file_mock, \
                     patch("time.time") as time_mock:
 
                 add_file_mock.return_value = 0
@@ -95,30 +275,125 @@ class TestStoreData(unittest.TestCase):
                         "REMOTE_ADDR": "1.2.3.4"
                     })
 
-            expected_path = Path(temp_dir) / f"input/{form_data_version}/0.0.json"
+            expected_path, = get_stored_records(Path(temp_dir))
+            self.assertRegex(expected_path.name, r"^0\.\d{6}-[0-9a-f]{12}\.json$")
             with expected_path.open() as f:
                 json_object = json.load(f)
         print(json_object)
 
-    def test_datalad_saving(self):
+    def _create_dataset_with_sibling(self, temp_dir: str):
+        dataset_path = Path(temp_dir) / "dataset"
+        subprocess.run(
+            ["datalad", "create", "--no-annex", str(dataset_path)],
+            check=True
+        )
+
+        sibling_path = Path(temp_dir) / "entrystore"
+        sibling_path.mkdir()
+        subprocess.run(
+            [
+                "datalad", "create-sibling", "-d", str(dataset_path), "-s",
+                "entrystore", str(sibling_path)
+            ],
+            check=True
+        )
+        return dataset_path, sibling_path
+
+    def test_signature_file_storage(self):
         app_tester = TestApp(store_data.application)
+        signature = b"\x89PNG signature"
+        signature_url = "data:image/png;base64," + base64.b64encode(signature).decode()
         with tempfile.TemporaryDirectory() as temp_dir:
 
-            dataset_path = Path(temp_dir) / "dataset"
-            subprocess.run(
-                ["datalad", "create", "--no-annex", str(dataset_path)],
-                check=True
-            )
+            with \
+                    patch("store_data.add_files_to_dataset") as add_files_mock, \
+                    patch("time.time") as time_mock:
 
-            sibling_path = Path(temp_dir) / "entrystore"
-            sibling_path.mkdir()
-            subprocess.run(
+                add_files_mock.return_value = 0
+                time_mock.return_value = 0.0
+
+                app_tester.post(
+                    url="/store-data",
+                    params=minimal_form_data + quote_plus(signature_url),
+                    extra_environ={
+                        DATASET_ROOT_KEY: temp_dir,
+                        HOME_KEY: os.environ["HOME"],
+                        TEMPLATE_DIRECTORY_KEY: str(template_dir),
+                        SIGNATURE_FILES_KEY: "yes",
+                        "REMOTE_ADDR": "1.2.3.4"
+                    })
+
+            version_path = Path(temp_dir) / f"input/{form_data_version}"
+            record_path, = get_stored_records(Path(temp_dir))
+            with record_path.open() as f:
+                source = json.load(f)["source"]
+
+            signature_path = f"input/{form_data_version}/signatures/{hashlib.sha256(signature).hexdigest()}.png"
+            self.assertIsNone(source["signature-data"])
+            self.assertEqual(source["signature-file"], signature_path)
+            self.assertEqual((Path(temp_dir) / signature_path).read_bytes(), signature)
+            self.assertEqual(
+                add_files_mock.call_args[0][1],
                 [
-                    "datalad", "create-sibling", "-d", str(dataset_path), "-s",
-                    "entrystore", str(sibling_path)
-                ],
-                check=True
-            )
+                    record_path,
+                    Path(temp_dir) / signature_path,
+                    version_path / "signatures/.gitattributes"
+                ])
+
+    def test_concurrent_signature_files(self):
+        signature = b"\x89PNG signature"
+        barrier = threading.Barrier(4, timeout=10)
+        replace = os.replace
+
+        def synchronized_replace(source, destination):
+            # All threads have written their temporary file before the first replace
+            barrier.wait()
+            replace(source, destination)
+
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch("os.replace", side_effect=synchronized_replace):
+
+            with ThreadPoolExecutor(4) as executor:
+                futures = [
+                    executor.submit(
+                        store_data.store_signature_file,
+                        Path(temp_dir),
+                        "image/png",
+                        signature)
+                    for _ in range(4)]
+            signature_files = {future.result()[0] for future in futures}
+
+            signature_file, = signature_files
+            self.assertEqual(signature_file.read_bytes(), signature)
+            self.assertEqual(
+                sorted(path.name for path in signature_file.parent.iterdir()),
+                [".gitattributes", signature_file.name])
+
+    def test_invalid_signature_data(self):
+        app_tester = TestApp(store_data.application)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self._test_exception_caught(
+                app_tester=app_tester,
+                params=minimal_form_data + "data%3Aimage%2Fpng%3Bbase64%2C%3F%3F",
+                extra_environ={
+                    DATASET_ROOT_KEY: temp_dir,
+                    HOME_KEY: os.environ["HOME"],
+                    TEMPLATE_DIRECTORY_KEY: str(template_dir),
+                    SIGNATURE_FILES_KEY: "yes",
+                    "REMOTE_ADDR": "1.2.3.4"
+                },
+                patterns=["signature-data is not a valid data URL"])
+
+    def test_datalad_saving(self):
+        for backend_name in storage_backends:
+            with self.subTest(backend=backend_name):
+                self._test_datalad_saving(backend_name)
+
+    def _test_datalad_saving(self, backend_name: str):
+        app_tester = TestApp(store_data.application)
+        with tempfile.TemporaryDirectory() as temp_dir:
+
+            dataset_path, sibling_path = self._create_dataset_with_sibling(temp_dir)
 
             with patch("time.time") as time_mock:
                 time_mock.return_value = 0.0
@@ -129,17 +404,446 @@ class TestStoreData(unittest.TestCase):
                         DATASET_ROOT_KEY: str(dataset_path),
                         HOME_KEY: os.environ["HOME"],
                         TEMPLATE_DIRECTORY_KEY: str(template_dir),
+                        STORAGE_BACKEND_KEY: backend_name,
                         "REMOTE_ADDR": "1.2.3.4"
                     })
 
-            expected_path = dataset_path / f"input/{form_data_version}/0.0.json"
+            expected_path, = get_stored_records(dataset_path)
             with expected_path.open() as f:
                 json_object_1 = json.load(f)
-            expected_sibling_path = sibling_path / f"input/{form_data_version}/0.0.json"
+            expected_sibling_path = sibling_path / expected_path.relative_to(dataset_path)
             with expected_sibling_path.open() as f:
                 json_object_2 = json.load(f)
             assert json_object_1 == json_object_2
 
+    def test_datalad_saving_multiple_files(self):
+        for backend_name in storage_backends:
+            with self.subTest(backend=backend_name):
+                self._test_datalad_saving_multiple_files(backend_name)
+
+    def _test_datalad_saving_multiple_files(self, backend_name: str):
+        with tempfile.TemporaryDirectory() as temp_dir:
+
+            dataset_path, sibling_path = self._create_dataset_with_sibling(temp_dir)
+
+            files = [dataset_path / f"{i}.json" for i in range(3)]
+            for file in files:
+                file.write_text("{}")
+
+            commit_hash = store_data.add_files_to_dataset(
+                dataset_path,
+                files,
+                Path(os.environ["HOME"]),
+                get_storage_backend(backend_name))
+
+            for file in files:
+                self.assertTrue((sibling_path / file.name).exists())
+            log = subprocess.run(
+                ["git", "-C", str(dataset_path), "log", "-1", "--format=%H %s"],
+                check=True,
+                stdout=subprocess.PIPE).stdout.decode().strip()
+            self.assertEqual(log, f"{commit_hash} adding 3 files")
+
+    def test_deferred_push(self):
+        app_tester = TestApp(store_data.application)
+        with tempfile.TemporaryDirectory() as temp_dir:
+
+            dataset_path, sibling_path = self._create_dataset_with_sibling(temp_dir)
+
+            with patch("time.time") as time_mock:
+                time_mock.return_value = 0.0
+                app_tester.post(
+                    url="/store-data",
+                    params=minimal_form_data,
+                    extra_environ={
+                        DATASET_ROOT_KEY: str(dataset_path),
+                        HOME_KEY: os.environ["HOME"],
+                        TEMPLATE_DIRECTORY_KEY: str(template_dir),
+                        DEFERRED_PUSH_KEY: "yes",
+                        "REMOTE_ADDR": "1.2.3.4"
+                    })
+
+            scheduler = store_data.get_push_scheduler(
+                dataset_path,
+                Path(os.environ["HOME"]),
+                get_storage_backend("subprocess"))
+            scheduler.stop()
+            scheduler.join(60)
+
+            response = app_tester.get(url="/store-data/status")
+            self.assertIn("backlog: 0", response.text)
+
+            expected_path, = get_stored_records(dataset_path)
+            expected_sibling_path = sibling_path / expected_path.relative_to(dataset_path)
+            self.assertTrue(expected_sibling_path.exists())
+
+    def test_batch_submission(self):
+        app_tester = TestApp(store_data.application)
+        with tempfile.TemporaryDirectory() as temp_dir:
+
+            dataset_path, sibling_path = self._create_dataset_with_sibling(temp_dir)
+            commit_count = subprocess.run(
+                ["git", "-C", str(dataset_path), "rev-list", "--count", "HEAD"],
+                check=True, stdout=subprocess.PIPE).stdout
+            environ = {
+                DATASET_ROOT_KEY: str(dataset_path),
+                HOME_KEY: os.environ["HOME"],
+                TEMPLATE_DIRECTORY_KEY: str(template_dir),
+                RECORD_INDEX_KEY: str(Path(temp_dir) / "record-index"),
+                "REMOTE_ADDR": "1.2.3.4"
+            }
+            records = [
+                create_batch_record("test-111"),
+                {**create_batch_record("test-112"), "hash-value": "0" * 64},
+                {**create_batch_record("test-113"), "no-such-field": "1"},
+                create_batch_record("test-114"),
+                create_batch_record("test-111"),
+            ]
+
+            with patch("time.time") as time_mock:
+                time_mock.return_value = 0.0
+                response = app_tester.post(
+                    url="/store-data/batch",
+                    params="\n".join(json.dumps(record) for record in records),
+                    content_type="application/x-ndjson",
+                    extra_environ=environ)
+
+            result = response.json
+            self.assertEqual((result["stored"], result["rejected"]), (2, 3))
+            self.assertEqual(
+                [record_status["status"] for record_status in result["records"]],
+                [200, 400, 400, 200, 409])
+            self.assertEqual(
+                result["records"][2]["message"],
+                "unknown form field: no-such-field\n")
+
+            # Both records are stored and pushed in a single commit
+            stored_records = get_stored_records(dataset_path)
+            self.assertEqual(len(stored_records), 2)
+            commit_hash = result["records"][0]["reference"].rsplit("-", 1)[1]
+            self.assertEqual(result["records"][3]["reference"].rsplit("-", 1)[1], commit_hash)
+            self.assertEqual(
+                subprocess.run(
+                    ["git", "-C", str(dataset_path), "rev-list", "--count", "HEAD"],
+                    check=True, stdout=subprocess.PIPE).stdout,
+                str(int(commit_count) + 1).encode() + b"\n")
+            for stored_record in stored_records:
+                expected_sibling_path = sibling_path / stored_record.relative_to(dataset_path)
+                self.assertTrue(expected_sibling_path.exists())
+
+            # Malformed batches are rejected as a whole
+            response = app_tester.post(
+                url="/store-data/batch",
+                params="[{}",
+                content_type="application/json",
+                extra_environ=environ,
+                expect_errors=True)
+            self.assertEqual(response.status_int, 400)
+            self.assertTrue(response.text.startswith("batch is not a valid JSON array: "))
+
+    def test_offline_mode(self):
+        app_tester = TestApp(store_data.application)
+        with tempfile.TemporaryDirectory() as temp_dir:
+
+            dataset_path, sibling_path = self._create_dataset_with_sibling(temp_dir)
+            journal_path = Path(temp_dir) / "push-journal"
+
+            with patch("time.time") as time_mock:
+                time_mock.return_value = 0.0
+                app_tester.post(
+                    url="/store-data",
+                    params=minimal_form_data,
+                    extra_environ={
+                        DATASET_ROOT_KEY: str(dataset_path),
+                        HOME_KEY: os.environ["HOME"],
+                        TEMPLATE_DIRECTORY_KEY: str(template_dir),
+                        PUSH_JOURNAL_KEY: str(journal_path),
+                        "REMOTE_ADDR": "1.2.3.4"
+                    })
+
+            expected_path, = get_stored_records(dataset_path)
+            expected_sibling_path = sibling_path / expected_path.relative_to(dataset_path)
+            self.assertFalse(expected_sibling_path.exists())
+
+            entry, = PushJournal(journal_path).entries()
+            self.assertEqual(
+                entry["commit"],
+                get_storage_backend("subprocess").head(dataset_path))
+            self.assertEqual(entry["files"], [str(expected_path.relative_to(dataset_path))])
+
+            subprocess.run(
+                [
+                    sys.executable,
+                    str(Path(__file__).parents[2] / "tools" / "sync_offline_records.py"),
+                    str(dataset_path),
+                    str(journal_path)
+                ],
+                check=True)
+            self.assertTrue(expected_sibling_path.exists())
+            self.assertEqual(PushJournal(journal_path).entries(), [])
+
+    def test_concurrent_saves_from_processes(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+
+            dataset_path, _ = self._create_dataset_with_sibling(temp_dir)
+            journal = PushJournal(Path(temp_dir) / "push-journal")
+
+            def save_files(process_index: int):
+                for index in range(3):
+                    file = dataset_path / f"{process_index}-{index}.json"
+                    file.write_text("{}")
+                    store_data.add_files_to_dataset(
+                        dataset_path,
+                        [file],
+                        Path(os.environ["HOME"]),
+                        push_journal=journal)
+
+            context = multiprocessing.get_context("fork")
+            processes = [
+                context.Process(target=save_files, args=(process_index,))
+                for process_index in range(3)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join(60)
+            self.assertEqual([process.exitcode for process in processes], [0] * 3)
+
+            commits = [entry["commit"] for entry in journal.entries()]
+            self.assertEqual(len(set(commits)), 9)
+            log = subprocess.run(
+                ["git", "-C", str(dataset_path), "log", "-9", "--format=%H"],
+                check=True,
+                stdout=subprocess.PIPE).stdout.decode().split()
+            self.assertEqual(set(log), set(commits))
+
+    def test_metrics_and_timing_log(self):
+        app_tester = TestApp(store_data.application)
+        with tempfile.TemporaryDirectory() as temp_dir:
+
+            timing_log = Path(temp_dir) / "timing.jsonl"
+            with \
+                    patch("store_data.add_files_to_dataset") as add_file_mock, \
+                    patch("time.time") as time_mock:
+
+                add_file_mock.return_value = "abc123"
+                time_mock.return_value = 0.0
+
+                app_tester.post(
+                    url="/store-data",
+                    params=minimal_form_data,
+                    extra_environ={
+                        DATASET_ROOT_KEY: temp_dir,
+                        HOME_KEY: os.environ["HOME"],
+                        TEMPLATE_DIRECTORY_KEY: str(template_dir),
+                        TIMING_LOG_KEY: str(timing_log),
+                        "REMOTE_ADDR": "1.2.3.4"
+                    })
+
+            response = app_tester.get(url="/store-data/metrics")
+            self.assertTrue(response.content_type.startswith("text/plain"))
+            for stage in ("parse", "fields", "hash", "write", "render", "request"):
+                self.assertIn(
+                    f'sfb1451_entry_stage_duration_seconds_count{{stage="{stage}"}}',
+                    response.text)
+            self.assertIn('sfb1451_entry_responses_total{status="200"}', response.text)
+
+            with timing_log.open() as f:
+                entry, = [json.loads(line) for line in f]
+            self.assertEqual(entry["status"], 200)
+            self.assertEqual(entry["method"], "POST")
+            self.assertLessEqual(
+                {"parse", "fields", "hash", "write", "render", "request"},
+                set(entry["stages"]))
+
+    def test_spooled_storage(self):
+        app_tester = TestApp(store_data.application)
+        with tempfile.TemporaryDirectory() as temp_dir:
+
+            environ = {
+                DATASET_ROOT_KEY: temp_dir,
+                HOME_KEY: os.environ["HOME"],
+                TEMPLATE_DIRECTORY_KEY: str(template_dir),
+                SPOOL_DIRECTORY_KEY: str(Path(temp_dir) / "spool"),
+                "REMOTE_ADDR": "1.2.3.4"
+            }
+
+            with \
+                    patch("store_data.get_spool_worker") as worker_mock, \
+                    patch("time.time") as time_mock:
+
+                time_mock.return_value = 0.0
+                response = app_tester.post(
+                    url="/store-data",
+                    params=minimal_form_data,
+                    extra_environ=environ)
+                worker_mock.assert_called_once()
+
+            spool_reference = response.text.split("spool-reference=")[1].split('"')[0]
+            response = app_tester.get(
+                url="/store-data",
+                params={"spool-reference": spool_reference},
+                extra_environ=environ)
+            self.assertEqual(response.text, "pending\n")
+
+            spool = store_data.Spool(Path(environ[SPOOL_DIRECTORY_KEY]))
+            claimed_path, receipt = spool.claim()
+            self.assertEqual(
+                receipt["files"],
+                [str(path) for path in get_stored_records(Path(temp_dir))])
+            self.assertEqual(receipt["hash_values"], parse_qs(minimal_form_data)["hash-value"])
+            spool.complete(claimed_path, receipt, "c0ffee")
+
+            response = app_tester.get(
+                url="/store-data",
+                params={"spool-reference": spool_reference},
+                extra_environ=environ)
+            self.assertEqual(response.text, "c0ffee\n")
+
+    def test_result_template_cache(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            templates_directory = Path(temp_dir) / "templates"
+            templates_directory.mkdir()
+            template_path = templates_directory / store_data.result_template_name
+            template_path.write_text("one {{ reference }}")
+
+            template = store_data.get_result_template(templates_directory)
+            self.assertIs(store_data.get_result_template(templates_directory), template)
+            self.assertEqual(template.render(reference="<x>"), "one &lt;x&gt;")
+
+            template_path.write_text("two {{ reference }}")
+            os.utime(template_path, (0, 0))
+            with patch("store_data.template_check_interval", 0):
+                template = store_data.get_result_template(templates_directory)
+            self.assertEqual(template.render(reference="x"), "two x")
+
+            bytecode_cache_directory = Path(temp_dir) / "bytecode"
+            template = store_data.get_result_template(
+                templates_directory,
+                bytecode_cache_directory)
+            self.assertEqual(template.render(reference="x"), "two x")
+            self.assertEqual(len(list(bytecode_cache_directory.iterdir())), 1)
+
+    def test_schema_validation(self):
+        self.assertEqual(store_data.validate_schema(), [])
+
+        with patch.dict("store_data.field_ranges", {"unknown-field": (1, 0)}):
+            self.assertEqual(
+                store_data.validate_schema(),
+                [
+                    "rule field unknown-field is not a record field",
+                    "range of unknown-field is empty: 1 > 0",
+                ])
+            self.assertRaises(ValueError, store_data.warm_up, dict())
+
+    def test_warm_up(self):
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch("store_data.startup_timing", dict()) as startup_timing, \
+                patch("store_data.startup_problems", []) as startup_problems:
+
+            dataset_path, _ = self._create_dataset_with_sibling(temp_dir)
+            configuration = {
+                DATASET_ROOT_KEY: str(dataset_path),
+                HOME_KEY: os.environ["HOME"],
+                TEMPLATE_DIRECTORY_KEY: str(template_dir),
+                RECORD_INDEX_KEY: str(Path(temp_dir) / "record-index"),
+                WARMUP_HOOK_KEY: "test_store_data:record_warmup_hook",
+            }
+            timing = store_data.warm_up(configuration)
+
+            self.assertEqual(startup_problems, [])
+            self.assertEqual(
+                set(timing),
+                {
+                    "warmup", "warmup-schema", "warmup-template",
+                    "warmup-dataset", "warmup-databases", "warmup-hook"
+                })
+            self.assertEqual(warmup_hook_calls[-1], configuration)
+            self.assertIn((template_dir, None), store_data._template_cache)
+            self.assertTrue((Path(temp_dir) / "record-index").exists())
+
+            # The latency of the first request and submission is kept
+            app_tester = TestApp(store_data.application)
+            with patch("time.time") as time_mock:
+                time_mock.return_value = 0.0
+                app_tester.post(
+                    url="/store-data",
+                    params=minimal_form_data,
+                    extra_environ={**configuration, "REMOTE_ADDR": "1.2.3.4"})
+            first_submission = startup_timing["first-submission"]
+            app_tester.post(
+                url="/store-data",
+                params=minimal_form_data,
+                extra_environ={**configuration, "REMOTE_ADDR": "1.2.3.4"},
+                expect_errors=True)
+            self.assertEqual(startup_timing["first-submission"], first_submission)
+
+            response = app_tester.get(url="/store-data/status")
+            self.assertIn("  warmup-template: ", response.text)
+            self.assertIn("  first-submission: ", response.text)
+            response = app_tester.get(url="/store-data/metrics")
+            self.assertIn('sfb1451_entry_startup_seconds{phase="first-request"}', response.text)
+            self.assertIn("sfb1451_entry_startup_problems 0\n", response.text)
+
+    def test_status_without_paths_and_errors(self):
+        circuit_breaker = CircuitBreaker(Path("/srv/secret-dataset"), 1, 30.0)
+        with patch("time.time") as time_mock, \
+                patch("store_data.get_circuit_breakers", return_value=[circuit_breaker]):
+
+            time_mock.return_value = 100.0
+            circuit_breaker.record_failure("push to /srv/secret-sibling denied")
+            time_mock.return_value = 160.0
+            response = TestApp(store_data.application).get(url="/store-data/status")
+            self.assertIn("  state: open\n", response.text)
+            self.assertIn("  opened: 60 s ago\n", response.text)
+            self.assertNotIn("/srv/secret", response.text)
+            dataset_number = store_data.get_dataset_number(circuit_breaker.dataset_root)
+            self.assertIn(f"push circuit breaker {dataset_number}:\n", response.text)
+
+            response = TestApp(store_data.application).get(url="/store-data/metrics")
+            self.assertIn(
+                f'sfb1451_entry_push_circuit_open{{dataset="{dataset_number}"}} 1\n',
+                response.text)
+            self.assertNotIn("/srv/secret", response.text)
+
+    def test_warm_up_problems(self):
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch("store_data.startup_problems", []) as startup_problems:
+
+            dataset_path = Path(temp_dir) / "dataset"
+            subprocess.run(["datalad", "create", "--no-annex", str(dataset_path)], check=True)
+            store_data.warm_up({
+                DATASET_ROOT_KEY: str(dataset_path),
+                WARMUP_HOOK_KEY: "test_store_data:no_such_hook",
+            })
+            self.assertEqual(len(startup_problems), 2)
+            self.assertTrue(startup_problems[0].startswith("sibling entrystore of "))
+            self.assertTrue(startup_problems[1].startswith("warm-up hook test_store_data:no_such_hook: "))
+
+            response = TestApp(store_data.application).get(url="/store-data/status")
+            self.assertIn("  problems: 2\n", response.text)
+            self.assertNotIn(str(dataset_path), response.text)
+
+    def test_deployed_modules(self):
+        # deploy.sh installs the modules that the WSGI script imports
+        deploy_script = (Path(__file__).parents[2] / "deploy.sh").read_text()
+        runtime_modules = re.search(r'^runtime_modules="(.*)"$', deploy_script, re.MULTILINE)[1]
+        imported_modules = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import os, sys, store_data; "
+                "print(' '.join(sorted("
+                "name for name, module in list(sys.modules.items()) "
+                "if os.path.dirname(getattr(module, '__file__', None) or '') == sys.argv[1])))",
+                str(server_dir)
+            ],
+            cwd=str(server_dir),
+            check=True,
+            stdout=subprocess.PIPE).stdout.decode().split()
+        self.assertEqual(
+            sorted(runtime_modules.split()),
+            [name for name in imported_modules if name != "store_data"])
+
     def test_get_int(self):
         self.assertEqual(get_int_value(".0"), 0)
         self.assertEqual(get_int_value("1.0"), 1)
@@ -0,0 +1,93 @@
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+
+server_dir = Path(__file__).parents[1]
+
+sys.path.insert(0, str(server_dir))
+
+
+from store_data import create_cached_submission_result
+from submission_cache import SubmissionCache
+
+
+class TestSubmissionCache(unittest.TestCase):
+
+    def test_claim_and_complete(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = SubmissionCache(Path(temp_dir) / "cache.sqlite")
+            self.assertIsNone(cache.claim("key-1", "hash-1"))
+
+            entry = cache.claim("key-1", "hash-1")
+            self.assertIsNone(entry["status"])
+            self.assertEqual(
+                create_cached_submission_result(entry, "hash-1")[0],
+                "409 CONFLICT")
+
+            cache.complete("key-1", "200 OK", "text/html", b"receipt")
+            entry = SubmissionCache(Path(temp_dir) / "cache.sqlite").claim("key-1", "hash-1")
+            self.assertEqual(
+                create_cached_submission_result(entry, "hash-1"),
+                ("200 OK", "text/html", [b"receipt"]))
+            self.assertEqual(
+                create_cached_submission_result(entry, "hash-2")[0],
+                "422 UNPROCESSABLE ENTITY")
+
+    def test_release(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = SubmissionCache(Path(temp_dir) / "cache.sqlite")
+            cache.claim("key-1", "hash-1")
+            cache.release("key-1")
+            self.assertIsNone(cache.claim("key-1", "hash-1"))
+
+            # Completed receipts are not released
+            cache.complete("key-1", "200 OK", "text/html", b"receipt")
+            cache.release("key-1")
+            self.assertEqual(cache.claim("key-1", "hash-1")["body"], b"receipt")
+
+    def test_capacity(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = SubmissionCache(Path(temp_dir) / "cache.sqlite", capacity=3)
+            for index in range(5):
+                cache.claim(f"key-{index}", f"hash-{index}")
+                cache.complete(f"key-{index}", "200 OK", "text/html", b"receipt")
+
+            self.assertIsNone(cache.claim("key-0", "hash-0"))
+            self.assertIsNotNone(cache.claim("key-4", "hash-4"))
+
+    def test_capacity_keeps_pending_claims(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = SubmissionCache(Path(temp_dir) / "cache.sqlite", capacity=2, pending_timeout=60.0)
+            with patch("time.time") as time_mock:
+                time_mock.return_value = 1000.0
+                cache.claim("key-pending", "hash-pending")
+                for index in range(3):
+                    cache.claim(f"key-{index}", f"hash-{index}")
+                    cache.complete(f"key-{index}", "200 OK", "text/html", b"receipt")
+
+                # A concurrent retry still finds the pending claim
+                entry = cache.claim("key-pending", "hash-pending")
+                self.assertIsNotNone(entry)
+                self.assertIsNone(entry["status"])
+                self.assertIsNone(cache.claim("key-0", "hash-0"))
+
+                # Abandoned claims are evicted
+                time_mock.return_value = 1061.0
+                cache.claim("key-3", "hash-3")
+                row_count, = cache.connection.execute(
+                    "SELECT COUNT(*) FROM receipts WHERE key = 'key-pending'").fetchone()
+                self.assertEqual(row_count, 0)
+
+    def test_abandoned_claim_taken_over(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = SubmissionCache(Path(temp_dir) / "cache.sqlite", pending_timeout=60.0)
+            with patch("time.time") as time_mock:
+                time_mock.return_value = 1000.0
+                cache.claim("key-1", "hash-1")
+                time_mock.return_value = 1030.0
+                self.assertIsNotNone(cache.claim("key-1", "hash-1"))
+                time_mock.return_value = 1061.0
+                self.assertIsNone(cache.claim("key-1", "hash-1"))
@@ -0,0 +1,312 @@
+"""Measure throughput and latency of the store-data endpoint
+
+Correctly hashed form submissions for healthy and patient subjects are
+posted to store_data.application, either by calling the application
+in-process, or over HTTP to a local threaded server. Records are stored in
+a temporary datalad dataset whose "entrystore" sibling is a local bare
+git repository, so the complete storage path can be measured offline.
+With "--storage none" records are written, but not committed.
+
+The report contains requests per second, latency percentiles, and the
+time that was spent in the individual stages of a request.
+"""
+import argparse
+import hashlib
+import http.client
+import io
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from socketserver import ThreadingMixIn
+from typing import Dict, List, Tuple
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+
+server_dir = Path(__file__).parents[1] / "server"
+template_dir = Path(__file__).parents[1] / "templates"
+
+sys.path.insert(0, str(server_dir))
+
+import store_data
+from storage_backend import storage_backends
+
+
+diseases = ["stroke", "parkinson", "tic", "depression", "alzheimer"]
+hands = ["left", "right", "none"]
+
+
+def create_form_fields(index: int, subject_group: str) -> Dict[str, List[str]]:
+    """Create the fields that the entry form would post for a subject"""
+    fields = {name: list(value) for name, value in store_data.auto_fields.items()}
+    fields.update({
+        "form-data-version": ["2.3"],
+        "data-entry-domain": ["de.sfb1451.z03"],
+        "data-entry-employee": ["benchmark"],
+        "project-code": [f"b{index % 4 + 1}"],
+        "subject-pseudonym": [f"benchmark-{index:06d}-{time.time_ns()}"],
+        "date-of-birth": ["1960-01-01"],
+        "sex": ["female" if index % 2 else "male"],
+        "date-of-test": [f"2021-{index % 12 + 1:02d}-{index % 28 + 1:02d}"],
+        "repeated-test": ["on" if index % 3 == 0 else "off"],
+        "subject-group": [subject_group],
+        "laterality-quotient": [str(index % 200 - 100)],
+        "maximum-ftf-left": [str(2 + index % 8)],
+        "maximum-ftf-right": [f"{1.5 + index % 7}"],
+        "maximum-gs-left": [f"{30.25 + index % 5}"],
+        "arat-left": [str(index % 58)],
+        "arat-right": [str(57 - index % 58)],
+        "tug-executed": ["9.5"],
+        "bdi-ii-score": [str(index % 64)],
+        "additional-remarks": [f"benchmark record {index}"],
+    })
+    for name in store_data.optional_checkbox_fields:
+        fields[name + "-valid"] = ["on"]
+        fields[name] = ["on" if index % 2 else "off"]
+    if subject_group == "patient":
+        fields.update({
+            "patient-year-first-symptom": ["2015"],
+            "patient-month-first-symptom": [f"{index % 12 + 1}"],
+            "patient-day-first-symptom": [f"{index % 28 + 1}"],
+            "patient-year-diagnosis": ["2016"],
+            "patient-month-diagnosis": ["3"],
+            "patient-day-diagnosis": ["4"],
+            "patient-main-disease": [diseases[index % len(diseases)]],
+            "patient-stronger-impacted-hand": [hands[index % len(hands)]],
+        })
+    return fields
+
+
+def create_form_body(index: int, subject_group: str) -> bytes:
+    """Create a urlencoded submission with a valid hash value"""
+    fields = create_form_fields(index, subject_group)
+    hashed_string = store_data.get_canonic_content_string(fields)
+    fields["hashed-string"] = [hashed_string]
+    fields["hash-value"] = [hashlib.sha256(hashed_string.encode()).hexdigest()]
+    return urlencode(
+        [(name, value[0]) for name, value in fields.items() if value[0] != ""]
+    ).encode()
+
+
+def create_dataset(temp_dir: Path, annex: bool) -> Path:
+    """Create a dataset with a local bare repository as entrystore sibling"""
+    dataset_path = temp_dir / "dataset"
+    sibling_path = temp_dir / "entrystore.git"
+    subprocess.run(
+        ["datalad", "create", *([] if annex else ["--no-annex"]), str(dataset_path)],
+        check=True,
+        stdout=subprocess.DEVNULL)
+    subprocess.run(
+        ["git", "init", "--quiet", "--bare", str(sibling_path)],
+        check=True)
+    subprocess.run(
+        ["git", "-C", str(dataset_path), "remote", "add", "entrystore", str(sibling_path)],
+        check=True)
+    return dataset_path
+
+
+class StageTimer:
+    """Record the duration of calls of instrumented functions per stage"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+
+    def wrap(self, stage: str, function):
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start
+                with self.lock:
+                    self.durations[stage].append(duration)
+        return timed_function
+
+    def instrument(self):
+        store_data.read_form = self.wrap("parse form", store_data.read_form)
+        store_data.field_schema.process = self.wrap("process fields", store_data.field_schema.process)
+        store_data.store_record = self.wrap("store record", store_data.store_record)
+        store_data.add_files_to_dataset = self.wrap("commit", store_data.add_files_to_dataset)
+        store_data.create_result_page = self.wrap("render result", store_data.create_result_page)
+
+
+def call_in_process(environ_base: dict, body: bytes) -> str:
+    environ = {
+        **environ_base,
+        "REQUEST_METHOD": "POST",
+        "PATH_INFO": "/store-data",
+        "CONTENT_TYPE": "application/x-www-form-urlencoded",
+        "CONTENT_LENGTH": str(len(body)),
+        "REMOTE_ADDR": "127.0.0.1",
+        "wsgi.input": io.BytesIO(body),
+    }
+    status = []
+
+    def start_response(response_status, _):
+        status.append(response_status)
+
+    for _ in store_data.application(environ, start_response):
+        pass
+    return status[0]
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server(environ_base: dict) -> Tuple[WSGIServer, int]:
+    def application(environ, start_response):
+        environ.update(environ_base)
+        return store_data.application(environ, start_response)
+
+    server = make_server(
+        "127.0.0.1", 0, application,
+        server_class=ThreadingWSGIServer,
+        handler_class=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+
+def call_http(port: int, body: bytes) -> str:
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    try:
+        connection.request(
+            "POST", "/store-data", body,
+            {"Content-Type": "application/x-www-form-urlencoded"})
+        response = connection.getresponse()
+        response.read()
+        return f"{response.status} {response.reason}"
+    finally:
+        connection.close()
+
+
+def percentiles(durations: List[float]) -> Tuple[float, float, float]:
+    if len(durations) < 2:
+        return (durations or [0.0]) * 3
+    cut_points = statistics.quantiles(durations, n=100, method="inclusive")
+    return cut_points[49], cut_points[94], cut_points[98]
+
+
+def print_durations(name: str, durations: List[float]):
+    p50, p95, p99 = percentiles(durations)
+    print(
+        f"{name:<16} {len(durations):6d} calls  "
+        f"mean {statistics.fmean(durations) * 1000:8.2f} ms  "
+        f"p50 {p50 * 1000:8.2f} ms  p95 {p95 * 1000:8.2f} ms  p99 {p99 * 1000:8.2f} ms")
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description=__doc__)
+    argument_parser.add_argument("--requests", type=int, default=200)
+    argument_parser.add_argument("--concurrency", type=int, default=1)
+    argument_parser.add_argument(
+        "--mode", choices=["in-process", "http"], default="in-process")
+    argument_parser.add_argument(
+        "--storage", choices=["datalad", "none"], default="datalad",
+        help="commit records to a temporary dataset, or only write them "
+             "(default: %(default)s)")
+    argument_parser.add_argument(
+        "--annex", action="store_true",
+        help="create the temporary dataset with git-annex")
+    argument_parser.add_argument(
+        "--patient-ratio", type=float, default=0.5,
+        help="fraction of submissions for patients (default: %(default)s)")
+    argument_parser.add_argument(
+        "--backend", choices=sorted(storage_backends), default="subprocess")
+    argument_parser.add_argument("--batch-window", type=float, default=0.0)
+    argument_parser.add_argument("--batch-size", type=int, default=1)
+    argument_parser.add_argument("--deferred-push", action="store_true")
+    argument_parser.add_argument("--spool", action="store_true")
+    arguments = argument_parser.parse_args()
+
+    patient_count = round(arguments.requests * arguments.patient_ratio)
+    bodies = [
+        create_form_body(index, "patient" if index < patient_count else "healthy")
+        for index in range(arguments.requests)]
+
+    with tempfile.TemporaryDirectory() as temp_dir_name:
+        temp_dir = Path(temp_dir_name)
+        if arguments.storage == "datalad":
+            dataset_root = create_dataset(temp_dir, arguments.annex)
+        else:
+            dataset_root = temp_dir / "dataset"
+            store_data.add_files_to_dataset = lambda *args, **kwargs: "0" * 40
+
+        environ_base = {
+            store_data.DATASET_ROOT_KEY: str(dataset_root),
+            store_data.HOME_KEY: str(Path.home()),
+            store_data.TEMPLATE_DIRECTORY_KEY: str(template_dir),
+            store_data.STORAGE_BACKEND_KEY: arguments.backend,
+            store_data.BATCH_WINDOW_KEY: str(arguments.batch_window),
+            store_data.BATCH_SIZE_KEY: str(arguments.batch_size),
+            store_data.DEFERRED_PUSH_KEY: "yes" if arguments.deferred_push else "no",
+        }
+        if arguments.spool:
+            environ_base[store_data.SPOOL_DIRECTORY_KEY] = str(temp_dir / "spool")
+
+        stage_timer = StageTimer()
+        stage_timer.instrument()
+
+        server = None
+        if arguments.mode == "http":
+            server, port = start_http_server(environ_base)
+
+            def post(body):
+                return call_http(port, body)
+        else:
+            def post(body):
+                return call_in_process(environ_base, body)
+
+        def timed_post(body: bytes) -> Tuple[str, float]:
+            start = time.perf_counter()
+            status = post(body)
+            return status, time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(arguments.concurrency) as executor:
+            results = list(executor.map(timed_post, bodies))
+        total_duration = time.perf_counter() - start
+
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+        # Wait until spooled records are committed and commits are pushed
+        if arguments.spool:
+            while any(
+                    any((temp_dir / "spool" / state).iterdir())
+                    for state in ("pending", "claimed")):
+                time.sleep(0.05)
+        for scheduler in store_data.get_push_schedulers():
+            scheduler.stop()
+            scheduler.join()
+        drain_duration = time.perf_counter() - start - total_duration
+
+    status_counts = Counter(status for status, _ in results)
+    print(
+        f"{arguments.requests} requests ({patient_count} patients), "
+        f"concurrency {arguments.concurrency}, {arguments.mode}, "
+        f"storage {arguments.storage}")
+    print(f"statuses: {dict(status_counts)}")
+    print(f"{arguments.requests / total_duration:.1f} requests per second")
+    if arguments.spool or arguments.deferred_push:
+        print(f"spooled commits and deferred pushes finished {drain_duration:.2f} s after the last response")
+    print_durations("request", [duration for _, duration in results])
+    for stage, durations in stage_timer.durations.items():
+        print_durations(stage, durations)
+
+
+if __name__ == "__main__":
+    main()
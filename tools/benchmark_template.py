@@ -0,0 +1,84 @@
+"""Compare the rendering time of the result page with and without template caching"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from jinja2 import Environment, select_autoescape
+
+
+server_dir = Path(__file__).parents[1] / "server"
+template_dir = Path(__file__).parents[1] / "templates"
+
+sys.path.insert(0, str(server_dir))
+
+import store_data
+
+
+def create_record() -> dict:
+    record = {key: None for key in store_data.required_fields}
+    record.update({
+        "sex": "female",
+        "subject-group": "healthy",
+        "repeated-test": False,
+    })
+    return {"data": record}
+
+
+def render_uncached(json_top_data: dict) -> str:
+    # This is how the result page was rendered before templates were cached
+    jinja_template = Environment(autoescape=select_autoescape()).from_string(
+        (template_dir / store_data.result_template_name).read_text(encoding="utf-8")
+    )
+    return jinja_template.render(
+        sub_project="Z03",
+        reference="0.0-0",
+        spool_reference=None,
+        record=json_top_data["data"],
+        date_message=store_data.date_message,
+        disease_message=store_data.disease_message,
+        hand_message=store_data.hand_message,
+        sex_message=store_data.sex_message,
+        subject_group_message=store_data.subject_group_message,
+        checkbox_message=store_data.checkbox_message)
+
+
+def measure(name: str, function, iterations: int):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    duration = (time.perf_counter() - start) / iterations
+    print(f"{name:<24} {duration * 1000:8.3f} ms per page")
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description=__doc__)
+    argument_parser.add_argument("--iterations", type=int, default=200)
+    arguments = argument_parser.parse_args()
+
+    json_top_data = create_record()
+    expected = render_uncached(json_top_data)
+    with tempfile.TemporaryDirectory() as bytecode_cache_directory:
+        cache_path = Path(bytecode_cache_directory)
+
+        def cached():
+            return store_data.create_result_page(0, 0.0, json_top_data, template_dir)
+
+        def bytecode_cached():
+            # Clear the in-memory cache to measure loading from the bytecode cache
+            store_data._template_cache.clear()
+            return store_data.create_result_page(
+                0, 0.0, json_top_data, template_dir,
+                bytecode_cache_directory=cache_path)
+
+        assert cached() == expected
+        assert bytecode_cached() == expected
+
+        measure("uncached", lambda: render_uncached(json_top_data), arguments.iterations)
+        measure("bytecode cache only", bytecode_cached, arguments.iterations)
+        measure("in-memory cache", cached, arguments.iterations)
+
+
+if __name__ == "__main__":
+    main()
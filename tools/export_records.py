@@ -0,0 +1,42 @@
+"""Export the records of a dataset into CSV, Parquet, or Arrow IPC tables
+
+Every form field becomes a typed column. Records are streamed in batches,
+so memory use does not depend on the number of records. Repeated exports
+into the same output directory only write the records that were committed
+since the previous export, as a new part file. Parquet and Arrow IPC
+output require pyarrow.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+
+server_dir = Path(__file__).parents[1] / "server"
+
+sys.path.insert(0, str(server_dir))
+
+from record_export import RecordExporter, table_writers
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description=__doc__)
+    argument_parser.add_argument("dataset", type=Path)
+    argument_parser.add_argument("output", type=Path, help="output directory")
+    argument_parser.add_argument(
+        "--format", choices=sorted(table_writers), default="csv",
+        help="table format (default: %(default)s)")
+    argument_parser.add_argument(
+        "--batch-size", type=int, default=1000,
+        help="number of records per batch (default: %(default)s)")
+    arguments = argument_parser.parse_args()
+
+    exporter = RecordExporter(
+        arguments.dataset.absolute(),
+        arguments.output,
+        arguments.format,
+        arguments.batch_size)
+    print(f"exported {exporter.export()} record(s)")
+
+
+if __name__ == "__main__":
+    main()
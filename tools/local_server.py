@@ -1,6 +1,30 @@
+"""Serve the data-entry application locally, e.g. for offline data entry
+
+Requests are handled by a pool of worker threads, optionally in several
+worker processes that share the listening socket. If waitress is
+installed, it is used as HTTP server and supports keep-alive connections.
+Otherwise a threaded wsgiref server is used.
+
+On SIGINT or SIGTERM the server stops accepting connections, finishes
+running requests, commits pending records, and pushes pending commits
+before it exits. Commits of all worker processes are serialized by a
+lock on the dataset. With --set batch_size=N, records that wait for the
+lock are committed together, which keeps throughput up when many
+requests arrive at the same time.
+
+Every worker process warms up before it accepts requests, i.e. it checks
+the schema, the template, and the dataset, see store_data.warm_up(). Use
+--set warmup=no to skip the warm-up.
+"""
+import argparse
+import os
+import signal
+import socket
 import sys
 from pathlib import Path
-from wsgiref.simple_server import WSGIRequestHandler, make_server
+from socketserver import ThreadingMixIn
+from typing import Dict, List
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
 
 
 # Import the WSGI application and determine the template dir
@@ -12,17 +36,191 @@ sys.path.insert(0, str(server_dir))
 import store_data
 
 
-class SFB1451RequestHandler(WSGIRequestHandler):
-    def get_environ(self):
-        wsgi_environment = WSGIRequestHandler.get_environ(self)
-        wsgi_environment.update({
-            "de.inm7.sfb1451.entry.dataset_root": "/tmp/sfb-test",
-            "de.inm7.sfb1451.entry.home": "/tmp/sfb-test-home",
-            "de.inm7.sfb1451.entry.templates": str(template_dir)
-        })
-        return wsgi_environment
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = False
+    block_on_close = True
+
+
+def create_application(configuration: Dict[str, str]):
+    def application(environ, start_response):
+        environ.update(configuration)
+        return store_data.application(environ, start_response)
+    return application
+
+
+def stop_on_sigterm():
+    def stop(*_):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+
+
+def serve_waitress(application, listen_socket: socket.socket, arguments):
+    # Import waitress only if it is used
+    from waitress.server import create_server
+    server = create_server(
+        application,
+        sockets=[listen_socket],
+        threads=arguments.threads,
+        channel_timeout=arguments.channel_timeout)
+
+    stop_on_sigterm()
+    try:
+        # Returns on KeyboardInterrupt
+        server.run()
+    finally:
+        # Wait for running requests, run() waits only a few seconds
+        server.task_dispatcher.shutdown(
+            cancel_pending=False,
+            timeout=arguments.shutdown_timeout)
+        server.close()
+
+
+def serve_wsgiref(application, listen_socket: socket.socket):
+    server = ThreadingWSGIServer(
+        listen_socket.getsockname()[:2],
+        WSGIRequestHandler,
+        bind_and_activate=False)
+    server.socket.close()
+    server.socket = listen_socket
+    host, port = listen_socket.getsockname()[:2]
+    server.server_name = socket.getfqdn(host)
+    server.server_port = port
+    server.setup_environ()
+    server.set_app(application)
+
+    stop_on_sigterm()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Waits for running requests
+        server.server_close()
+
+
+def serve(arguments, configuration: Dict[str, str], listen_socket: socket.socket):
+    if store_data.is_enabled(configuration, store_data.WARMUP_KEY):
+        timing = store_data.warm_up(configuration)
+        print(f"[{os.getpid()}] warmed up in {timing['warmup']:.3f} s", flush=True)
+    application = create_application(configuration)
+    try:
+        if arguments.server == "waitress":
+            serve_waitress(application, listen_socket, arguments)
+        else:
+            serve_wsgiref(application, listen_socket)
+    finally:
+        print(f"[{os.getpid()}] committing and pushing pending records ...", flush=True)
+        store_data.stop_background_workers(arguments.shutdown_timeout)
+        print(f"[{os.getpid()}] stopped", flush=True)
+
+
+def start_worker_processes(arguments, configuration: Dict[str, str], listen_socket: socket.socket):
+    children: List[int] = []
+    for _ in range(arguments.processes):
+        pid = os.fork()
+        if pid == 0:
+            # Wait for the SIGTERM that the parent process sends on SIGINT
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            try:
+                serve(arguments, configuration, listen_socket)
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    def forward(signal_number, _):
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for child in children:
+        while True:
+            try:
+                os.waitpid(child, 0)
+                break
+            except InterruptedError:
+                continue
+
+
+def parse_settings(settings: List[str]) -> Dict[str, str]:
+    configuration = dict()
+    for setting in settings:
+        name, separator, value = setting.partition("=")
+        if not separator:
+            raise ValueError(f"setting is not of the form NAME=VALUE: {setting}")
+        configuration[f"de.inm7.sfb1451.entry.{name}"] = value
+    return configuration
+
+
+def main():
+    try:
+        import waitress  # noqa: F401
+        default_server = "waitress"
+    except ImportError:
+        default_server = "wsgiref"
+
+    argument_parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    argument_parser.add_argument("--dataset", type=Path, required=True)
+    argument_parser.add_argument(
+        "--home", type=Path, default=Path(os.environ.get("HOME", "/")),
+        help="HOME-directory for datalad and git (default: %(default)s)")
+    argument_parser.add_argument(
+        "--templates", type=Path, default=template_dir,
+        help="template directory (default: %(default)s)")
+    argument_parser.add_argument("--host", default="")
+    argument_parser.add_argument("--port", type=int, default=8000)
+    argument_parser.add_argument(
+        "--server", choices=["waitress", "wsgiref"], default=default_server,
+        help="HTTP server (default: %(default)s)")
+    argument_parser.add_argument(
+        "--threads", type=int, default=8,
+        help="worker threads per process, only used by waitress, wsgiref "
+             "starts a thread per request (default: %(default)s)")
+    argument_parser.add_argument(
+        "--processes", type=int, default=1,
+        help="worker processes (default: %(default)s)")
+    argument_parser.add_argument(
+        "--channel-timeout", type=int, default=120,
+        help="seconds after which idle keep-alive connections are closed "
+             "(default: %(default)s)")
+    argument_parser.add_argument(
+        "--shutdown-timeout", type=float, default=300.0,
+        help="seconds to wait for each background committer or pusher "
+             "on shutdown (default: %(default)s)")
+    argument_parser.add_argument(
+        "--set", dest="settings", action="append", default=[], metavar="NAME=VALUE",
+        help="additional configuration, e.g. batch_window=0.5, sets "
+             "de.inm7.sfb1451.entry.NAME to VALUE")
+    arguments = argument_parser.parse_args()
+
+    configuration = {
+        store_data.DATASET_ROOT_KEY: str(arguments.dataset.absolute()),
+        store_data.HOME_KEY: str(arguments.home.absolute()),
+        store_data.TEMPLATE_DIRECTORY_KEY: str(arguments.templates.absolute()),
+        store_data.WARMUP_KEY: "yes",
+        **parse_settings(arguments.settings)
+    }
+
+    listen_socket = socket.create_server(
+        (arguments.host, arguments.port),
+        backlog=1024,
+        reuse_port=False)
+    print(
+        f"Serving HTTP on port {arguments.port} with {arguments.server}, "
+        f"{arguments.processes} process(es)...",
+        flush=True)
+
+    if arguments.processes > 1:
+        start_worker_processes(arguments, configuration, listen_socket)
+    else:
+        serve(arguments, configuration, listen_socket)
 
 
-with make_server('', 8000, store_data.application, handler_class=SFB1451RequestHandler) as httpd:
-    print("Serving HTTP on port 8000...")
-    httpd.serve_forever()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Move records from flat input/<version>/ directories into date-sharded subdirectories
+
+Records that were stored as input/<version>/<time-stamp>.json are moved to
+input/<version>/<year>/<month>/<day>/<time-stamp>.json, the layout that
+store_data.py uses for new records. File names, and therefore references
+to existing records, are kept. The moves are done with "git mv" and saved
+in a single commit, while the commit lock of the dataset is held, i.e.
+the server does not commit records in the meantime. The commit contains
+only the moved records. If --index is given,
+the record index is rebuilt afterwards, because it contains the paths of
+the records, see tools/rebuild_record_index.py.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+
+server_dir = Path(__file__).parents[1] / "server"
+
+sys.path.insert(0, str(server_dir))
+
+import store_data
+from commit_lock import CommitLock
+from record_index import RecordIndex
+from storage_backend import SubprocessBackend
+
+
+def get_time_stamp(record: Path) -> float:
+    try:
+        return float(record.stem)
+    except ValueError:
+        with record.open() as f:
+            return json.load(f)["source"]["time_stamp"]
+
+
+def plan_moves(dataset_root: Path) -> Dict[Path, List[Path]]:
+    moves = defaultdict(list)
+    input_directory = dataset_root / "input"
+    for version_directory in sorted(input_directory.iterdir()):
+        if not version_directory.is_dir():
+            continue
+        for record in sorted(version_directory.glob("*.json")):
+            target_directory = store_data.get_record_directory(
+                dataset_root,
+                version_directory.name,
+                get_time_stamp(record))
+            moves[target_directory].append(record)
+    return moves
+
+
+def print_moves(dataset_root: Path, moves: Dict[Path, List[Path]]) -> int:
+    """Show the planned moves, return the number of records to move"""
+    record_count = sum(len(records) for records in moves.values())
+    if record_count == 0:
+        print("no records in the flat layout found")
+    for target_directory, records in sorted(moves.items()):
+        print(f"{len(records):6d} record(s) -> {target_directory.relative_to(dataset_root)}")
+    return record_count
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description=__doc__)
+    argument_parser.add_argument("dataset", type=Path)
+    argument_parser.add_argument(
+        "--home", type=Path, default=Path(os.environ.get("HOME", "/")),
+        help="HOME-directory for datalad and git (default: %(default)s)")
+    argument_parser.add_argument(
+        "--dry-run", action="store_true",
+        help="only show which records would be moved")
+    argument_parser.add_argument(
+        "--no-save", action="store_true",
+        help="move the records, but do not save the dataset")
+    argument_parser.add_argument(
+        "--index", type=Path,
+        help="path of the record index database to rebuild, the value of "
+             "de.inm7.sfb1451.entry.record_index")
+    arguments = argument_parser.parse_args()
+
+    dataset_root = arguments.dataset.absolute()
+    if arguments.dry_run:
+        print_moves(dataset_root, plan_moves(dataset_root))
+        return
+
+    with CommitLock(dataset_root):
+        moves = plan_moves(dataset_root)
+        record_count = print_moves(dataset_root, moves)
+        if record_count == 0:
+            return
+
+        for target_directory, records in sorted(moves.items()):
+            target_directory.mkdir(parents=True, exist_ok=True)
+            for start in range(0, len(records), 500):
+                subprocess.run(
+                    [
+                        "git", "-C", str(dataset_root), "mv",
+                        *[str(record) for record in records[start:start + 500]],
+                        str(target_directory)
+                    ],
+                    check=True)
+
+        if not arguments.no_save:
+            # Only the moved records, records that the server wrote but did
+            # not yet commit, e.g. spooled records, are committed by the server
+            SubprocessBackend().save(
+                dataset_root,
+                [
+                    path
+                    for target_directory, records in sorted(moves.items())
+                    for record in records
+                    for path in (record, target_directory / record.name)
+                ],
+                f"move {record_count} records to date-sharded directories",
+                arguments.home)
+
+        if arguments.index:
+            indexed_count = RecordIndex(arguments.index).rebuild(dataset_root)
+            print(f"indexed {indexed_count} record(s)")
+
+
+if __name__ == "__main__":
+    main()
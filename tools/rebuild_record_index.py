@@ -0,0 +1,36 @@
+"""Rebuild the record index of a dataset from the stored records
+
+The record index is an SQLite database that store_data.py uses to find
+records by subject, project, and date of test, and to reject forms that
+were already submitted. This tool replaces the index content with all
+records in input/ of the dataset, e.g. after records were added or
+removed outside of the server. Indexed records keep their commit hash,
+other records get the last commit that changed them.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+
+server_dir = Path(__file__).parents[1] / "server"
+
+sys.path.insert(0, str(server_dir))
+
+from record_index import RecordIndex
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description=__doc__)
+    argument_parser.add_argument("dataset", type=Path)
+    argument_parser.add_argument(
+        "index", type=Path,
+        help="path of the index database, the value of "
+             "de.inm7.sfb1451.entry.record_index")
+    arguments = argument_parser.parse_args()
+
+    record_count = RecordIndex(arguments.index).rebuild(arguments.dataset.absolute())
+    print(f"indexed {record_count} record(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Show per project and form version statistics of the records in a dataset
+
+The statistics are kept in a checkpoint file. Every run adds only the
+records that were committed since the previous run, before the requested
+statistics are shown.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+
+server_dir = Path(__file__).parents[1] / "server"
+
+sys.path.insert(0, str(server_dir))
+
+from record_statistics import RecordStatistics
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description=__doc__)
+    argument_parser.add_argument("dataset", type=Path)
+    argument_parser.add_argument("checkpoint", type=Path, help="path of the checkpoint file")
+    argument_parser.add_argument("--project", help="only show records of this project code")
+    argument_parser.add_argument("--version", help="only show records of this form version")
+    arguments = argument_parser.parse_args()
+
+    statistics = RecordStatistics(arguments.checkpoint)
+    print(f"added {statistics.update(arguments.dataset.absolute())} record(s)")
+
+    for project_code, version, record_count in statistics.record_counts():
+        print(f"{project_code}\t{version}\t{record_count:6d} record(s)")
+
+    print()
+    for name, field_statistics in statistics.field_statistics(arguments.project, arguments.version).items():
+        print(name, "\t".join(f"{key}={value}" for key, value in field_statistics.items()), sep="\t")
+
+
+if __name__ == "__main__":
+    main()
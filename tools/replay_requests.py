@@ -0,0 +1,120 @@
+"""Replay captured submissions against the data-entry application
+
+The server captures posted forms and batches in a request log, if
+de.inm7.sfb1451.entry.request_log is set. This tool posts the logged
+submissions again to store_data.application in-process, e.g. to run
+regression and performance tests with realistic data. Replayed records
+get new time stamps and references. Unless the log was written with
+request_log_personal_data, signatures are replaced by dummy data of the
+same size, and remarks by their hash, i.e. the replayed records are made
+up. Such logs are only replayed into a dataset that is marked as
+throwaway with --throwaway.
+
+By default, submissions are replayed as fast as possible. With --speed 1
+they are replayed in real time, with --speed 10 ten times as fast.
+Rotated logs are replayed as well, oldest first.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List
+
+
+server_dir = Path(__file__).parents[1] / "server"
+template_dir = Path(__file__).parents[1] / "templates"
+
+sys.path.insert(0, str(server_dir))
+
+import store_data
+from request_log import RequestLog, is_sanitized, replay
+
+
+def print_durations(durations: List[float]):
+    cut_points = (
+        statistics.quantiles(durations, n=100, method="inclusive")
+        if len(durations) > 1
+        else durations * 99)
+    print(
+        f"latency: mean {statistics.fmean(durations) * 1000:.2f} ms  "
+        f"p50 {cut_points[49] * 1000:.2f} ms  p95 {cut_points[94] * 1000:.2f} ms  "
+        f"p99 {cut_points[98] * 1000:.2f} ms")
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    argument_parser.add_argument(
+        "log", type=Path,
+        help="path of the request log, the value of "
+             "de.inm7.sfb1451.entry.request_log")
+    argument_parser.add_argument("--dataset", type=Path, required=True)
+    argument_parser.add_argument(
+        "--throwaway", action="store_true",
+        help="the dataset is discarded after the replay, required for "
+             "sanitized log entries, whose records are made up")
+    argument_parser.add_argument(
+        "--home", type=Path, default=Path(os.environ.get("HOME", "/")),
+        help="HOME-directory for datalad and git (default: %(default)s)")
+    argument_parser.add_argument(
+        "--templates", type=Path, default=template_dir,
+        help="template directory (default: %(default)s)")
+    argument_parser.add_argument(
+        "--speed", type=float, default=0.0,
+        help="replay speed relative to the logged times, 0 replays as fast "
+             "as possible (default: %(default)s)")
+    argument_parser.add_argument(
+        "--concurrency", type=int, default=1,
+        help="number of concurrent requests (default: %(default)s)")
+    argument_parser.add_argument(
+        "--set", dest="settings", action="append", default=[], metavar="NAME=VALUE",
+        help="additional configuration, e.g. batch_size=8, sets "
+             "de.inm7.sfb1451.entry.NAME to VALUE")
+    arguments = argument_parser.parse_args()
+
+    configuration = {
+        store_data.DATASET_ROOT_KEY: str(arguments.dataset.absolute()),
+        store_data.HOME_KEY: str(arguments.home.absolute()),
+        store_data.TEMPLATE_DIRECTORY_KEY: str(arguments.templates.absolute()),
+    }
+    for setting in arguments.settings:
+        name, separator, value = setting.partition("=")
+        if not separator:
+            argument_parser.error(f"setting is not of the form NAME=VALUE: {setting}")
+        configuration[f"de.inm7.sfb1451.entry.{name}"] = value
+
+    entries = list(RequestLog(arguments.log).chronological_entries())
+    sanitized_count = sum(map(is_sanitized, entries))
+    if sanitized_count and not arguments.throwaway:
+        argument_parser.error(
+            f"{sanitized_count} submission(s) were logged without signatures and "
+            f"remarks, replay them only into a throwaway dataset (--throwaway)")
+
+    start = time.perf_counter()
+    results = replay(
+        entries,
+        store_data.application,
+        configuration,
+        arguments.speed,
+        arguments.concurrency)
+    duration = time.perf_counter() - start
+    store_data.stop_background_workers()
+
+    if not results:
+        print(f"no submissions in {arguments.log}")
+        return
+
+    print(f"{len(results)} submissions replayed in {duration:.2f} s, {len(results) / duration:.1f} per second")
+    print(f"statuses: {dict(Counter(status for status, _, _ in results))}")
+    print_durations([request_duration for _, _, request_duration in results])
+    for index, (status, content, _) in enumerate(results):
+        if not status.startswith("200"):
+            print(f"submission {index}: {status}: {content.decode(errors='replace').strip()}")
+
+
+if __name__ == "__main__":
+    main()
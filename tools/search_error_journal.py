@@ -0,0 +1,68 @@
+"""Show errors from the error journal of the data-entry server
+
+The server writes the details of every unexpected error to the error
+journal (de.inm7.sfb1451.entry.error_journal), and returns only an error
+ID to the client. This tool shows the entry with a given error ID, or
+lists the most recent errors if no ID is given. Rotated journals are
+searched as well.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+
+server_dir = Path(__file__).parents[1] / "server"
+
+sys.path.insert(0, str(server_dir))
+
+from error_journal import ErrorJournal
+
+
+def format_time(time_stamp: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time_stamp))
+
+
+def print_entry(entry: dict):
+    print(f"error ID: {entry['id']}")
+    print(f"time: {format_time(entry['time'])}")
+    print(f"locale encoding: {entry.get('locale_encoding')}")
+    print("exception:")
+    print(entry["exception"])
+    print("environ:")
+    print(json.dumps(entry["environ"], indent=2, sort_keys=True))
+    print("received fields:")
+    print(json.dumps(entry["fields"], indent=2))
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description=__doc__)
+    argument_parser.add_argument(
+        "journal", type=Path,
+        help="path of the error journal, the value of "
+             "de.inm7.sfb1451.entry.error_journal")
+    argument_parser.add_argument("error_id", nargs="?", help="error ID that was shown to the user")
+    argument_parser.add_argument(
+        "--last", type=int, default=20,
+        help="number of errors that are listed, if no error ID is given "
+             "(default: %(default)s)")
+    arguments = argument_parser.parse_args()
+
+    journal = ErrorJournal(arguments.journal)
+    if arguments.error_id is not None:
+        entry = journal.find(arguments.error_id)
+        if entry is None:
+            print(f"error ID {arguments.error_id} not found in {arguments.journal}", file=sys.stderr)
+            sys.exit(1)
+        print_entry(entry)
+        return
+
+    entries = sorted(journal.entries(), key=lambda entry: entry["time"])
+    for entry in entries[-arguments.last:]:
+        last_line = entry["exception"].strip().splitlines()[-1]
+        print(f"{entry['id']}  {format_time(entry['time'])}  {last_line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Push records that were stored in offline mode to the entrystore sibling
+
+In offline mode (de.inm7.sfb1451.entry.push_journal is set), the server
+only commits records locally and appends every commit to a journal. This
+tool pushes all journaled commits to entrystore in a single push and
+removes them from the journal. The commits are pushed unchanged, i.e.
+records keep their time stamps, names, and hash values.
+
+Commits that the background push scheduler could not push before the
+server stopped are listed in the journal
+<dataset>/.git/sfb1451-entry-unpushed-commits, which is pushed in the
+same way.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+
+server_dir = Path(__file__).parents[1] / "server"
+
+sys.path.insert(0, str(server_dir))
+
+from push_journal import PushJournal
+from storage_backend import get_storage_backend, storage_backends
+
+
+def is_ancestor(dataset_root: Path, commit_hash: str) -> bool:
+    return subprocess.run(
+        ["git", "-C", str(dataset_root), "merge-base", "--is-ancestor", commit_hash, "HEAD"],
+        stderr=subprocess.DEVNULL).returncode == 0
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description=__doc__)
+    argument_parser.add_argument("dataset", type=Path)
+    argument_parser.add_argument("journal", type=Path, help="path of the push journal")
+    argument_parser.add_argument(
+        "--home", type=Path, default=Path(os.environ.get("HOME", "/")),
+        help="HOME-directory for datalad and git (default: %(default)s)")
+    argument_parser.add_argument(
+        "--backend", choices=sorted(storage_backends), default="subprocess",
+        help="storage backend (default: %(default)s)")
+    argument_parser.add_argument(
+        "--dry-run", action="store_true",
+        help="only show which commits would be pushed")
+    arguments = argument_parser.parse_args()
+
+    dataset_root = arguments.dataset.absolute()
+    journal = PushJournal(arguments.journal)
+    entries = journal.entries()
+    if not entries:
+        print("no pending commits")
+        return
+
+    record_count = sum(len(entry["files"]) for entry in entries)
+    first_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entries[0]["time"]))
+    print(f"{len(entries)} pending commit(s) with {record_count} file(s), oldest from {first_time}")
+
+    print("[1/3] checking commits")
+    missing = [entry["commit"] for entry in entries if not is_ancestor(dataset_root, entry["commit"])]
+    if missing:
+        print(
+            f"error: {len(missing)} journaled commit(s) are not contained in HEAD "
+            f"of {dataset_root}:\n  " + "\n  ".join(missing),
+            file=sys.stderr)
+        sys.exit(1)
+    if arguments.dry_run:
+        for entry in entries:
+            print(f"  {entry['commit']}  {' '.join(entry['files'])}")
+        return
+
+    print(f"[2/3] pushing {len(entries)} commit(s) to entrystore")
+    start = time.monotonic()
+    get_storage_backend(arguments.backend).push(dataset_root, arguments.home)
+    print(f"      pushed in {time.monotonic() - start:.1f} s")
+
+    print("[3/3] updating journal")
+    journal.remove(len(entries))
+    remaining = len(journal.entries())
+    print(f"done, {remaining} commit(s) were added while pushing and are still pending")
+
+
+if __name__ == "__main__":
+    main()